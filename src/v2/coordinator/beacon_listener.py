@@ -0,0 +1,102 @@
+"""
+Raspberry Pi coordinator
+
+listener of the beacons of the workers (UDP multicast or broadcast, see beacon.py of the worker)
+
+The listener runs in a QThread and sends every valid beacon to the GUI with a signal.
+A beacon is valid if it is signed with the security key of the coordinator (or if the unsigned beacons are accepted)
+and if it was sent from the IP address it contains.
+"""
+
+from PyQt5.QtCore import pyqtSignal, QObject
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import socket
+import struct
+import logging
+
+# maximum size of a beacon
+MAX_DATAGRAM_SIZE = 2048
+# the stop of the listener is checked every RECEIVE_TIMEOUT seconds
+RECEIVE_TIMEOUT = 1
+
+
+def signature(payload: dict, secret: str) -> str:
+    """
+    return the signature of the payload (without sig)
+    """
+    message = json.dumps({key: payload[key] for key in payload if key != "sig"}, separators=(",", ":"), sort_keys=True)
+    return hmac.new(secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class Beacon_listener(QObject):
+    def __init__(self, address: str, port: int, security_key: str, accept_unsigned: bool):
+        """
+        address: multicast group or broadcast address of the beacons
+        accept_unsigned: accept the beacons of the workers without security key
+        """
+        super().__init__()
+        self.address = address
+        self.port = port
+        self.secret = hashlib.sha256(security_key.encode("utf-8")).hexdigest()
+        self.accept_unsigned = accept_unsigned
+        self.stopped = False
+
+    start = pyqtSignal()
+    # raspberry id, IP address, beacon content
+    received = pyqtSignal(str, str, dict)
+
+    def stop(self):
+        self.stopped = True
+
+    def open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", self.port))
+        if ipaddress.IPv4Address(self.address).is_multicast:
+            sock.setsockopt(
+                socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack("4s4s", socket.inet_aton(self.address), socket.inet_aton("0.0.0.0"))
+            )
+        sock.settimeout(RECEIVE_TIMEOUT)
+        return sock
+
+    def parse(self, datagram: bytes, sender: str):
+        """
+        return the content of the beacon (None if not valid)
+        """
+        try:
+            payload = json.loads(datagram.decode("utf-8"))
+        except ValueError:
+            return None
+        if not isinstance(payload, dict) or not payload.get("host", "") or payload.get("ip", "") != sender:
+            return None
+        if "sig" in payload:
+            if not hmac.compare_digest(str(payload["sig"]), signature(payload, self.secret)):
+                logging.debug(f"Beacon of {sender} not signed with the security key")
+                return None
+        elif not self.accept_unsigned:
+            return None
+        return payload
+
+    def run(self):
+        try:
+            sock = self.open_socket()
+        except OSError:
+            logging.exception(f"Beacons not received (port {self.port})")
+            return
+        logging.info(f"Listening to the beacons on {self.address}:{self.port}")
+        with sock:
+            while not self.stopped:
+                try:
+                    datagram, (sender, _) = sock.recvfrom(MAX_DATAGRAM_SIZE)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    logging.exception("Error receiving the beacons")
+                    return
+                payload = self.parse(datagram, sender)
+                if payload is not None:
+                    self.received.emit(payload["host"], sender, payload)
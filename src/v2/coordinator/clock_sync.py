@@ -0,0 +1,61 @@
+"""
+Raspberry Pi coordinator
+
+measure of the clock offset of the workers (NTP four timestamps)
+
+    t1: request sent by the coordinator, t2: request received by the worker,
+    t3: response sent by the worker, t4: response received by the coordinator
+
+    offset = ((t2 - t1) + (t3 - t4)) / 2    (worker clock - coordinator clock)
+    rtt = (t4 - t1) - (t3 - t2)             (round-trip time of the network)
+
+The samples are sent on the same connection (no TCP handshake in the measure) and the sample
+with the lowest round-trip time is kept (the less delayed by the network, NTP clock filter).
+The error of the offset is at most rtt / 2.
+"""
+
+import statistics
+import time
+import logging
+import requests
+
+
+def sample(session: requests.Session, url: str, security_key: str, time_out) -> dict:
+    """
+    return one sample of the clock offset (offset and rtt in seconds)
+    """
+    t1 = time.time()
+    response = session.post(f"{url}/time_exchange", data={"key": security_key, "t1": repr(t1)}, timeout=time_out, verify=False)
+    t4 = time.time()
+    response.raise_for_status()
+    t2, t3 = response.json()["t2"], response.json()["t3"]
+    return {"offset": ((t2 - t1) + (t3 - t4)) / 2, "rtt": (t4 - t1) - (t3 - t2)}
+
+
+def measure_offset(url: str, security_key: str, samples: int, time_out=None):
+    """
+    return the clock offset of the worker with the lowest round-trip time of the samples
+    (offset, rtt and jitter of the offsets in seconds), None if the worker has no /time_exchange route or no sample
+    """
+    results = []
+    with requests.Session() as session:
+        for _ in range(samples + 1):
+            try:
+                results.append(sample(session, url, security_key, time_out))
+            except requests.exceptions.HTTPError:
+                logging.info(f"{url}: no /time_exchange route")
+                return None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                logging.warning(f"{url}: clock sample lost")
+    # the first sample includes the opening of the connection
+    results = results[1:]
+    if not results:
+        return None
+
+    best = min(results, key=lambda x: x["rtt"])
+    return {
+        "offset": best["offset"],
+        "rtt": best["rtt"],
+        "samples": len(results),
+        "jitter": statistics.pstdev(x["offset"] for x in results),
+    }
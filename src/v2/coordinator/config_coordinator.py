@@ -1,11 +1,20 @@
 # configuration file for coordinator.py
 
 TIME_OUT = 10
+# maximum wait for the end of the threads (events and beacon listeners, network scan) when the coordinator is closed
+THREADS_STOP_TIMEOUT = TIME_OUT + 1
 SERVER_PORT = ":5000"
 DEBUG = True
 PROTOCOL = "http://"
 
-IP_RANGES = (("192.168.1.1", [1, 254]),)
+# networks scanned for the Raspberry Pi: CIDR (up to /16) or ranges ("192.168.1.1", [1, 254])
+IP_RANGES = ("192.168.1.0/24",)
+# at most SCAN_CONCURRENCY addresses are probed at the same time (TCP connection with a timeout of SCAN_CONNECT_TIMEOUT seconds)
+SCAN_CONCURRENCY = 256
+SCAN_CONNECT_TIMEOUT = 1
+# the Raspberry Pi found are saved (hostname, last IP address, MAC address, version, last seen) and their address is probed
+# first at the next scans. A Raspberry Pi not seen during NODE_REGISTRY_MAX_AGE days is removed from the registry
+NODE_REGISTRY_MAX_AGE = 30
 
 
 # path for receiving video from raspberries
@@ -13,6 +22,55 @@ VIDEO_ARCHIVE = "/tmp"
 
 REFRESH_INTERVAL = 60  # seconds -> 10 min
 
+# events of the Raspberry Pi (Server-Sent Events)
+# the status of the Raspberry Pi sending their events is only requested every EVENTS_POLLING_INTERVAL seconds
+EVENTS_POLLING_INTERVAL = 600
+# keepalive interval requested to the worker events stream (the connection is considered lost after 2 intervals)
+# the listeners check if they are stopped between the lines received: must be shorter than THREADS_STOP_TIMEOUT
+EVENTS_KEEPALIVE = 5
+EVENTS_MAX_RECONNECTION_DELAY = 60
+# status keys of the running jobs
+JOB_STATUS_KEYS = {"video": "video_recording", "time_lapse": "time_lapse_active", "streaming": "video_streaming_active"}
+
+# beacons of the workers (UDP multicast or broadcast, same address and port as in the config of the workers)
+# the Raspberry Pi sending beacons are added to the list and their status is updated without request (see beacon_listener.py)
+# a Raspberry Pi is not reachable after BEACON_TIMEOUT seconds without beacon. "" for no listener
+BEACON_ADDRESS = "239.255.42.42"
+BEACON_PORT = 5042
+BEACON_TIMEOUT = 15
+# accept the beacons of the workers without security key (not signed)
+BEACON_ACCEPT_UNSIGNED = False
+
+# number of files by request for the lists of archive files
+LIST_PAGE_SIZE = 1000
+
+# maximum number of pictures by tar stream during the downloads
+BUNDLE_MAX_FILES = 2000
+
+# synchronized video recordings: the start time is SYNCHRONIZED_START_MARGIN seconds after the request
+# (time to start the paused camera on all the Raspberry Pi, between 2 and 60 s)
+SYNCHRONIZED_START_MARGIN = 5
+
+# clock of the Raspberry Pi: the offset is measured with CLOCK_SAMPLES exchanges of timestamps (see clock_sync.py)
+# and the clock is corrected only if the offset is larger than CLOCK_SLEW_THRESHOLD seconds
+# (the measure is not used for a correction if its round-trip time is larger than CLOCK_MAX_RTT seconds)
+CLOCK_SAMPLES = 8
+CLOCK_SLEW_THRESHOLD = 0.002
+CLOCK_MAX_RTT = 0.1
+
+# algorithm of the checksums of the downloaded files sent to the workers (the workers delete only the acknowledged files)
+CHECKSUM_ALGORITHM = "md5"
+# file transfers: connection timeout TIME_OUT, a stalled download is interrupted (and resumed later) after DOWNLOAD_READ_TIMEOUT seconds without data
+DOWNLOAD_READ_TIMEOUT = 60
+# the worker may read the files without stored checksum before answering an acknowledgement
+ACKNOWLEDGE_TIMEOUT = 600
+
+# single pictures (/snapshot): the picture is sent in the response and displayed from memory
+# the picture is captured at the size of the display (scaled by the camera of the Raspberry Pi)
+SNAPSHOT_DOWNSCALE = True
+# keep a copy of the pictures in the live pictures archive of the Raspberry Pi
+SNAPSHOT_ARCHIVE = False
+
 # seconds between 2 pictures in time lapse mode
 DEFAULT_INTERVAL = 20
 
@@ -41,6 +99,9 @@ MAX_VIDEO_FPS = 30
 DEFAULT_FPS = 10
 
 DEFAULT_VIDEO_DURATION = 2400  # seconds
+# 0: one file by recording. Set VIDEO_SEGMENT_DURATION (seconds, e.g. 300) to split the recordings started from the coordinator
+# in segments with a manifest (the closed segments can be downloaded during the recording)
+VIDEO_SEGMENT_DURATION = 0
 VIDEO_BRIGHTNESS = 0
 VIDEO_SATURATION = 1
 VIDEO_CONTRAST = 1
@@ -3,10 +3,6 @@ Raspberry Pi coordinator (via TCP/IP)
 
 https://www.raspberrypi.com/documentation/accessories/camera.html#common-command-line-options
 
-TODO:
-
-* scan network with QThread
-
 """
 
 __version__ = "21"
@@ -23,7 +19,7 @@ from PyQt5.QtWidgets import (
     QListWidgetItem,
 )
 from PyQt5.QtGui import QIcon, QFont
-from PyQt5.QtCore import QTimer, Qt, QUrl, QSettings
+from PyQt5.QtCore import QTimer, Qt, QUrl, QSettings, QThread, pyqtSignal
 from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
 from PyQt5.QtMultimediaWidgets import (
     QVideoWidget,
@@ -59,6 +55,10 @@ import video_recording
 import time_lapse
 import output_window
 import connections
+import event_listener
+import clock_sync
+import network_scanner
+import beacon_listener
 
 from coordinator_ui import Ui_MainWindow
 
@@ -201,10 +201,33 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
     raspberry_info = {}
     raspberry_saved_settings = {}
 
+    # network scan requested from a thread
+    scan_requested = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__()
 
         self.current_raspberry_id = ""
+        # Raspberry Pi and sensor modes of the resolutions shown in the comboboxes (rebuilt only when they change)
+        self.camera_modes_shown = None
+
+        # network scan running in a QThread: (QThread, Network_scanner) and Raspberry Pi found by the scan
+        self.scanner = None
+        self.scan_found = set()
+
+        # arming of a synchronized video recording running in a QThread: (QThread, Synchronized_start_worker)
+        self.synchronized_start = None
+
+        # lists of the archive files of the Raspberry Pi (for incremental listings)
+        self.remote_lists = {}
+
+        # listeners of the events of the Raspberry Pi: raspberry id -> (QThread, Event_listener)
+        self.event_listeners = {}
+        # time of the last status request of the Raspberry Pi (the status is polled rarely if the events are received)
+        self.last_status_poll = {}
+        # listener of the beacons of the workers: (QThread, Beacon_listener) and time of the last beacon of the Raspberry Pi
+        self.beacon_listener = None
+        self.last_beacon = {}
 
         # super(MainWindow, self).__init__(parent)
         self.setupUi(self)
@@ -234,24 +257,31 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
                 if not ok:
                     sys.exit()
 
-        self.scan_network()
+        # the saved settings are applied to the Raspberry Pi found by the scan
+        self.raspberry_saved_settings = self.read_settings()
+        # known Raspberry Pi: hostname -> last IP address, MAC address, version and last seen (probed first by the scan)
+        self.node_registry = self.read_registry()
 
-        raspberry_saved_settings = self.read_settings()
+        self.scan_network()
 
-        for raspberry_ip in self.raspberry_info:
-            if raspberry_ip in raspberry_saved_settings:
-                self.raspberry_info[raspberry_ip] = dict(raspberry_saved_settings[raspberry_ip])
+        self.start_beacon_listener()
 
         self.status_timer = QTimer()
         self.status_timer.timeout.connect(self.get_status_for_all_rpi)
         self.status_timer.setInterval(cfg.REFRESH_INTERVAL * 1000)
         self.status_timer.start()
 
+        self.beacon_timer = QTimer()
+        self.beacon_timer.timeout.connect(self.check_beacons)
+        self.beacon_timer.setInterval(cfg.BEACON_TIMEOUT * 1000 // 3)
+        self.beacon_timer.start()
+
     def define_connections(self):
         """
         Define connections between widget and functions
         """
         self.pb_scan_network.clicked.connect(self.scan_network)
+        self.scan_requested.connect(self.scan_network)
         self.rpi_list.itemClicked.connect(self.rpi_list_clicked)
 
         # menu
@@ -340,11 +370,13 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
         for video_mode in cfg.VIDEO_MODES:
             self.video_mode_cb.addItem(video_mode)
         self.video_mode_cb.setCurrentIndex(cfg.DEFAULT_VIDEO_MODE)
+        self.video_mode_cb.currentIndexChanged.connect(self.video_mode_changed)
 
         # commands for all Raspberry Pi
-        self.get_status_all_pb.clicked.connect(self.get_status_for_all_rpi)
+        self.get_status_all_pb.clicked.connect(lambda: self.get_status_for_all_rpi(force=True))
         self.time_synchro_all_pb.clicked.connect(self.time_synchro_all)
         self.shutdown_all_pb.clicked.connect(self.shutdown_all_rpi)
+        self.synchronized_video_pb.clicked.connect(self.synchronized_video_recording_clicked)
 
     def convert_h264(self):
         """
@@ -403,6 +435,25 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
 
     def closeEvent(self, event):
         self.save_settings()
+        self.save_registry()
+
+        # the running QThreads must be finished before the window is destroyed
+        threads = list(self.event_listeners.values())
+        if self.beacon_listener is not None:
+            threads.append(self.beacon_listener)
+        if self.scanner is not None:
+            threads.append(self.scanner)
+            self.scanner = None
+        if self.synchronized_start is not None:
+            threads.append(self.synchronized_start)
+            self.synchronized_start = None
+        for thread, worker in threads:
+            worker.stop()
+            thread.quit()
+        deadline = time.monotonic() + cfg.THREADS_STOP_TIMEOUT
+        for thread, worker in threads:
+            if not thread.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+                logging.warning(f"{type(worker).__name__} thread still running at exit")
 
     def read_settings(self):
         iniFilePath = pl.Path.home() / pl.Path(".rpi_coordinator.conf")
@@ -422,6 +473,28 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
 
         settings.setValue("rpi_config", self.raspberry_info)
 
+    def read_registry(self):
+        iniFilePath = pl.Path.home() / pl.Path(".rpi_coordinator.conf")
+
+        settings = QSettings(str(iniFilePath), QSettings.IniFormat)
+
+        return dict(settings.value("node_registry", {}))
+
+    def save_registry(self):
+        """
+        save the known Raspberry Pi (the Raspberry Pi not seen during NODE_REGISTRY_MAX_AGE days are removed)
+        """
+        iniFilePath = pl.Path.home() / pl.Path(".rpi_coordinator.conf")
+
+        oldest = (datetime.datetime.now() - datetime.timedelta(days=cfg.NODE_REGISTRY_MAX_AGE)).isoformat()
+        for raspberry_id in list(self.node_registry):
+            if self.node_registry[raspberry_id].get("last_seen", "") < oldest:
+                del self.node_registry[raspberry_id]
+
+        settings = QSettings(str(iniFilePath), QSettings.IniFormat)
+
+        settings.setValue("node_registry", self.node_registry)
+
     '''
     def create_all_buttons(self):
         """
@@ -483,10 +556,59 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
         except requests.exceptions.ConnectionError:
             self.rasp_output_lb.setText("Failed to establish a connection")
             # self.get_raspberry_status(raspberry_id)
-            self.scan_network()
+            self.scan_requested.emit()
             # self.update_raspberry_display(raspberry_id)
             return None
 
+    def get_remote_list(self, raspberry_id: str, route: str, list_key: str, description: str):
+        """
+        return the sorted list of (name, size) of the files of an archive of the Raspberry Pi
+
+        The list is kept between calls: only the changes since the last cursor are requested (by pages).
+        The whole list is requested again if the catalog of the Raspberry Pi was recreated.
+        """
+
+        cache = self.remote_lists.setdefault((raspberry_id, route), {"catalog_id": "", "cursor": None, "files": {}})
+
+        while True:
+            data = {"limit": cfg.LIST_PAGE_SIZE}
+            if cache["cursor"] is not None:
+                data["since"] = cache["cursor"]
+
+            response = self.request(raspberry_id, route, type="POST", data=data)
+            if response is None:
+                return None
+
+            if response.status_code != HTTPStatus.OK:
+                self.rasp_output_lb.setText(f"Error requiring the list of {description} (status code: {response.status_code})")
+                return None
+            if list_key not in response.json():
+                self.rasp_output_lb.setText(f"Error requiring the list of {description}")
+                return None
+
+            result = response.json()
+
+            # worker without catalog: whole list
+            if "cursor" not in result:
+                return sorted(result[list_key])
+
+            if result["catalog_id"] != cache["catalog_id"]:
+                if cache["cursor"] is not None:
+                    cache.update({"catalog_id": result["catalog_id"], "cursor": None, "files": {}})
+                    continue
+                cache["catalog_id"] = result["catalog_id"]
+
+            for file_name in result["deleted"]:
+                cache["files"].pop(file_name, None)
+            for file_name, file_size in result[list_key]:
+                cache["files"][file_name] = file_size
+            cache["cursor"] = result["cursor"]
+
+            if not result["more"]:
+                break
+
+        return sorted(cache["files"].items())
+
     def verif(func):
         """
         check if a Raspberry Pi is selected
@@ -892,7 +1014,7 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
             self.rpi_list.addItem(item)
             # if one Raspberry Pi found select it
             raspberry_info_updated[raspberry_id] = dict(cfg.RPI_DEFAULTS)
-            if len(self.raspberry_ip) == 1:
+            if len(self.raspberry_ip) == 1 or raspberry_id == self.current_raspberry_id:
                 self.rpi_list.setCurrentItem(item)
 
                 # self.rpi_list_clicked(item)
@@ -911,78 +1033,168 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
             if id not in self.raspberry_info:
                 self.raspberry_info[id] = dict(cfg.RPI_DEFAULTS)
 
-    def connect(self, ip_address):
+    def scan_network(self):
         """
-        ask status to raspberry pi using protocol and port number
+        scan all networks defined in IP_RANGES in a QThread
+        the last addresses of the known Raspberry Pi are probed first
+        the Raspberry Pi are added to the list as soon as they answer (see node_found and scan_finished)
         """
-        try:
-            response = requests.get(
-                f"{cfg.PROTOCOL}{ip_address}{cfg.SERVER_PORT}/status",
-                data={"key": self.security_key},
-                timeout=cfg.TIME_OUT,
-                verify=False,
-            )
-        except requests.exceptions.ConnectionError:
-            logging.debug(f"{ip_address}: failed to establish a connection")
-            return
-
-        if response.status_code != HTTPStatus.OK:
-            logging.debug(f"{ip_address}: server status code != 200: {response.status_code}")
+        if self.scanner is not None:
             return
 
-        logging.info(f"{ip_address}: server available")
-
-        # check hostname
-        raspberry_id = response.json().get("hostname", "")
-        if not raspberry_id:
-            logging.info(f"{ip_address}: hostname not found")
-            return
-
-        self.raspberry_ip[raspberry_id] = ip_address
-
-        # set raspberry time date
-        self.time_synchro(raspberry_id)
+        self.message_box.setText("Scanning network...")
+        self.scan_found = set()
+
+        thread = QThread(parent=self)
+        thread.start()
+        scanner = network_scanner.Network_scanner(
+            cfg.IP_RANGES,
+            cfg.PROTOCOL,
+            cfg.SERVER_PORT,
+            self.security_key,
+            cfg.SCAN_CONCURRENCY,
+            cfg.SCAN_CONNECT_TIMEOUT,
+            cfg.TIME_OUT,
+            known_addresses=[x["IP_address"] for x in self.node_registry.values() if x.get("IP_address", "")],
+        )
+        scanner.moveToThread(thread)
+        scanner.start.connect(scanner.run)
+        scanner.found.connect(self.node_found)
+        scanner.finished.connect(self.scan_finished)
+        scanner.start.emit()
+        self.scanner = (thread, scanner)
 
-    def scan_raspberries(self, ip_base_address, interval):
+    def node_found(self, raspberry_id: str, ip_address: str, status: dict):
         """
-        Scan network {ip_base_address} for Raspberry Pi device
+        add a Raspberry Pi found by the scan
         """
+        self.scan_found.add(raspberry_id)
+        self.raspberry_ip[raspberry_id] = ip_address
+        if raspberry_id not in self.raspberry_info:
+            self.raspberry_info[raspberry_id] = dict(self.raspberry_saved_settings.get(raspberry_id, cfg.RPI_DEFAULTS))
+        self.raspberry_info[raspberry_id]["status"] = status
+        self.last_status_poll[raspberry_id] = time.time()
+        self.node_registry[raspberry_id] = {
+            "IP_address": ip_address,
+            "MAC_addr": status.get("MAC_addr", self.node_registry.get(raspberry_id, {}).get("MAC_addr", "")),
+            "server_version": status.get("server_version", ""),
+            "last_seen": datetime.datetime.now().replace(microsecond=0).isoformat(),
+        }
+
+        if not self.rpi_list.findItems(raspberry_id, Qt.MatchExactly):
+            self.rpi_list.addItem(QListWidgetItem(raspberry_id))
+            self.rpi_list.sortItems()
+        self.update_raspberry_display(raspberry_id)
+        self.message_box.setText(f"Scanning network... {len(self.scan_found)} Raspberry Pi found")
 
-        ip_mask = ".".join(ip_base_address.split(".")[0:3])
-        ip_list = [f"{ip_mask}.{x}" for x in range(interval[0], interval[1] + 1)]
-        self.raspberry_ip = {}
-        threads = []
-        logging.info(f"Testing {ip_base_address} subnet")
-        for ip in ip_list:
-            threads.append(threading.Thread(target=self.connect, args=(ip,)))
-            threads[-1].start()
-        for x in threads:
-            x.join()
-        logging.info(f"testing subnet done: found {len(self.raspberry_ip)} clients: {self.raspberry_ip}")
+        self.update_event_listeners()
 
-        return 0
+        # set raspberry time date
+        threading.Thread(target=self.time_synchro, args=(raspberry_id,), daemon=True).start()
 
-    def scan_network(self):
+    def scan_finished(self, found: int, scanned: int):
         """
-        scan all networks defined in IP_RANGES
+        remove the Raspberry Pi that did not answer to the scan
         populate the raspberry pi list
         ask status
         """
-        self.message_box.setText("Scanning network...")
-        app.processEvents()
+        # scan stopped (coordinator closed)
+        if self.scanner is None:
+            return
+        thread, _ = self.scanner
+        thread.quit()
+        thread.wait()
+        self.scanner = None
+
+        # the Raspberry Pi sending beacons are kept
+        for raspberry_id in list(self.raspberry_ip):
+            if raspberry_id not in self.scan_found and not self.beacon_active(raspberry_id):
+                del self.raspberry_ip[raspberry_id]
+
+        if found:
+            self.message_box.setText(f"Scanning done: {found} Raspberry Pi found ({scanned} addresses)")
+        else:
+            self.message_box.setText(f"Scanning done. No Raspberry Pi found ({scanned} addresses)")
 
-        for ip_config in cfg.IP_RANGES:
-            ip_base_address, interval = ip_config[0], ip_config[1]
-            self.scan_raspberries(ip_base_address, interval)
+        self.populate_rpi_list()
 
-            if len(self.raspberry_ip):
-                self.message_box.setText(f"Scanning done: {len(self.raspberry_ip)} Raspberry Pi found on {ip_config[0]}")
-            else:
-                self.message_box.setText(f"Scanning done. No Raspberry Pi found were found on {ip_config[0]}")
+        self.save_registry()
 
-        self.populate_rpi_list()
+        # the status of the Raspberry Pi found by the scan was just received and the others send their beacons: no request
+        for raspberry_id in self.raspberry_ip:
+            self.update_raspberry_display(raspberry_id)
+        if self.current_raspberry_id in self.raspberry_ip:
+            self.update_raspberry_dashboard(self.current_raspberry_id)
+
+        self.update_event_listeners()
+
+    def start_beacon_listener(self):
+        """
+        start the listener of the beacons of the workers in a QThread
+        """
+        if not cfg.BEACON_ADDRESS:
+            return
+        thread = QThread(parent=self)
+        thread.start()
+        listener = beacon_listener.Beacon_listener(cfg.BEACON_ADDRESS, cfg.BEACON_PORT, self.security_key, cfg.BEACON_ACCEPT_UNSIGNED)
+        listener.moveToThread(thread)
+        listener.start.connect(listener.run)
+        listener.received.connect(self.beacon_received)
+        listener.start.emit()
+        self.beacon_listener = (thread, listener)
+
+    def beacon_active(self, raspberry_id: str) -> bool:
+        """
+        return True if a beacon of the Raspberry Pi was received during the last BEACON_TIMEOUT seconds
+        """
+        return time.time() - self.last_beacon.get(raspberry_id, 0) < cfg.BEACON_TIMEOUT
+
+    def beacon_received(self, raspberry_id: str, ip_address: str, beacon: dict):
+        """
+        add the Raspberry Pi sending a beacon or update its coarse status (the full status is requested when it is selected)
+        """
+        self.last_beacon[raspberry_id] = time.time()
+
+        status = {
+            "status": "OK",
+            "hostname": raspberry_id,
+            "IP_address": ip_address,
+            "server_version": beacon.get("version", ""),
+            "CPU temperature": beacon.get("temp", ""),
+            "free disk space": beacon.get("free", ""),
+        }
+        for kind in cfg.JOB_STATUS_KEYS:
+            status[cfg.JOB_STATUS_KEYS[kind]] = kind in beacon.get("jobs", [])
+
+        if self.raspberry_ip.get(raspberry_id, "") != ip_address:
+            logging.info(f"{raspberry_id} found at {ip_address} by its beacon")
+            # the events listener of the previous address is stopped
+            if raspberry_id in self.event_listeners:
+                thread, listener = self.event_listeners.pop(raspberry_id)
+                listener.stop()
+                thread.quit()
+            self.node_found(raspberry_id, ip_address, status)
+            return
+
+        self.raspberry_info[raspberry_id].setdefault("status", {}).update(status)
+        self.update_raspberry_display(raspberry_id)
+        if raspberry_id == self.current_raspberry_id:
+            self.update_raspberry_dashboard(raspberry_id)
 
-        self.get_status_for_all_rpi()
+    def check_beacons(self):
+        """
+        mark as not reachable the Raspberry Pi whose beacons stopped
+        """
+        for raspberry_id in list(self.last_beacon):
+            if self.beacon_active(raspberry_id):
+                continue
+            del self.last_beacon[raspberry_id]
+            if raspberry_id in self.raspberry_info:
+                logging.info(f"{raspberry_id}: no beacon since {cfg.BEACON_TIMEOUT} s")
+                self.raspberry_info[raspberry_id].setdefault("status", {})["status"] = "not reachable (no beacon)"
+                self.update_raspberry_display(raspberry_id)
+                if raspberry_id == self.current_raspberry_id:
+                    self.update_raspberry_dashboard(raspberry_id)
 
     def show_ip_list(self):
         """
@@ -1050,8 +1262,67 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
         else:
             self.rpi_tw.setTabIcon(cfg.TIME_LAPSE_TAB_INDEX, QIcon())
 
+        self.update_camera_modes(raspberry_id)
+
         connections.update_rpi_settings(self, raspberry_id)
 
+    def update_camera_modes(self, raspberry_id):
+        """
+        offer only the resolutions supported by the camera sensor of the Raspberry Pi
+        (the sensor modes are sent by the worker in the status)
+        """
+
+        cameras = self.raspberry_info[raspberry_id]["status"].get("cameras", [])
+        modes = cameras[0]["modes"] if cameras else []
+
+        # the dashboard is updated on every event and status: the comboboxes are kept if nothing changed
+        if self.camera_modes_shown == (raspberry_id, repr(modes)):
+            return
+        self.camera_modes_shown = (raspberry_id, repr(modes))
+
+        def supported(resolution: str) -> bool:
+            width, height = [int(x) for x in resolution.split("x")]
+            return any(mode["width"] >= width and mode["height"] >= height for mode in modes)
+
+        for combobox, resolutions, key in (
+            (self.video_mode_cb, cfg.VIDEO_MODES, "video mode"),
+            (self.picture_resolution_cb, cfg.PICTURE_RESOLUTIONS, "picture resolution"),
+        ):
+            # all resolutions are offered if the sensor modes are not known
+            available_resolutions = [x for x in resolutions if supported(x)] if modes else resolutions
+            if not available_resolutions:
+                available_resolutions = resolutions
+
+            combobox.blockSignals(True)
+            combobox.clear()
+            combobox.addItems(available_resolutions)
+            combobox.blockSignals(False)
+
+            if self.raspberry_info[raspberry_id][key] not in available_resolutions:
+                self.raspberry_info[raspberry_id][key] = available_resolutions[0]
+
+        self.video_mode_changed()
+
+    def video_mode_changed(self):
+        """
+        set the maximum FPS with the fastest sensor mode covering the selected video mode
+        """
+
+        if self.current_raspberry_id not in self.raspberry_info:
+            return
+
+        cameras = self.raspberry_info[self.current_raspberry_id].get("status", {}).get("cameras", [])
+        if not cameras or not self.video_mode_cb.currentText():
+            self.video_fps_sb.setMaximum(cfg.MAX_VIDEO_FPS)
+            return
+
+        width, height = [int(x) for x in self.video_mode_cb.currentText().split("x")]
+        max_fps = max(
+            [mode["max_fps"] for mode in cameras[0]["modes"] if mode["width"] >= width and mode["height"] >= height],
+            default=cfg.MAX_VIDEO_FPS,
+        )
+        self.video_fps_sb.setMaximum(min(int(max_fps), cfg.MAX_VIDEO_FPS))
+
     '''
     def send_command(self, rb):
         """
@@ -1157,29 +1428,74 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
 
     def time_synchro(self, raspberry_id):
         """
-        Set the date/time on Raspberry Pi
+        Measure the clock offset of the Raspberry Pi and correct its clock if needed
+        The workers without /time_exchange route are set to the date/time of the coordinator
+        return the message of the worker
         """
         if raspberry_id not in self.raspberry_ip:
-            return
+            return ""
 
-        date, hour = date_iso().split(" ")
-        response = self.request(raspberry_id, f"/sync_time/{date}/{hour}")
-        if response is None:
-            return
+        try:
+            measurement = clock_sync.measure_offset(
+                f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}", self.security_key, cfg.CLOCK_SAMPLES, cfg.TIME_OUT
+            )
+        except Exception:
+            logging.exception(f"{raspberry_id}: error measuring the clock offset")
+            measurement = None
 
+        if measurement is None:
+            date, hour = date_iso().split(" ")
+            response = self.request(raspberry_id, f"/sync_time/{date}/{hour}")
+            if response is None:
+                return ""
+
+            if response.status_code != HTTPStatus.OK:
+                self.rasp_output_lb.setText(f"Error during time synchronization (status code: {response.status_code})")
+                return ""
+            self.rasp_output_lb.setText(response.json().get("msg", "Error during time synchronization"))
+            return response.json().get("msg", "Error during time synchronization")
+
+        # the offset is recorded by the worker in the session manifests
+        correct = abs(measurement["offset"]) > cfg.CLOCK_SLEW_THRESHOLD and measurement["rtt"] <= cfg.CLOCK_MAX_RTT
+        response = self.request(raspberry_id, "/clock_offset", type="POST", data={**measurement, "correct": str(correct)})
+        if response is None:
+            return ""
         if response.status_code != HTTPStatus.OK:
             self.rasp_output_lb.setText(f"Error during time synchronization (status code: {response.status_code})")
-            return
-        self.rasp_output_lb.setText(response.json().get("msg", "Error during time synchronization"))
+            return ""
+        msg = response.json().get("msg", "Error during time synchronization")
+
+        # the offset after a step is measured again
+        correction = (response.json().get("clock_offset") or {}).get("correction")
+        if correction is not None and correction["method"] == "step":
+            measurement = clock_sync.measure_offset(
+                f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}", self.security_key, cfg.CLOCK_SAMPLES, cfg.TIME_OUT
+            )
+            if measurement is not None:
+                response = self.request(raspberry_id, "/clock_offset", type="POST", data={**measurement, "correct": "False"})
+                if response is not None and response.status_code == HTTPStatus.OK:
+                    msg += f". {response.json().get('msg', '')}"
+
+        logging.info(f"{raspberry_id}: {msg}")
+        self.rasp_output_lb.setText(msg)
+        return msg
 
     def time_synchro_all(self):
         """
-        Set the date/time on all Raspberry Pi
+        Measure and correct the clock of all Raspberry Pi
         """
 
+        raspberry_id_list = sorted(self.raspberry_ip.keys())
         pool = ThreadPool()
-        results = pool.map_async(self.time_synchro, list(self.raspberry_ip.keys()))
-        _ = results.get()
+        results = pool.map_async(self.time_synchro, raspberry_id_list)
+        output = results.get()
+
+        self.results = output_window.ResultsWidget()
+        self.results.setWindowTitle("Time synchronization")
+        self.results.ptText.clear()
+        self.results.ptText.setReadOnly(True)
+        self.results.ptText.appendHtml("<br>".join(f"<b>{x}</b>: {msg}" for x, msg in zip(raspberry_id_list, output)))
+        self.results.show()
 
     @verif
     def shutdown_clicked(self):
@@ -1277,6 +1593,8 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
         print(f"{self.raspberry_info = }")
 
         self.raspberry_info[raspberry_id]["status"] = response.json()
+        if raspberry_id in self.node_registry:
+            self.node_registry[raspberry_id]["last_seen"] = datetime.datetime.now().replace(microsecond=0).isoformat()
         return response.json()
 
     def status_update_pb_clicked(self):
@@ -1302,23 +1620,112 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
             if self.rpi_list.item(x).text() == raspberry_id:
                 self.rpi_list.item(x).setIcon(QIcon(f"{color}.png"))
 
-    def get_status_for_all_rpi(self):
+    def get_status_for_all_rpi(self, force: bool = False):
         """
-        get status for all Raspberries Pi
+        get status for all Raspberries Pi (force: all of them, "Get status" button)
+        The Raspberry Pi sending their beacons are not polled (their full status is requested when they are selected)
+        and the Raspberry Pi sending their events are only polled every EVENTS_POLLING_INTERVAL seconds
         """
 
+        raspberry_id_list = [
+            raspberry_id
+            for raspberry_id in self.raspberry_ip
+            if force
+            or (
+                not self.beacon_active(raspberry_id)
+                and (
+                    raspberry_id not in self.event_listeners
+                    or not self.event_listeners[raspberry_id][1].connected
+                    or time.time() - self.last_status_poll.get(raspberry_id, 0) >= cfg.EVENTS_POLLING_INTERVAL
+                )
+            )
+        ]
+
         threads = []
-        for raspberry_id in self.raspberry_ip:
+        for raspberry_id in raspberry_id_list:
+            self.last_status_poll[raspberry_id] = time.time()
             threads.append(threading.Thread(target=self.get_raspberry_status, args=(raspberry_id,)))
             threads[-1].start()
         for x in threads:
             x.join()
 
-        for raspberry_id in self.raspberry_ip:
+        for raspberry_id in raspberry_id_list:
             self.update_raspberry_display(raspberry_id)
             if self.current_raspberry_id == raspberry_id:
                 self.update_raspberry_dashboard(raspberry_id)
 
+    def update_event_listeners(self):
+        """
+        start a listener of the events for every Raspberry Pi found and stop the others
+        """
+        for raspberry_id in list(self.event_listeners):
+            if raspberry_id not in self.raspberry_ip:
+                thread, listener = self.event_listeners.pop(raspberry_id)
+                listener.stop()
+                thread.quit()
+
+        for raspberry_id in self.raspberry_ip:
+            if raspberry_id in self.event_listeners:
+                continue
+            thread = QThread(parent=self)
+            thread.start()
+            listener = event_listener.Event_listener(
+                raspberry_id, f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}/events", self.security_key
+            )
+            listener.moveToThread(thread)
+            listener.start.connect(listener.run)
+            listener.received.connect(self.worker_event)
+            listener.start.emit()
+            self.event_listeners[raspberry_id] = (thread, listener)
+
+    def worker_event(self, raspberry_id: str, event_type: str, data: dict):
+        """
+        update the status of the Raspberry Pi with an event received from the worker
+        """
+        if raspberry_id not in self.raspberry_info:
+            return
+
+        logging.debug(f"{raspberry_id} event: {event_type} {data}")
+
+        status = self.raspberry_info[raspberry_id].setdefault("status", {})
+        data = {key: data[key] for key in data if key != "timestamp"}
+
+        if event_type == "reset":
+            # events lost
+            self.get_raspberry_status(raspberry_id)
+
+        elif event_type == "status":
+            status.update(data)
+
+        elif event_type in ("job_started", "job_finished"):
+            kind = data.pop("kind", "")
+            active_jobs = status.setdefault("active_jobs", {})
+            if event_type == "job_started":
+                active_jobs[kind] = data
+            else:
+                active_jobs.pop(kind, None)
+            if kind in cfg.JOB_STATUS_KEYS:
+                status[cfg.JOB_STATUS_KEYS[kind]] = event_type == "job_started"
+
+        elif event_type == "alert":
+            alerts = status.setdefault("alerts", {})
+            if data.get("active", False):
+                alerts[data["metric"]] = data
+            else:
+                alerts.pop(data.get("metric", ""), None)
+            if raspberry_id == self.current_raspberry_id:
+                self.rasp_output_lb.setText(
+                    f"{data.get('metric', '')}: {data.get('value', '')} "
+                    f"({'alert' if data.get('active', False) else 'back to normal'}, threshold: {data.get('threshold', '')})"
+                )
+
+        elif event_type == "file_closed" and data.get("kind", "") == "video" and raspberry_id == self.current_raspberry_id:
+            self.rasp_output_lb.setText(f"Video {data.get('name', '')} recorded ({data.get('size', 0)} bytes)")
+
+        self.update_raspberry_display(raspberry_id)
+        if raspberry_id == self.current_raspberry_id:
+            self.update_raspberry_dashboard(raspberry_id)
+
     def enable_picture_parameters(self):
         self.lb_brightness.setEnabled(self.cb_enable_picture_parameters.isChecked())
         self.picture_brightness_sb.setEnabled(self.cb_enable_picture_parameters.isChecked())
@@ -1367,6 +1774,16 @@ class RPI_coordinator(QMainWindow, Ui_MainWindow):
 
         video_recording.start_video_recording(self, self.current_raspberry_id)
 
+    def synchronized_video_recording_clicked(self):
+        """
+        start video recording at the same time on the selected Raspberry Pi (all if none is selected)
+        """
+        raspberry_id_list = [x.text() for x in self.rpi_list.selectedItems() if x.text() in self.raspberry_ip] or sorted(self.raspberry_ip)
+        if not raspberry_id_list:
+            return
+
+        video_recording.start_synchronized_video_recording(self, raspberry_id_list)
+
     @verif
     def stop_video_recording_clicked(self):
         """
@@ -43,6 +43,9 @@ class Ui_MainWindow(object):
         self.shutdown_all_pb = QtWidgets.QPushButton(self.centralwidget)
         self.shutdown_all_pb.setObjectName("shutdown_all_pb")
         self.horizontalLayout_12.addWidget(self.shutdown_all_pb)
+        self.synchronized_video_pb = QtWidgets.QPushButton(self.centralwidget)
+        self.synchronized_video_pb.setObjectName("synchronized_video_pb")
+        self.horizontalLayout_12.addWidget(self.synchronized_video_pb)
         spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout_12.addItem(spacerItem)
         self.verticalLayout_2.addLayout(self.horizontalLayout_12)
@@ -73,6 +76,7 @@ class Ui_MainWindow(object):
         self.horizontalLayout.addWidget(self.pb_down)
         self.verticalLayout.addLayout(self.horizontalLayout)
         self.rpi_list = QtWidgets.QListWidget(self.layoutWidget)
+        self.rpi_list.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         self.rpi_list.setObjectName("rpi_list")
         self.verticalLayout.addWidget(self.rpi_list)
         self.message_box = QtWidgets.QLineEdit(self.layoutWidget)
@@ -897,6 +901,8 @@ class Ui_MainWindow(object):
         self.get_status_all_pb.setText(_translate("MainWindow", "Get status"))
         self.time_synchro_all_pb.setText(_translate("MainWindow", "Synchronize time"))
         self.shutdown_all_pb.setText(_translate("MainWindow", "Shutdown"))
+        self.synchronized_video_pb.setToolTip(_translate("MainWindow", "Start the video recording at the same time on the selected Raspberry Pi (all if none is selected)"))
+        self.synchronized_video_pb.setText(_translate("MainWindow", "Synchronized video"))
         self.pb_scan_network.setText(_translate("MainWindow", "Scan network"))
         self.pb_up.setText(_translate("MainWindow", "Up"))
         self.pb_down.setText(_translate("MainWindow", "Down"))
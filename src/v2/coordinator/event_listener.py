@@ -0,0 +1,122 @@
+"""
+Raspberry Pi coordinator
+
+listener of the events of the workers (Server-Sent Events of the /events route)
+
+One listener by Raspberry Pi runs in a QThread and sends the events to the GUI with a signal.
+The listener reconnects with the id of the last event received: the missed events are sent again by the worker.
+Workers without events stream are only polled (status_timer).
+"""
+
+from PyQt5.QtCore import pyqtSignal, QObject
+
+import json
+import threading
+from http import HTTPStatus
+import logging
+import requests
+
+import config_coordinator as cfg
+
+
+class Event_listener(QObject):
+    def __init__(self, raspberry_id: str, url: str, security_key: str):
+        super().__init__()
+        self.raspberry_id = raspberry_id
+        self.url = url
+        self.security_key = security_key
+        self.last_event_id = ""
+        self.connected = False
+        self.stopped = False
+        # set by stop (end of the reconnection delay)
+        self.wake_up = threading.Event()
+
+    start = pyqtSignal()
+    # raspberry id, event type, event data
+    received = pyqtSignal(str, str, dict)
+    # raspberry id, connected
+    connection_changed = pyqtSignal(str, bool)
+
+    def set_connected(self, connected: bool):
+        if connected != self.connected:
+            self.connected = connected
+            self.connection_changed.emit(self.raspberry_id, connected)
+
+    def stop(self):
+        """
+        stop the listener (at the next line received, at most EVENTS_KEEPALIVE seconds later)
+        """
+        self.stopped = True
+        self.wake_up.set()
+
+    def dispatch(self, event_type: str, data: str):
+        try:
+            self.received.emit(self.raspberry_id, event_type or "message", json.loads(data) if data else {})
+        except ValueError:
+            logging.warning(f"Invalid event from {self.raspberry_id}: {data}")
+
+    def listen(self) -> bool:
+        """
+        read the events until the connection is closed
+        return False if the worker does not provide the events stream
+        """
+        headers = {"Last-Event-ID": self.last_event_id} if self.last_event_id else {}
+        with requests.post(
+            self.url,
+            data={"key": self.security_key, "keepalive": cfg.EVENTS_KEEPALIVE},
+            headers=headers,
+            stream=True,
+            verify=False,
+            # the worker sends a comment every EVENTS_KEEPALIVE seconds
+            timeout=(cfg.TIME_OUT, cfg.EVENTS_KEEPALIVE * 2),
+        ) as response:
+            # all the threads of the worker for the long responses are used: reconnection later
+            if response.status_code == HTTPStatus.SERVICE_UNAVAILABLE:
+                raise requests.exceptions.ConnectionError(f"{self.raspberry_id}: events stream not available (server busy)")
+            if response.status_code != 200 or not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                logging.info(f"Events not available from {self.raspberry_id} (status code: {response.status_code})")
+                return False
+
+            logging.info(f"Listening to the events of {self.raspberry_id}")
+            self.set_connected(True)
+
+            event_type, data = "", []
+            for line in response.iter_lines(decode_unicode=True):
+                if self.stopped:
+                    break
+                if not line:
+                    if data:
+                        self.dispatch(event_type, "\n".join(data))
+                    event_type, data = "", []
+                    continue
+                if line.startswith(":"):
+                    # keepalive comment
+                    continue
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "event":
+                    event_type = value
+                elif field == "data":
+                    data.append(value)
+                elif field == "id":
+                    self.last_event_id = value
+        return True
+
+    def run(self):
+        delay = 1
+        while not self.stopped:
+            try:
+                if not self.listen():
+                    break
+                delay = 1
+            except Exception:
+                if not self.stopped:
+                    logging.debug(f"Events connection with {self.raspberry_id} lost")
+
+            self.set_connected(False)
+            if self.stopped:
+                break
+            self.wake_up.wait(delay)
+            delay = min(delay * 2, cfg.EVENTS_MAX_RECONNECTION_DELAY)
+
+        self.set_connected(False)
@@ -0,0 +1,199 @@
+"""
+Raspberry Pi coordinator
+
+file transfer module
+
+Files are downloaded in a .part file that is resumed (HTTP Range + If-Range)
+if the transfer is interrupted. The .part file is renamed when complete.
+
+Many small files (pictures) are downloaded in a single tar stream (see download_bundle).
+The checksums of the downloaded files are sent to the worker (see acknowledge):
+the worker deletes only the files acknowledged with the same checksum.
+"""
+
+import pathlib as pl
+import hashlib
+import tarfile
+import json
+import logging
+import requests
+import urllib3
+
+CHUNK_SIZE = 1024 * 1024
+
+# first member of the tar streams of the worker
+BUNDLE_MANIFEST_NAME = ".bundle_manifest.json"
+
+
+def part_paths(file_path: pl.Path) -> tuple:
+    """
+    return the path of the partial file and the path of the file containing its ETag
+    """
+    return file_path.with_name(file_path.name + ".part"), file_path.with_name(file_path.name + ".part.etag")
+
+
+def download_file(url: str, file_path, time_out=None) -> bool:
+    """
+    download url in file_path resuming from the .part file if any
+    return True if the file is complete
+    """
+
+    file_path = pl.Path(file_path)
+    part_path, etag_path = part_paths(file_path)
+
+    headers = {}
+    offset = 0
+    if part_path.is_file() and etag_path.is_file():
+        offset = part_path.stat().st_size
+        # the server sends the whole file (200) if the ETag changed
+        headers = {"Range": f"bytes={offset}-", "If-Range": etag_path.read_text().strip()}
+
+    try:
+        with requests.get(url, headers=headers, stream=True, verify=False, timeout=time_out) as response:
+            if response.status_code == 416 and offset:
+                # the partial file is already complete
+                total_size = int(response.headers.get("Content-Range", "*/-1").split("/")[-1])
+                if total_size == offset:
+                    part_path.replace(file_path)
+                    etag_path.unlink(missing_ok=True)
+                    return True
+                part_path.unlink(missing_ok=True)
+                etag_path.unlink(missing_ok=True)
+                return download_file(url, file_path, time_out)
+
+            if response.status_code == 206:
+                mode = "ab"
+                total_size = int(response.headers["Content-Range"].split("/")[-1])
+                logging.info(f"Resuming download of {file_path.name} at byte {offset}")
+            elif response.status_code == 200:
+                mode = "wb"
+                total_size = int(response.headers.get("Content-Length", -1))
+            else:
+                logging.warning(f"Error downloading {url} (status code: {response.status_code})")
+                return False
+
+            if response.headers.get("ETag"):
+                etag_path.write_text(response.headers["ETag"])
+
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(part_path, mode) as file_out:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    file_out.write(chunk)
+
+    except requests.exceptions.RequestException:
+        logging.warning(f"Download of {url} interrupted")
+        return False
+
+    if total_size != -1 and part_path.stat().st_size != total_size:
+        logging.warning(f"Download of {url} incomplete ({part_path.stat().st_size}/{total_size} bytes)")
+        return False
+
+    part_path.replace(file_path)
+    etag_path.unlink(missing_ok=True)
+    return True
+
+
+def acknowledge(url: str, data: dict, time_out=None) -> list:
+    """
+    send to the worker the checksums of the downloaded files
+    (/acknowledge with directory and files: JSON list of (name, checksum, algorithm))
+    return the names of the files marked as safe by the worker (same checksum)
+    """
+    try:
+        response = requests.post(url, data=data, verify=False, timeout=time_out)
+        if response.status_code != 200 or response.json().get("error", True):
+            logging.warning(f"Download not acknowledged to {url} (status code: {response.status_code})")
+            return []
+        if response.json().get("mismatch", []):
+            logging.warning(f"{len(response.json()['mismatch'])} file(s) with a different checksum on the worker: {url}")
+        return response.json().get("safe", [])
+    except (requests.exceptions.RequestException, ValueError):
+        logging.warning(f"Download not acknowledged to {url}")
+        return []
+
+
+def new_hash(algorithm: str):
+    """
+    return a new hash object for the algorithm of the worker checksums (None if not available)
+    """
+    if algorithm in ("md5", "blake2b"):
+        return hashlib.new(algorithm)
+    if algorithm == "xxh3":
+        try:
+            import xxhash
+
+            return xxhash.xxh3_64()
+        except ImportError:
+            return None
+    return None
+
+
+def file_checksum(file_path, algorithm: str):
+    """
+    return the checksum of the file (None if the algorithm is not available)
+    """
+    file_hash = new_hash(algorithm)
+    if file_hash is None:
+        return None
+    with open(file_path, "rb") as f_in:
+        while chunk := f_in.read(CHUNK_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def download_bundle(url: str, data: dict, download_dir, time_out=None, progress=None):
+    """
+    download the files of a tar stream of the worker (/archive_bundle) and extract them in download_dir.
+    The size and the checksum (if stored on the worker) of every file are verified with the manifest.
+    progress: function called with the name of every extracted file
+
+    return the list of the downloaded files or None if the worker does not support the tar streams
+    """
+
+    download_dir = pl.Path(download_dir).resolve()
+    downloaded = []
+    try:
+        with requests.post(url, data=data, stream=True, verify=False, timeout=time_out) as response:
+            if response.status_code != 200 or not response.headers.get("Content-Type", "").startswith("application/x-tar"):
+                logging.warning(f"Tar bundle not available from {url} (status code: {response.status_code})")
+                return None
+
+            with tarfile.open(fileobj=response.raw, mode="r|") as tar:
+                manifest = {}
+                for member in tar:
+                    if member.name == BUNDLE_MANIFEST_NAME:
+                        manifest = {x["name"]: x for x in json.loads(tar.extractfile(member).read())["files"]}
+                        continue
+
+                    file_path = (download_dir / member.name).resolve()
+                    if not member.isfile() or member.name not in manifest or download_dir not in file_path.parents:
+                        logging.warning(f"Unexpected member in the tar bundle: {member.name}")
+                        continue
+
+                    expected = manifest[member.name]
+                    file_hash = new_hash(expected["algorithm"]) if expected["checksum"] else None
+                    part_path = file_path.with_name(file_path.name + ".part")
+                    file_path.parent.mkdir(parents=True, exist_ok=True)
+                    size = 0
+                    with tar.extractfile(member) as f_in, open(part_path, "wb") as file_out:
+                        while chunk := f_in.read(CHUNK_SIZE):
+                            file_out.write(chunk)
+                            size += len(chunk)
+                            if file_hash is not None:
+                                file_hash.update(chunk)
+
+                    if size != expected["size"] or (file_hash is not None and file_hash.hexdigest() != expected["checksum"]):
+                        logging.warning(f"{member.name} corrupted during the transfer: file discarded")
+                        part_path.unlink(missing_ok=True)
+                        continue
+
+                    part_path.replace(file_path)
+                    downloaded.append(member.name)
+                    if progress is not None:
+                        progress(member.name)
+
+    # the tar stream is read from the raw response: the read timeout raises an urllib3 exception
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, tarfile.TarError, OSError, ValueError):
+        logging.warning(f"Download of the tar bundle {url} interrupted")
+
+    return downloaded
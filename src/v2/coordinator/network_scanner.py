@@ -0,0 +1,170 @@
+"""
+Raspberry Pi coordinator
+
+scan of the networks for the Raspberry Pi (workers)
+
+The networks are lists of CIDR (192.168.1.0/24, up to /16) or of ranges of the previous versions ("192.168.1.1", [1, 254]).
+All the addresses are scanned by an asyncio engine with a global limit of concurrent probes:
+a TCP connection to the port of the worker (short timeout) then, only if the port is open, a request of /status.
+Every Raspberry Pi is sent to the GUI (found signal) as soon as it answers.
+The addresses of the Raspberry Pi already known are probed first (they are shown immediately).
+The scanner runs in a QThread.
+"""
+
+from PyQt5.QtCore import pyqtSignal, QObject
+
+import asyncio
+import ipaddress
+from http import HTTPStatus
+import logging
+import requests
+
+# largest network scanned
+MIN_PREFIX_LENGTH = 16
+
+
+def network_addresses(networks) -> list:
+    """
+    return the IP addresses (str) of the networks (without duplicates)
+    """
+    addresses = {}
+    for network in networks:
+        if isinstance(network, str):
+            try:
+                ip_network = ipaddress.IPv4Network(network.strip(), strict=False)
+            except ValueError:
+                logging.warning(f"Network not valid: {network}")
+                continue
+            if ip_network.prefixlen < MIN_PREFIX_LENGTH:
+                logging.warning(f"Network {network} too large (up to /{MIN_PREFIX_LENGTH})")
+                continue
+            hosts = ip_network.hosts() if ip_network.prefixlen < 31 else iter(ip_network)
+            addresses.update((str(x), None) for x in hosts)
+        else:
+            # range of the previous versions: (base address, [first, last])
+            ip_base_address, interval = network
+            ip_mask = ".".join(ip_base_address.split(".")[0:3])
+            addresses.update((f"{ip_mask}.{x}", None) for x in range(interval[0], interval[1] + 1))
+    return list(addresses)
+
+
+class Network_scanner(QObject):
+    def __init__(
+        self,
+        networks,
+        protocol: str,
+        port: str,
+        security_key: str,
+        concurrency: int,
+        connect_timeout: float,
+        time_out: float,
+        known_addresses=(),
+    ):
+        """
+        known_addresses: last IP addresses of the known Raspberry Pi (probed first, also outside the networks)
+        port: port of the workers (":5000")
+        concurrency: maximum number of addresses probed at the same time
+        connect_timeout: timeout of the TCP connection (seconds)
+        time_out: timeout of the /status request (seconds)
+        """
+        super().__init__()
+        self.networks = networks
+        self.protocol = protocol
+        self.port = port
+        self.security_key = security_key
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.time_out = time_out
+        self.known_addresses = list(known_addresses)
+        self.found_count = 0
+        self.stopped = False
+
+    start = pyqtSignal()
+    # raspberry id, IP address, status
+    found = pyqtSignal(str, str, dict)
+    # number of Raspberry Pi found, number of addresses scanned
+    finished = pyqtSignal(int, int)
+
+    def stop(self):
+        """
+        stop the scan (the probes running are finished)
+        """
+        self.stopped = True
+
+    async def port_open(self, ip_address: str) -> bool:
+        """
+        return True if the port of the worker accepts the TCP connection
+        """
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, int(self.port.lstrip(":"))), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    def status(self, ip_address: str):
+        """
+        return the status of the worker (None if not available)
+        """
+        try:
+            response = requests.get(
+                f"{self.protocol}{ip_address}{self.port}/status",
+                data={"key": self.security_key},
+                timeout=self.time_out,
+                verify=False,
+            )
+        except requests.exceptions.RequestException:
+            logging.debug(f"{ip_address}: failed to establish a connection")
+            return None
+
+        if response.status_code != HTTPStatus.OK:
+            logging.debug(f"{ip_address}: server status code != 200: {response.status_code}")
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    async def probe(self, ip_address: str):
+        if not await self.port_open(ip_address):
+            return
+        # the /status request runs in the default executor (asyncio.to_thread needs Python 3.9)
+        status = await asyncio.get_running_loop().run_in_executor(None, self.status, ip_address)
+        if status is None:
+            return
+        raspberry_id = status.get("hostname", "")
+        if not raspberry_id:
+            logging.info(f"{ip_address}: hostname not found")
+            return
+        logging.info(f"{ip_address}: server available ({raspberry_id})")
+        self.found_count += 1
+        self.found.emit(raspberry_id, ip_address, status)
+
+    async def scan(self, ip_addresses: list):
+        """
+        probe the addresses with at most concurrency probes at the same time
+        """
+        addresses = iter(ip_addresses)
+
+        async def prober():
+            for ip_address in addresses:
+                if self.stopped:
+                    return
+                await self.probe(ip_address)
+
+        await asyncio.gather(*(prober() for _ in range(min(self.concurrency, len(ip_addresses)))))
+
+    def run(self):
+        ip_addresses = network_addresses(self.known_addresses + list(self.networks))
+        logging.info(f"Scanning {len(ip_addresses)} addresses")
+        self.found_count = 0
+        try:
+            asyncio.run(self.scan(ip_addresses))
+        except Exception:
+            logging.exception("Error scanning the network")
+        logging.info(f"Scanning done: {self.found_count} Raspberry Pi found")
+        self.finished.emit(self.found_count, len(ip_addresses))
@@ -14,13 +14,54 @@ import logging
 import shutil
 import datetime
 import time
+import json
 import requests
 
+import file_transfer
+
 
 def datetime_now_iso():
     return datetime.datetime.now().replace(microsecond=0).isoformat().replace("T", " ")
 
 
+def show_snapshot(self, raspberry_id: str, data: dict) -> bool:
+    """
+    take a picture with /snapshot and display it from memory (one request, no file written)
+    return False if the Raspberry Pi does not provide /snapshot
+    """
+    data = dict(data, archive=str(cfg.SNAPSHOT_ARCHIVE), file_name=f"{str(int(time.time()))}.jpg")
+    if cfg.SNAPSHOT_DOWNSCALE:
+        data["max_width"], data["max_height"] = self.picture_lb.width(), self.picture_lb.height()
+
+    response = self.request(raspberry_id, "/snapshot", type="POST", data=data)
+    if response is None:
+        return True
+    if response.status_code == 404:
+        return False
+
+    if response.status_code != 200:
+        self.rasp_output_lb.setText(f"Error taking picture (status code: {response.status_code})")
+        return True
+
+    if not response.headers.get("Content-Type", "").startswith("image/jpeg"):
+        self.rasp_output_lb.setText(f'{response.json().get("msg", "Undefined error")}  returncode: {response.json().get("error", "-")}')
+        return True
+
+    pixmap = QPixmap()
+    if not pixmap.loadFromData(response.content, "JPG"):
+        self.rasp_output_lb.setText("Error decoding the picture")
+        return True
+
+    self.tw_picture.setCurrentIndex(2)
+    self.picture_lb.setPixmap(pixmap.scaled(self.picture_lb.size(), Qt.KeepAspectRatio))
+    self.rasp_output_lb.setText(f"Picture received at {datetime_now_iso()}")
+
+    self.get_raspberry_status(raspberry_id)
+    self.update_raspberry_display(raspberry_id)
+    self.update_raspberry_dashboard(raspberry_id)
+    return True
+
+
 def take_picture(self, raspberry_id: str, mode: str):
     """
     start time lapse or take a picture and display it
@@ -53,6 +94,9 @@ def take_picture(self, raspberry_id: str, mode: str):
 
             # "ISO": self.raspberry_info[raspberry_id]['picture iso'],
 
+        if mode == "one" and show_snapshot(self, raspberry_id, data):
+            return
+
         # add file name based on epoch
         if mode == "one":
             data["file_name"] = f"{str(int(time.time()))}.jpg"
@@ -374,20 +418,7 @@ def get_timelapse_pictures_list(self, raspberry_id):
     request the list of recorded pictures to Raspberry Pi
     """
 
-    response = self.request(raspberry_id, "/timelapse_pictures_list")
-    if response == None:
-        return
-
-    if response.status_code != 200:
-        self.rasp_output_lb.setText(
-            f"Error requiring the list of time lapse pictures (status code: {response.status_code})"
-        )
-        return
-    if "pictures_list" not in response.json():
-        self.rasp_output_lb.setText(f"Error requiring the list of time lapse pictures")
-        return
-
-    return sorted(list(response.json()["pictures_list"]))
+    return self.get_remote_list(raspberry_id, "/timelapse_pictures_list", "pictures_list", "time lapse pictures")
 
 
 def get_live_pictures_list(self, raspberry_id):
@@ -395,25 +426,15 @@ def get_live_pictures_list(self, raspberry_id):
     request the list of live pictures to Raspberry Pi
     """
 
-    response = self.request(raspberry_id, "/live_pictures_list")
-    if response == None:
-        return
-
-    if response.status_code != 200:
-        self.rasp_output_lb.setText(f"Error requiring the list of live pictures (status code: {response.status_code})")
-        return
-    if "pictures_list" not in response.json():
-        self.rasp_output_lb.setText(f"Error requiring the list of live pictures")
-        return
-
-    return sorted(list(response.json()["pictures_list"]))
+    return self.get_remote_list(raspberry_id, "/live_pictures_list", "pictures_list", "live pictures")
 
 
 class Download_pict_worker(QObject):
-    def __init__(self, raspberry_ip):
+    def __init__(self, raspberry_ip, security_key):
         super().__init__()
         # list of Raspberry Pi IP addresses
         self.raspberry_ip = raspberry_ip
+        self.security_key = security_key
 
     start = pyqtSignal(str, list, str, str)
     progress = pyqtSignal(str)
@@ -422,23 +443,54 @@ class Download_pict_worker(QObject):
     def run(self, raspberry_id, pictures_list, download_dir, remote_pictures_archive_dir):
 
         downloaded_pictures = []
+        to_download = []
         count = 0
         for picture_file_name, picture_size in sorted(pictures_list):
-
             if (pl.Path(download_dir) / pl.Path(picture_file_name)).is_file():
                 if (pl.Path(download_dir) / pl.Path(picture_file_name)).stat().st_size == picture_size:
                     count += 1
                     continue
+            to_download.append(picture_file_name)
+
+        def bundle_progress(picture_file_name):
+            nonlocal count
+            downloaded_pictures.append(picture_file_name)
+            count += 1
+            if count % 100 == 0:
+                self.progress.emit(f"{count}/{len(pictures_list)} pictures downloaded")
+
+        # the pictures are downloaded by tar streams of BUNDLE_MAX_FILES files
+        for idx in range(0, len(to_download), cfg.BUNDLE_MAX_FILES):
+            logging.info(f"Downloading {len(to_download[idx : idx + cfg.BUNDLE_MAX_FILES])} pictures from {raspberry_id}")
+            if (
+                file_transfer.download_bundle(
+                    f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}/archive_bundle",
+                    {
+                        "key": self.security_key,
+                        "directory": pl.PurePosixPath(remote_pictures_archive_dir).name,
+                        "files": json.dumps(to_download[idx : idx + cfg.BUNDLE_MAX_FILES]),
+                    },
+                    download_dir,
+                    time_out=(cfg.TIME_OUT, cfg.DOWNLOAD_READ_TIMEOUT),
+                    progress=bundle_progress,
+                )
+                is None
+            ):
+                # worker without tar streams
+                break
+
+        # pictures not received in a tar stream are downloaded one by one
+        for picture_file_name in sorted(set(to_download) - set(downloaded_pictures)):
 
             logging.info(f"Downloading {picture_file_name} from {raspberry_id}")
 
-            with requests.get(
+            if not file_transfer.download_file(
                 f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}{remote_pictures_archive_dir}/{picture_file_name}",
-                stream=True,
-                verify=False,
-            ) as r:
-                with open((pl.Path(download_dir) / pl.Path(picture_file_name)), "wb") as file_out:
-                    shutil.copyfileobj(r.raw, file_out)
+                pl.Path(download_dir) / pl.Path(picture_file_name),
+                time_out=(cfg.TIME_OUT, cfg.DOWNLOAD_READ_TIMEOUT),
+            ):
+                logging.warning(f"{picture_file_name} not downloaded from {raspberry_id}")
+                continue
 
             logging.info(f"{picture_file_name} downloaded from {raspberry_id}")
 
@@ -446,6 +498,33 @@ class Download_pict_worker(QObject):
             count += 1
             self.progress.emit(f"{count}/{len(pictures_list)} pictures downloaded")
 
+        # the checksums of the pictures present in the download directory are sent to the worker
+        present = [
+            (picture_file_name, picture_size)
+            for picture_file_name, picture_size in pictures_list
+            if (pl.Path(download_dir) / pl.Path(picture_file_name)).is_file()
+            and (pl.Path(download_dir) / pl.Path(picture_file_name)).stat().st_size == picture_size
+        ]
+        for idx in range(0, len(present), cfg.BUNDLE_MAX_FILES):
+            file_transfer.acknowledge(
+                f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}/acknowledge",
+                {
+                    "key": self.security_key,
+                    "directory": pl.PurePosixPath(remote_pictures_archive_dir).name,
+                    "files": json.dumps(
+                        [
+                            (
+                                picture_file_name,
+                                file_transfer.file_checksum(pl.Path(download_dir) / picture_file_name, cfg.CHECKSUM_ALGORITHM),
+                                cfg.CHECKSUM_ALGORITHM,
+                            )
+                            for picture_file_name, _ in present[idx : idx + cfg.BUNDLE_MAX_FILES]
+                        ]
+                    ),
+                },
+                time_out=(cfg.TIME_OUT, cfg.ACKNOWLEDGE_TIMEOUT),
+            )
+
         self.finished.emit(downloaded_pictures)
 
 
@@ -483,7 +562,7 @@ def download_timelapse_pictures(self, raspberry_id, download_dir):
 
     self.pict_download_thread = QThread(parent=self)
     self.pict_download_thread.start()
-    self.pict_download_worker = Download_pict_worker(self.raspberry_ip)
+    self.pict_download_worker = Download_pict_worker(self.raspberry_ip, self.security_key)
     self.pict_download_worker.moveToThread(self.pict_download_thread)
 
     self.pict_download_worker.start.connect(self.pict_download_worker.run)
@@ -528,7 +607,7 @@ def download_live_pictures(self, raspberry_id, download_dir):
 
     self.pict_download_thread = QThread(parent=self)
     self.pict_download_thread.start()
-    self.pict_download_worker = Download_pict_worker(self.raspberry_ip)
+    self.pict_download_worker = Download_pict_worker(self.raspberry_ip, self.security_key)
     self.pict_download_worker.moveToThread(self.pict_download_thread)
 
     self.pict_download_worker.start.connect(self.pict_download_worker.run)
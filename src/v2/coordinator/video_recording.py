@@ -10,15 +10,22 @@ from PyQt5.QtCore import QThread, pyqtSignal, QObject, Qt
 import pathlib as pl
 import logging
 import requests
-import shutil
 import json
+import time
+import datetime
+from multiprocessing.pool import ThreadPool
+
+import output_window
+
+import file_transfer
 
 
 class Download_videos_worker(QObject):
-    def __init__(self, raspberry_ip):
+    def __init__(self, raspberry_ip, security_key):
         super().__init__()
         # list of Raspberry Pi IP
         self.raspberry_ip = raspberry_ip
+        self.security_key = security_key
 
     start = pyqtSignal(str, list, str, str)
     progress = pyqtSignal(str)
@@ -26,35 +33,60 @@ class Download_videos_worker(QObject):
 
     def run(self, raspberry_id, videos_list, download_dir, video_archive_dir):
         downloaded_video = []
+        # files present in the download directory (acknowledged to the worker)
+        present = []
         count = 0
         for video_file_name, video_size in sorted(videos_list):
             if (pl.Path(download_dir) / pl.Path(video_file_name)).is_file():
                 if (pl.Path(download_dir) / pl.Path(video_file_name)).stat().st_size == video_size:
+                    present.append((video_file_name, video_size))
                     count += 1
                     continue
 
             logging.info(f"Downloading  {video_file_name} from {raspberry_id}")
 
-            with requests.get(
+            if not file_transfer.download_file(
                 f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}{video_archive_dir}/{video_file_name}",
-                stream=True,
-                verify=False,
-            ) as r:
-                with open((pl.Path(download_dir) / pl.Path(video_file_name)), "wb") as file_out:
-                    shutil.copyfileobj(r.raw, file_out)
+                pl.Path(download_dir) / pl.Path(video_file_name),
+                time_out=(cfg.TIME_OUT, cfg.DOWNLOAD_READ_TIMEOUT),
+            ):
+                logging.warning(f"{video_file_name} not downloaded from {raspberry_id}")
+                continue
 
             logging.info(f"{video_file_name} downloaded from {raspberry_id}")
 
             downloaded_video.append(video_file_name)
+            present.append((video_file_name, video_size))
             count += 1
             self.progress.emit(f"{count}/{len(videos_list)} video downloaded")
 
+        if present:
+            self.progress.emit(f"Verifying {len(present)} video")
+            file_transfer.acknowledge(
+                f"{cfg.PROTOCOL}{self.raspberry_ip[raspberry_id]}{cfg.SERVER_PORT}/acknowledge",
+                {
+                    "key": self.security_key,
+                    "directory": pl.PurePosixPath(video_archive_dir).name,
+                    "files": json.dumps(
+                        [
+                            (
+                                video_file_name,
+                                file_transfer.file_checksum(pl.Path(download_dir) / video_file_name, cfg.CHECKSUM_ALGORITHM),
+                                cfg.CHECKSUM_ALGORITHM,
+                            )
+                            for video_file_name, _ in present
+                        ]
+                    ),
+                },
+                time_out=(cfg.TIME_OUT, cfg.ACKNOWLEDGE_TIMEOUT),
+            )
+
         self.finished.emit(downloaded_video)
 
 
-def start_video_recording(self, raspberry_id):
+def video_parameters(self, raspberry_id) -> dict:
     """
-    start video recording with selected parameters
+    return the parameters of the video recording of the Raspberry Pi
     """
 
     width, height = self.raspberry_info[raspberry_id]["video mode"].split("x")
@@ -76,9 +108,18 @@ def start_video_recording(self, raspberry_id):
         "hflip": self.raspberry_info[raspberry_id]["video hflip"],
         "vflip": self.raspberry_info[raspberry_id]["video vflip"],
     }
+    if cfg.VIDEO_SEGMENT_DURATION:
+        data["segment_duration"] = cfg.VIDEO_SEGMENT_DURATION
+    return data
+
+
+def start_video_recording(self, raspberry_id):
+    """
+    start video recording with selected parameters
+    """
 
     self.rasp_output_lb.setText("start video recording requested")
-    response = self.request(raspberry_id, "/start_video", type="POST", data=data)
+    response = self.request(raspberry_id, "/start_video", type="POST", data=video_parameters(self, raspberry_id))
     if response is None:
         return
 
@@ -93,6 +134,111 @@ def start_video_recording(self, raspberry_id):
     self.update_raspberry_dashboard(raspberry_id)
 
 
+class Synchronized_start_worker(QObject):
+    """
+    arm the Raspberry Pi in parallel with the same start time (the workers answer after the first frame)
+    """
+
+    # raspberry id -> URL of the Raspberry Pi, raspberry id -> parameters of the video
+    start = pyqtSignal(dict, dict)
+    # start time, raspberry id -> response
+    finished = pyqtSignal(float, dict)
+
+    def stop(self):
+        """
+        nothing to stop: the requests running are finished (the Raspberry Pi are armed)
+        """
+
+    def arm(self, url: str, parameters: dict, start_at: float) -> dict:
+        try:
+            response = requests.post(
+                f"{url}/start_video_at",
+                data=dict(parameters, start_at=f"{start_at:.6f}"),
+                timeout=cfg.SYNCHRONIZED_START_MARGIN + cfg.TIME_OUT,
+                verify=False,
+            )
+            if response.status_code != 200:
+                return {"error": True, "msg": f"status code: {response.status_code}"}
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return {"error": True, "msg": "Failed to establish a connection"}
+
+    def run(self, urls: dict, parameters: dict):
+        start_at = time.time() + cfg.SYNCHRONIZED_START_MARGIN
+        with ThreadPool(len(urls)) as pool:
+            responses = pool.starmap(self.arm, [(urls[x], parameters[x], start_at) for x in urls])
+        self.finished.emit(start_at, dict(zip(urls, responses)))
+
+
+def start_synchronized_video_recording(self, raspberry_id_list: list):
+    """
+    start the video recording at the same time on the Raspberry Pi:
+    all the Raspberry Pi are armed in parallel in a QThread with the same start time (SYNCHRONIZED_START_MARGIN seconds later)
+    and the spread of the times of the first frames is reported
+    """
+
+    def thread_finished(start_at: float, results: dict):
+        thread.quit()
+        thread.wait()
+        self.synchronized_start = None
+
+        started = {x: results[x] for x in results if not results[x].get("error", True) and results[x].get("first_frame") is not None}
+        output = [f"Start time: {datetime_iso(start_at)}", ""]
+        for raspberry_id in sorted(results):
+            if raspberry_id in started:
+                output.append(f"{raspberry_id}: first frame {started[raspberry_id]['delay'] * 1000:+.1f} ms")
+            else:
+                output.append(f"{raspberry_id}: <b>{results[raspberry_id].get('msg', 'Error')}</b>")
+        if started:
+            first_frames = [x["first_frame"] for x in started.values()]
+            spread = (max(first_frames) - min(first_frames)) * 1000
+            output.extend(["", f"Spread of the first frames: {spread:.1f} ms ({len(started)}/{len(results)} Raspberry Pi)"])
+            logging.info(f"Synchronized video recording on {len(started)} Raspberry Pi: spread {spread:.1f} ms")
+
+        self.rasp_output_lb.setText(f"synchronized video recording started on {len(started)}/{len(results)} Raspberry Pi")
+
+        self.results = output_window.ResultsWidget()
+        self.results.setWindowTitle("Synchronized video recording")
+        self.results.ptText.clear()
+        self.results.ptText.setReadOnly(True)
+        self.results.ptText.appendHtml("<br>".join(output))
+        self.results.show()
+
+        # the responses give the state of the recordings (no status request)
+        for raspberry_id in started:
+            if raspberry_id not in self.raspberry_info:
+                continue
+            self.raspberry_info[raspberry_id].setdefault("status", {})["video_recording"] = True
+            self.update_raspberry_display(raspberry_id)
+            if raspberry_id == self.current_raspberry_id:
+                self.update_raspberry_dashboard(raspberry_id)
+
+    if self.synchronized_start is not None:
+        self.rasp_output_lb.setText("synchronized video recording already requested")
+        return
+
+    self.rasp_output_lb.setText(f"synchronized video recording requested on {len(raspberry_id_list)} Raspberry Pi")
+
+    thread = QThread(parent=self)
+    thread.start()
+    worker = Synchronized_start_worker()
+    worker.moveToThread(thread)
+    worker.start.connect(worker.run)
+    worker.finished.connect(thread_finished)
+    self.synchronized_start = (thread, worker)
+    worker.start.emit(
+        {x: f"{cfg.PROTOCOL}{self.raspberry_ip[x]}{cfg.SERVER_PORT}" for x in raspberry_id_list},
+        {x: video_parameters(self, x) for x in raspberry_id_list},
+    )
+
+
+def datetime_iso(timestamp: float) -> str:
+    """
+    return the date and time (ISO 8601 format with ms)
+    """
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="milliseconds")
+
+
 def stop_video_recording(self, raspberry_id):
     """
     stop video recording
@@ -358,18 +504,7 @@ def video_list(self, raspberry_id: str) -> list:
     request the list of recorded video to Raspberry Pi
     """
 
-    response = self.request(raspberry_id, "/video_list")
-    if response == None:
-        return
-
-    if response.status_code != 200:
-        self.rasp_output_lb.setText(f"Error requiring the list of recorded video (status code: {response.status_code})")
-        return
-    if "video_list" not in response.json():
-        self.rasp_output_lb.setText(f"Error requiring the list of recorded video")
-        return
-
-    return sorted(list(response.json()["video_list"]))
+    return self.get_remote_list(raspberry_id, "/video_list", "video_list", "recorded video")
 
 
 def download_videos(self, raspberry_id, download_dir=""):
@@ -428,7 +563,7 @@ def download_videos(self, raspberry_id, download_dir=""):
 
     self.video_download_thread = QThread(parent=self)
     self.video_download_thread.start()
-    self.video_download_worker = Download_videos_worker(self.raspberry_ip)
+    self.video_download_worker = Download_videos_worker(self.raspberry_ip, self.security_key)
     self.video_download_worker.moveToThread(self.video_download_thread)
 
     self.video_download_worker.start.connect(self.video_download_worker.run)
@@ -0,0 +1,91 @@
+"""
+Raspberry Pi worker
+
+discovery and heartbeat beacon
+
+The worker sends a small UDP datagram every BEACON_INTERVAL seconds to a multicast group
+(or to the broadcast address) with its hostname, IP address, port, version, active jobs,
+CPU temperature and free disk space (JSON):
+
+    {"v":1,"host":"rpi1","ip":"192.168.1.11","port":5000,"version":"35","jobs":["video"],"temp":"48.3°C","free":"12.5 Gb","sig":"..."}
+
+The coordinator listening on the port finds the workers and follows their status without HTTP request.
+If the worker has a security key, the datagram is signed (sig: HMAC-SHA256 of the datagram without sig
+with the SHA256 of the security key): the coordinator ignores the beacons not signed with its key.
+The values are read in the status snapshot (no process forked).
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import socket
+import threading
+import logging
+
+VERSION = 1
+
+
+def signature(payload: dict, secret: str) -> str:
+    """
+    return the signature of the payload (without sig)
+    """
+    message = json.dumps({key: payload[key] for key in payload if key != "sig"}, separators=(",", ":"), sort_keys=True)
+    return hmac.new(secret.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class Beacon(threading.Thread):
+    """
+    Class for sending the beacon using a thread
+    """
+
+    def __init__(self, address: str, port: int, interval: float, ttl: int, payload, secret: str = ""):
+        """
+        address: multicast group or broadcast address
+        payload: function returning the content of the beacon (dict)
+        secret: SHA256 of the security key ("" for no signature)
+        ttl: time to live of the multicast datagrams (1: local network)
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.address = address
+        self.port = port
+        self.interval = interval
+        self.ttl = ttl
+        self.payload = payload
+        self.secret = secret
+        # set to send the beacon immediately (job started or finished)
+        self.wake_up = threading.Event()
+        self.sent = 0
+
+    def datagram(self) -> bytes:
+        payload = {"v": VERSION, **self.payload()}
+        if self.secret:
+            payload["sig"] = signature(payload, self.secret)
+        return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        if ipaddress.IPv4Address(self.address).is_multicast:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        return sock
+
+    def run(self):
+        logging.info(f"start beacon thread ({self.address}:{self.port} every {self.interval} s)")
+        sock = self.open_socket()
+        error = False
+        while True:
+            try:
+                sock.sendto(self.datagram(), (self.address, self.port))
+                self.sent += 1
+                if error:
+                    logging.info("Beacon sent again")
+                error = False
+            except Exception:
+                # network not available (Wi-Fi disconnected): logged once
+                if not error:
+                    logging.warning("Beacon not sent")
+                error = True
+            self.wake_up.wait(self.interval)
+            self.wake_up.clear()
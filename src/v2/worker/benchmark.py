@@ -0,0 +1,253 @@
+"""
+Raspberry Pi worker
+
+benchmarks of the worker
+
+download: throughput and CPU use of the HTTP servers (see wsgi_server.py) for the archive downloads
+
+    python3 benchmark.py download --size 200 --clients 2 --requests 5
+
+still: latency of a single picture with the camera program of the backend (one process by picture) and with the warm camera daemon
+
+    python3 benchmark.py still --count 10 --width 1640 --height 1232
+
+For the download benchmark the worker is copied in a temporary directory and started on a free port with every server:
+    development: Werkzeug development server with the debugger (the previous default)
+    werkzeug: threaded Werkzeug server without debugger
+    gunicorn: gthread worker with keep-alive and sendfile
+"""
+
+import argparse
+import http.client
+import os
+import pathlib as pl
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import config as cfg
+import still_capture
+import camera_backends
+
+SERVERS = {
+    "development": ("werkzeug", True),
+    "werkzeug": ("werkzeug", False),
+    "gunicorn": ("gunicorn", False),
+}
+
+LAUNCHER = """
+import config as cfg
+cfg.DEBUG = {debug}
+import worker
+# plain HTTP (sendfile is not available with HTTPS)
+worker.security_key_sha256 = ""
+worker.serve({server!r}, {port})
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid: int) -> list:
+    """
+    return the PID of the process and of all its descendants
+    """
+    children = {}
+    for stat_path in pl.Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat_path.read_text().rsplit(")", 1)[1].split()
+        except Exception:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat_path.parent.name))
+
+    pids = [pid]
+    for x in pids:
+        pids.extend(children.get(x, []))
+    return pids
+
+
+def cpu_time(pid: int) -> float:
+    """
+    return the CPU time (user + system, in seconds) used by the process and its descendants
+    """
+    total = 0
+    for x in process_tree(pid):
+        try:
+            fields = pl.Path(f"/proc/{x}/stat").read_text().rsplit(")", 1)[1].split()
+        except Exception:
+            continue
+        total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def start_worker(directory: pl.Path, server: str, debug: bool, port: int):
+    """
+    start the worker in the directory and wait for the server
+    """
+    (directory / "benchmark_server.py").write_text(LAUNCHER.format(server=server, debug=debug, port=port))
+    process = subprocess.Popen(
+        [sys.executable, "benchmark_server.py"],
+        cwd=directory,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    end = time.monotonic() + 30
+    while time.monotonic() < end:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            # the development server starts a second process (reloader)
+            time.sleep(1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_worker(process)
+    raise RuntimeError(f"The worker did not start with {server}")
+
+
+def stop_worker(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except Exception:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def download(port: int, path: str, requests_number: int, results: list):
+    """
+    download the file several times on the same connection (keep-alive)
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    received = 0
+    for _ in range(requests_number):
+        connection.request("GET", path)
+        response = connection.getresponse()
+        while chunk := response.read(1024 * 1024):
+            received += len(chunk)
+        if response.status != 200:
+            raise RuntimeError(f"Status code {response.status}")
+    connection.close()
+    results.append(received)
+
+
+def benchmark_download(args):
+    worker_dir = pl.Path(__file__).resolve().parent
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = pl.Path(tmp_dir) / "worker"
+        shutil.copytree(worker_dir, directory, ignore=shutil.ignore_patterns(cfg.STATIC_DIR, cfg.RUN_DIR, "*.sqlite*", "*.log"))
+
+        video_dir = directory / cfg.STATIC_DIR / cfg.VIDEO_ARCHIVE_DIR
+        video_dir.mkdir(parents=True)
+        with open(video_dir / "benchmark.h264", "wb") as f_out:
+            for _ in range(args.size):
+                f_out.write(os.urandom(1024 * 1024))
+        path = f"/{cfg.STATIC_DIR}/{cfg.VIDEO_ARCHIVE_DIR}/benchmark.h264"
+
+        print(f"{args.clients} client(s) x {args.requests} download(s) of {args.size} MB\n")
+        print(f"{'server':<12} {'MB/s':>8} {'CPU (s)':>8} {'CPU s/GB':>9}")
+        for name in args.servers:
+            server, debug = SERVERS[name]
+            if server == "gunicorn":
+                try:
+                    import gunicorn  # noqa: F401
+                except ImportError:
+                    print(f"{name:<12} gunicorn not installed")
+                    continue
+
+            port = free_port()
+            process = start_worker(directory, server, debug, port)
+            try:
+                results = []
+                threads = [
+                    threading.Thread(target=download, args=(port, path, args.requests, results)) for _ in range(args.clients)
+                ]
+                cpu_start = cpu_time(process.pid)
+                start = time.monotonic()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                duration = time.monotonic() - start
+                cpu = cpu_time(process.pid) - cpu_start
+            finally:
+                stop_worker(process)
+
+            received = sum(results) / 1024 / 1024
+            print(f"{name:<12} {received / duration:8.1f} {cpu:8.2f} {cpu / (received / 1024):9.2f}")
+
+
+def latency_summary(name: str, latencies: list):
+    print(f"{name:<16} {min(latencies):8.3f} {statistics.median(latencies):8.3f} {max(latencies):8.3f}")
+
+
+def benchmark_still(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = pl.Path(tmp_dir) / "picture.jpg"
+        print(f"{args.count} pictures {args.width}x{args.height} (latency in seconds)\n")
+        print(f"{'capture':<16} {'min':>8} {'median':>8} {'max':>8}")
+
+        # command line of /take_picture
+        backend = camera_backends.get_backend(cfg.CAMERA_BACKEND)
+        spawn = []
+        for _ in range(args.count):
+            start = time.monotonic()
+            subprocess.run(
+                backend.still_command({"width": str(args.width), "height": str(args.height)}, str(output)),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+            spawn.append(time.monotonic() - start)
+        latency_summary(backend.name, spawn)
+
+        client = still_capture.Still_daemon_client(cfg.STILL_DAEMON_PYTHON, pl.Path(tmp_dir) / "still_daemon.sock", 0, args.width, args.height)
+        start = time.monotonic()
+        if not client.start():
+            print(f"{'daemon':<16} not available (picamera2 is required)")
+            return
+        startup = time.monotonic() - start
+        daemon = []
+        try:
+            for _ in range(args.count):
+                start = time.monotonic()
+                if client.capture(output, {"width": str(args.width), "height": str(args.height)}) is None:
+                    raise RuntimeError("Picture not taken by the still daemon")
+                daemon.append(time.monotonic() - start)
+        finally:
+            client.stop()
+        latency_summary("daemon", daemon)
+        print(f"\nstart of the daemon (camera open and converged): {startup:.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the Raspberry Pi worker")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    download_parser = subparsers.add_parser("download", help="download throughput and CPU use of the HTTP servers")
+    download_parser.add_argument("--size", type=int, default=100, help="size of the file (MB)")
+    download_parser.add_argument("--clients", type=int, default=2, help="number of concurrent clients")
+    download_parser.add_argument("--requests", type=int, default=3, help="number of downloads by client")
+    download_parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    download_parser.set_defaults(function=benchmark_download)
+
+    still_parser = subparsers.add_parser("still", help="latency of a single picture (camera program and still daemon)")
+    still_parser.add_argument("--count", type=int, default=10, help="number of pictures")
+    still_parser.add_argument("--width", type=int, default=cfg.DEFAULT_PICTURE_WIDTH)
+    still_parser.add_argument("--height", type=int, default=cfg.DEFAULT_PICTURE_HEIGHT)
+    still_parser.set_defaults(function=benchmark_still)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
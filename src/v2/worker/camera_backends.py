@@ -0,0 +1,192 @@
+"""
+Raspberry Pi worker
+
+camera backends: command lines of the camera programs
+
+    libcamera: libcamera-vid, libcamera-still and libcamera-hello (Raspberry Pi OS Bullseye and later)
+    raspi: raspivid and raspistill (legacy camera stack, see also worker_raspistill.py)
+    simulated: simulated_camera.py (synthetic H.264 and JPEG data, to run and load-test the worker without camera)
+
+The worker starts the commands (also for the scheduled jobs): the jobs are the same with all backends
+(process registry, checksum of the video, media catalog).
+"""
+
+import abc
+import pathlib as pl
+import signal
+import subprocess
+import sys
+import logging
+
+import simulated_camera
+
+# parameters of the requests that are not options of the camera programs (the scheduling parameters are also excluded)
+NOT_OPTIONS = (
+    "prefix",
+    "annotate",
+    "key",
+    "crontab",
+    "at",
+    "id",
+    "comment",
+    "misfire_grace_time",
+    "file_name",
+    "timeout",
+    "timelapse",
+    "segment_duration",
+    "segment_size",
+    "start_at",
+)
+
+# kind of job -> program
+VIDEO, STILL, STREAMING = "video", "still", "streaming"
+JOB_PROGRAMS = {"video": VIDEO, "time_lapse": STILL, "streaming": STREAMING}
+
+# signal starting the recording of a video started paused (see armed_video_command)
+START_SIGNAL = signal.SIGUSR1
+
+
+def options(parameters: dict, excluded=NOT_OPTIONS) -> list:
+    """
+    return the command line options for the parameters ("True" is a flag, "False" is omitted)
+    """
+    output = []
+    for key in parameters:
+        if key in excluded:
+            continue
+        if parameters[key] == "True":
+            output.extend([f"--{key}"])
+        elif parameters[key] != "False":
+            output.extend([f"--{key}", f"{parameters[key]}"])
+    return output
+
+
+class Camera_backend(abc.ABC):
+    """
+    Base class of the camera backends
+    """
+
+    name = ""
+    # the processes not in the process registry are stopped with sudo (jobs of the previous versions started by cron as another user)
+    sudo = True
+
+    @abc.abstractmethod
+    def program(self, kind: str) -> list:
+        """
+        return the program (command line without options) for VIDEO, STILL or STREAMING
+        """
+
+    def video_command(self, parameters: dict, output: str) -> list:
+        """
+        command line of the video recording (output: file path or "-" for the standard output)
+        the duration (timeout) is in ms
+        """
+        return self.program(VIDEO) + options(parameters, [x for x in NOT_OPTIONS if x != "timeout"]) + ["-o", output]
+
+    def armed_video_command(self, parameters: dict, output: str) -> list:
+        """
+        command line of a video recording started paused: the camera is running and the recording starts on START_SIGNAL
+        (--initial pause --signal with libcamera-vid and raspivid). The timeout includes the pause
+        """
+        return self.video_command(dict(parameters, initial="pause", signal="True"), output)
+
+    def still_command(self, parameters: dict, output: str) -> list:
+        """
+        command line of a single picture
+        """
+        return self.program(STILL) + ["--nopreview", "-q", "90"] + options(parameters) + ["-o", output]
+
+    def time_lapse_command(self, parameters: dict, output: str) -> list:
+        """
+        command line of the time lapse (output must contain %04d for the picture number)
+        timeout (duration) and timelapse (interval) are in seconds
+        """
+        command_line = self.program(STILL) + ["--nopreview", "-q", "90"] + options(parameters)
+        if parameters.get("timeout", "0") != "0" and parameters.get("timelapse", "0") != "0":
+            command_line.extend(["--timeout", str(int(parameters["timeout"]) * 1000)])
+            command_line.extend(["--timelapse", str(int(parameters["timelapse"]) * 1000)])
+        return command_line + ["-o", output]
+
+    def streaming_command(self, parameters: dict) -> list:
+        """
+        command line of the video streaming: H.264 on the standard output (sent to the viewers by the stream relay)
+        """
+        return self.program(STREAMING) + ["-t", "0", "--inline"] + options(parameters) + ["-o", "-"]
+
+    @abc.abstractmethod
+    def list_cameras(self) -> str:
+        """
+        return the list of cameras in the format of libcamera-hello --list-cameras
+        """
+
+    def job_pattern(self, kind: str) -> str:
+        """
+        return the text identifying the command of the job in the crontab (jobs of the previous versions)
+        """
+        return pl.Path(self.program(JOB_PROGRAMS[kind])[0]).name
+
+    def kill_command(self, kind: str) -> list:
+        """
+        command line stopping the processes of the job that are not in the process registry
+        """
+        return ["killall", pl.Path(self.program(JOB_PROGRAMS[kind])[0]).name]
+
+    def kill(self, kind: str):
+        subprocess.run((["sudo"] if self.sudo else []) + self.kill_command(kind))
+
+
+class Libcamera_backend(Camera_backend):
+    name = "libcamera"
+
+    def program(self, kind: str) -> list:
+        return ["libcamera-vid"] if kind in (VIDEO, STREAMING) else ["libcamera-still"]
+
+    def list_cameras(self) -> str:
+        process = subprocess.run(["libcamera-hello", "--list-cameras"], stdout=subprocess.PIPE)
+        return process.stdout.decode("utf-8").strip()
+
+
+class Raspi_backend(Camera_backend):
+    name = "raspi"
+
+    def program(self, kind: str) -> list:
+        return ["/usr/bin/raspivid"] if kind in (VIDEO, STREAMING) else ["/usr/bin/raspistill"]
+
+    def list_cameras(self) -> str:
+        """
+        the legacy stack only reports the detection (vcgencmd get_camera: supported=1 detected=1): no sensor modes
+        """
+        process = subprocess.run(["/usr/bin/vcgencmd", "get_camera"], stdout=subprocess.PIPE)
+        if "detected=1" not in process.stdout.decode("utf-8"):
+            return ""
+        return "Available cameras\n-----------------\n0 : raspicam [0x0] (legacy camera stack)"
+
+
+class Simulated_backend(Camera_backend):
+    name = "simulated"
+    sudo = False
+
+    def program(self, kind: str) -> list:
+        return [sys.executable, str(pl.Path(simulated_camera.__file__).resolve()), "vid" if kind in (VIDEO, STREAMING) else "still"]
+
+    def list_cameras(self) -> str:
+        return simulated_camera.camera_list()
+
+    def job_pattern(self, kind: str) -> str:
+        return " ".join([pl.Path(x).name for x in self.program(JOB_PROGRAMS[kind])[1:]])
+
+    def kill_command(self, kind: str) -> list:
+        # the pattern does not match the shell of the cron jobs
+        _, script, mode = self.program(JOB_PROGRAMS[kind])
+        return ["pkill", "-f", f"^[^ ]*python[^ ]* [^ ]*{pl.Path(script).name.replace('.', '[.]')} {mode}"]
+
+
+BACKENDS = {x.name: x for x in (Libcamera_backend, Raspi_backend, Simulated_backend)}
+
+
+def get_backend(name: str) -> Camera_backend:
+    if name not in BACKENDS:
+        logging.warning(f"Camera backend {name} not found: libcamera is used")
+        name = "libcamera"
+    logging.info(f"Camera backend: {name}")
+    return BACKENDS[name]()
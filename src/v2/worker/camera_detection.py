@@ -0,0 +1,139 @@
+"""
+Raspberry Pi worker
+
+cached camera detection
+
+The list of cameras is obtained with a probe (libcamera-hello --list-cameras)
+only at startup, on explicit request (/rescan_cameras) or when the device nodes
+(/dev/video*, /dev/media*) change.
+
+
+    Available cameras
+    -----------------
+    0 : imx219 [3280x2464] (/base/soc/i2c0mux/i2c@1/imx219@10)
+        Modes: 'SRGGB10_CSI2P' : 640x480 [206.65 fps - (1000, 752)/1280x960 crop]
+                                 1640x1232 [41.85 fps - (0, 0)/3280x2464 crop]
+"""
+
+import threading
+import re
+import os
+import logging
+
+
+CAMERA_RE = re.compile(r"^\s*(\d+)\s*:\s*(\S+)\s*\[(\d+)x(\d+)[^\]]*\]\s*(?:\((.*)\))?")
+FORMAT_RE = re.compile(r"'([^']+)'\s*:")
+MODE_RE = re.compile(r"(\d+)x(\d+)\s*\[([\d.]+)\s*fps\s*-\s*\((\d+),\s*(\d+)\)/(\d+)x(\d+)\s*crop\]")
+
+DEVICE_NODES_PREFIXES = ("video", "media")
+
+
+def parse_camera_list(output: str) -> list:
+    """
+    parse the output of libcamera-hello --list-cameras
+    return a list of cameras with the sensor model and the available modes
+    """
+    cameras = []
+    pixel_format = ""
+    for line in output.split("\n"):
+        match = CAMERA_RE.match(line)
+        if match:
+            cameras.append(
+                {
+                    "index": int(match.group(1)),
+                    "model": match.group(2),
+                    "width": int(match.group(3)),
+                    "height": int(match.group(4)),
+                    "path": match.group(5) or "",
+                    "modes": [],
+                }
+            )
+            pixel_format = ""
+            continue
+
+        if not cameras:
+            continue
+
+        match = FORMAT_RE.search(line)
+        if match:
+            pixel_format = match.group(1)
+
+        for match in MODE_RE.finditer(line):
+            cameras[-1]["modes"].append(
+                {
+                    "format": pixel_format,
+                    "width": int(match.group(1)),
+                    "height": int(match.group(2)),
+                    "max_fps": float(match.group(3)),
+                    "crop": [int(match.group(x)) for x in range(4, 8)],
+                }
+            )
+
+    return cameras
+
+
+def device_nodes() -> list:
+    """
+    return the sorted list of the camera device nodes
+    """
+    try:
+        return sorted(x for x in os.listdir("/dev") if x.startswith(DEVICE_NODES_PREFIXES))
+    except Exception:
+        return []
+
+
+class Camera_detector:
+    """
+    Cache of the detected cameras
+    """
+
+    def __init__(self, probe, camera_busy=lambda: False):
+        """
+        probe: function returning the output of the cameras listing
+        camera_busy: function returning True if the camera is used by a job (the probe would fail)
+        """
+        self.probe = probe
+        self.camera_busy = camera_busy
+        self.lock = threading.Lock()
+        self.output = ""
+        self.cameras = []
+        self.nodes = None
+
+    def refresh(self) -> list:
+        """
+        probe the cameras and update the cache
+        """
+        if self.camera_busy():
+            logging.info("Camera in use: camera list not refreshed")
+            return self.get()
+
+        nodes = device_nodes()
+        try:
+            output = self.probe()
+        except Exception:
+            logging.warning("Error during the cameras detection")
+            output = ""
+
+        with self.lock:
+            self.output = output
+            self.cameras = parse_camera_list(output)
+            self.nodes = nodes
+        logging.info(f"Cameras detected: {[x['model'] for x in self.cameras]}")
+        return self.get()
+
+    def check(self) -> str:
+        """
+        refresh the cache if the device nodes changed (hot-plug)
+        return the raw output of the probe
+        """
+        if self.nodes is None or device_nodes() != self.nodes:
+            self.refresh()
+        with self.lock:
+            return self.output
+
+    def get(self) -> list:
+        """
+        return the cached list of cameras
+        """
+        with self.lock:
+            return list(self.cameras)
@@ -0,0 +1,112 @@
+"""
+Raspberry Pi worker
+
+checksums of the archive files
+
+The checksum of a file is stored in a sidecar file in md5sum format ("digest  path").
+The extension of the sidecar file depends on the algorithm:
+.md5sum (default, compatible with md5sum -c), .blake2bsum (compatible with b2sum -c), .xxh3sum
+
+The checksum file of the MP4 version of a video keeps the extension of the video (VIDEO.mp4.md5sum)
+to be distinct from the checksum file of the H.264 version (VIDEO.md5sum).
+
+xxh3 requires the xxhash module (pip install xxhash)
+"""
+
+import hashlib
+import pathlib as pl
+import logging
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+ALGORITHMS = ("md5", "blake2b", "xxh3")
+
+CHUNK_SIZE = 1024 * 1024
+
+# extensions kept in the name of the checksum file
+KEPT_SUFFIXES = (".mp4",)
+
+
+def new_hash(algorithm: str):
+    """
+    return a new hash object for the algorithm
+    """
+    if algorithm == "md5":
+        return hashlib.md5()
+    if algorithm == "blake2b":
+        return hashlib.blake2b()
+    if algorithm == "xxh3":
+        if xxhash is None:
+            raise ValueError("The xxhash module is required for the xxh3 algorithm")
+        return xxhash.xxh3_64()
+    raise ValueError(f"Unknown checksum algorithm: {algorithm}")
+
+
+def available_algorithm(algorithm: str) -> str:
+    """
+    return the algorithm if available on this system else md5
+    """
+    if algorithm not in ALGORITHMS or (algorithm == "xxh3" and xxhash is None):
+        logging.warning(f"Checksum algorithm {algorithm} not available: md5 is used")
+        return "md5"
+    return algorithm
+
+
+def sidecar_path(file_path, algorithm: str) -> pl.Path:
+    """
+    return the path of the checksum file
+    """
+    file_path = pl.Path(file_path)
+    if file_path.suffix in KEPT_SUFFIXES:
+        return file_path.with_name(f"{file_path.name}.{algorithm}sum")
+    return file_path.with_suffix(f".{algorithm}sum")
+
+
+def media_paths(sidecar_path, suffixes) -> list:
+    """
+    return the possible paths of the file of the checksum file (for the file extensions)
+    """
+    sidecar_path = pl.Path(sidecar_path)
+    if sidecar_path.with_suffix("").suffix in KEPT_SUFFIXES:
+        return [sidecar_path.with_suffix("")]
+    return [sidecar_path.with_suffix(suffix) for suffix in suffixes if suffix not in KEPT_SUFFIXES]
+
+
+def sidecar_paths(file_path) -> list:
+    """
+    return the paths of the checksum files for all algorithms
+    """
+    return [sidecar_path(file_path, algorithm) for algorithm in ALGORITHMS]
+
+
+def write_sidecar(file_path, algorithm: str, digest: str):
+    """
+    write the checksum file in md5sum format
+    """
+    sidecar_path(file_path, algorithm).write_text(f"{digest}  {file_path}\n")
+
+
+def read_sidecar(file_path) -> tuple:
+    """
+    return the algorithm and the digest stored for the file (("", "") if not available)
+    """
+    for algorithm in ALGORITHMS:
+        try:
+            return algorithm, sidecar_path(file_path, algorithm).read_text().split()[0]
+        except Exception:
+            continue
+    return "", ""
+
+
+def file_checksum(file_path, algorithm: str = "md5") -> str:
+    """
+    return the checksum of the file content
+    """
+    file_hash = new_hash(algorithm)
+    with open(file_path, "rb") as f_in:
+        while chunk := f_in.read(CHUNK_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
@@ -0,0 +1,62 @@
+"""
+Raspberry Pi worker
+
+clock of the worker measured by the coordinator
+
+The coordinator measures the offset of the worker clock with the four timestamps of NTP (/time_exchange):
+    t1: request sent by the coordinator, t2: request received by the worker,
+    t3: response sent by the worker, t4: response received by the coordinator
+    offset = ((t2 - t1) + (t3 - t4)) / 2 (worker clock - coordinator clock), round-trip time = (t4 - t1) - (t3 - t2)
+and sends the result to the worker (/clock_offset) that records it in the session manifests
+(the offsets can be corrected after the recording).
+
+When the offset is too large, the clock is corrected by the coordinator request: slewed (adjtime, the clock is
+accelerated or slowed down without jump) or stepped if the offset is larger than the maximum slew.
+Setting the clock requires root: the worker runs this module with sudo:
+
+    python3 clock_sync.py slew SECONDS
+    python3 clock_sync.py step SECONDS
+"""
+
+import ctypes
+import ctypes.util
+import math
+import sys
+import time
+
+
+class Timeval(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_usec", ctypes.c_long)]
+
+
+def slew(delta: float):
+    """
+    add delta seconds to the clock progressively (adjtime: 0.5 ms by second)
+    """
+    seconds = math.floor(delta)
+    timeval = Timeval(seconds, round((delta - seconds) * 1_000_000))
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.adjtime(ctypes.byref(timeval), None):
+        raise OSError(ctypes.get_errno(), "adjtime failed")
+
+
+def step(delta: float):
+    """
+    add delta seconds to the clock immediately
+    """
+    time.clock_settime(time.CLOCK_REALTIME, time.clock_gettime(time.CLOCK_REALTIME) + delta)
+
+
+def correction_command(python: str, offset: float, max_slew: float) -> list:
+    """
+    return the command line correcting the measured offset (worker clock - coordinator clock)
+    """
+    return ["sudo", python, __file__, "slew" if abs(offset) <= max_slew else "step", f"{-offset:.6f}"]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] in ("slew", "step"):
+        (slew if sys.argv[1] == "slew" else step)(float(sys.argv[2]))
+    else:
+        print("usage: python3 clock_sync.py slew|step SECONDS", file=sys.stderr)
+        sys.exit(1)
@@ -7,6 +7,23 @@ Configuration of Worker on Raspberry Pi
 """
 
 PORT = 5000
+
+# HTTP server: "gunicorn" (production, requires the gunicorn module) or "werkzeug" (threaded development server)
+SERVER = "gunicorn"
+# number of concurrent requests (threads of the single server process)
+SERVER_THREADS = 8
+# the long responses (/events clients and /live_stream viewers) hold a thread during their whole duration:
+# SERVER_RESERVED_THREADS threads are kept for the other requests (a new long response is refused with 503)
+SERVER_RESERVED_THREADS = 2
+# HTTP keep-alive (seconds)
+SERVER_KEEPALIVE = 5
+# Werkzeug development server with the debugger and the reloader (never on a reachable network)
+DEBUG = False
+
+# camera programs: "libcamera" (libcamera-vid/libcamera-still), "raspi" (raspivid/raspistill, legacy camera stack)
+# or "simulated" (synthetic H.264 and JPEG data written at the requested rate and size, see simulated_camera.py)
+CAMERA_BACKEND = "libcamera"
+
 DEFAULT_PICTURE_WIDTH = 640
 DEFAULT_PICTURE_HEIGHT = 480
 
@@ -15,12 +32,127 @@ VIDEO_ARCHIVE_DIR = "video_archive"
 TIME_LAPSE_ARCHIVE_DIR = "pictures_archive"
 LIVE_PICTURES_ARCHIVE_DIR = "live_pictures"
 
+# every time lapse writes its pictures in a session directory of TIME_LAPSE_ARCHIVE_DIR (see time_lapse_sessions.py)
+# sharding of the pictures of a session: "hour" (SESSION/YYYY-MM-DD/HH/), "date" (SESSION/YYYY-MM-DD/) or "" (SESSION/)
+TIME_LAPSE_SHARDING = "hour"
+# interval of the moves of the pictures in their shard directory (seconds)
+TIME_LAPSE_SHARD_INTERVAL = 10
+
 DEFAULT_VIDEO_DURATION = 10  # seconds
 DEFAULT_FPS = 10
 DEFAULT_VIDEO_WIDTH = 640
 DEFAULT_VIDEO_HEIGHT = 480
 DEFAULT_VIDEO_QUALITY = 1  # Mb/s
 
+# "tee": the encoder writes on a pipe, the worker writes the video file and computes the checksum during the recording
+# "file": the encoder writes the video file, the checksum is computed after the recording (second reading of the file)
+RECORDING_CHECKSUM_MODE = "tee"
+# checksum algorithm: "md5" (compatible with md5sum), "blake2b" (faster on 64-bit CPU) or "xxh3" (requires the xxhash module)
+CHECKSUM_ALGORITHM = "md5"
+# segmented recordings (default values of the segment_duration and segment_size parameters of /start_video):
+# a new file is started every VIDEO_SEGMENT_DURATION seconds or VIDEO_SEGMENT_SIZE MB (0 for no limit, see video_segments.py)
+# the closed segments can be downloaded during the recording. 0 and 0: one file by recording
+VIDEO_SEGMENT_DURATION = 0
+VIDEO_SEGMENT_SIZE = 0
+
+# synchronized recordings (/start_video_at): the camera is started paused (initialization) at least
+# SYNCHRONIZED_START_MIN_DELAY seconds and at most SYNCHRONIZED_START_MAX_DELAY seconds before the start time
+SYNCHRONIZED_START_MIN_DELAY = 2
+SYNCHRONIZED_START_MAX_DELAY = 60
+# the response is sent at the first frame or SYNCHRONIZED_START_FIRST_FRAME_TIMEOUT seconds after the start time
+SYNCHRONIZED_START_FIRST_FRAME_TIMEOUT = 5
+
+# clock offset measured by the coordinator (/time_exchange, see clock_sync.py): an offset up to CLOCK_MAX_SLEW seconds
+# is slewed (0.5 ms by second), a larger offset is stepped (refused during a job)
+CLOCK_MAX_SLEW = 0.5
+
+# background remux of the finished recordings in MP4 (MP4Box, sudo apt install gpac) with the lowest CPU and I/O priority.
+# The MP4 version is listed with the H.264 file. The remux is suspended during the video recordings
+REMUX = False
+REMUX_PROGRAM = "MP4Box"
+# directory of the MP4 files being written (on the file system of the archive)
+REMUX_TMP_DIR = "remux"
+# interval of the search of the video without MP4 version (scheduled recordings, seconds)
+REMUX_SCAN_INTERVAL = 600
+# the search ignores the video modified during the last REMUX_MIN_AGE seconds (recording in progress)
+REMUX_MIN_AGE = 60
+
+# retention (free disk space in Gb, see retention.py): below RETENTION_LOW_WATERMARK the oldest files acknowledged
+# by the coordinator (see /acknowledge) are deleted until RETENTION_HIGH_WATERMARK (0: no deletion)
+RETENTION_LOW_WATERMARK = 2
+RETENTION_HIGH_WATERMARK = 4
+# the new jobs are shortened (or refused) if their projected size would leave less than RETENTION_FLOOR free
+RETENTION_FLOOR = 0.5
+# interval of the checks of the free space (seconds)
+RETENTION_INTERVAL = 30
+# a video recording is refused if less than RETENTION_MIN_VIDEO_DURATION seconds can be recorded
+RETENTION_MIN_VIDEO_DURATION = 5
+# size of a JPEG picture by pixel (bytes) for the projected size of the first time lapse (then the average size is used)
+JPEG_BYTES_PER_PIXEL = 0.25
+
+# scheduled video recordings and time lapses (see job_scheduler.py): jobs stored in SCHEDULER_JOBS_PATH (JSON)
+SCHEDULER_JOBS_PATH = "scheduled_jobs.json"
+# a run missed while the worker was stopped is started at the restart if it is late by less than
+# SCHEDULER_MISFIRE_GRACE_TIME seconds (default of the misfire_grace_time parameter)
+SCHEDULER_MISFIRE_GRACE_TIME = 300
+
 LOG_PATH = "worker.log"
 
+# catalog of the media files (SQLite database)
+CATALOG_PATH = "media_catalog.sqlite"
+# full synchronization interval of the catalog if inotify is not available (seconds)
+CATALOG_RESCAN_INTERVAL = 600
+
+# warm camera daemon for the single pictures (/take_picture): the camera is kept open and converged with picamera2
+# (sudo apt install python3-picamera2). libcamera-still is used if the daemon is not available.
+# The daemon is stopped before the video recording, the time lapse and the video streaming started by the worker
+# (also the scheduled jobs, see job_scheduler.py)
+STILL_DAEMON = False
+# Python interpreter with the picamera2 module
+STILL_DAEMON_PYTHON = "/usr/bin/python3"
+# the camera is released after STILL_DAEMON_IDLE_TIMEOUT seconds without picture
+STILL_DAEMON_IDLE_TIMEOUT = 300
+
+# live video stream (/video_streaming/start): the encoder output is relayed to several viewers
+# raw H.264 over TCP on STREAMING_PORT and over HTTP (/live_stream)
+# the HTTP viewers are also limited by the threads of the server (see SERVER_RESERVED_THREADS)
+STREAMING_PORT = 6000
+STREAMING_MAX_CLIENTS = 10
+# frames buffered by viewer: the frames of a slower viewer are dropped until the next IDR frame
+STREAMING_CLIENT_QUEUE = 60
+# a viewer is disconnected when a frame cannot be sent during STREAMING_SEND_TIMEOUT seconds
+STREAMING_SEND_TIMEOUT = 10
+
+# directory of the runtime files (socket of the still daemon)
+RUN_DIR = "run"
+
 WIFI_INTERFACE = "wlan0"
+
+# discovery beacon (see beacon.py): UDP datagram sent every BEACON_INTERVAL seconds to BEACON_ADDRESS:BEACON_PORT
+# (multicast group, or broadcast address as 255.255.255.255). "" for no beacon
+BEACON_ADDRESS = "239.255.42.42"
+BEACON_PORT = 5042
+BEACON_INTERVAL = 5
+# time to live of the multicast datagrams (1: local network only)
+BEACON_TTL = 1
+
+# refresh interval (in seconds) of each metric of the status sampler
+STATUS_SAMPLING_INTERVALS = {
+    "camera detected": 5,  # only the device nodes are checked, the camera is probed on change
+    "wifi_essid": 60,
+    "CPU temperature": 30,
+    "free disk space": 60,
+    "uptime": 60,
+    "active jobs": 2,  # the jobs started or stopped by the worker are published immediately
+}
+
+# events stream (/events): comment sent every EVENTS_KEEPALIVE seconds to detect the closed connections
+# (the clients can request a shorter interval with the keepalive value).
+# every connected client uses one thread of the server (see SERVER_RESERVED_THREADS)
+EVENTS_KEEPALIVE = 15
+
+# alert events published when a metric crosses a threshold: (threshold, "above" or "below")
+STATUS_ALERTS = {
+    "CPU temperature": (75, "above"),  # °C
+    "free disk space": (1, "below"),  # Gb
+}
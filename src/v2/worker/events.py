@@ -0,0 +1,94 @@
+"""
+Raspberry Pi worker
+
+events of the worker pushed to the clients as Server-Sent Events (/events route)
+
+    id: <boot id>:<event number>
+    event: job_started
+    data: {"kind": "video", ...}
+
+The last events are kept in memory: a client reconnecting with the Last-Event-ID header
+receives the events it missed, or a "reset" event if they are no longer available
+(the client must then request the whole status).
+"""
+
+import threading
+import collections
+import json
+import time
+import uuid
+
+HISTORY_SIZE = 500
+
+
+class Event_bus:
+    """
+    Publication of the worker events
+    """
+
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        self.condition = threading.Condition()
+        # the event ids of a previous run of the worker are not valid
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.last_number = 0
+        # (number, type, data, timestamp)
+        self.history = collections.deque(maxlen=history_size)
+
+    def publish(self, event_type: str, data: dict = None):
+        """
+        publish an event to all the clients
+        """
+        with self.condition:
+            self.last_number += 1
+            self.history.append((self.last_number, event_type, data or {}, time.time()))
+            self.condition.notify_all()
+
+    def events_after(self, number: int) -> list:
+        """
+        return the events published after the event number (None if some of them are no longer available)
+        """
+        if number < self.last_number and (not self.history or self.history[0][0] > number + 1):
+            return None
+        return [event for event in self.history if event[0] > number]
+
+    def format(self, number: int, event_type: str, data: dict, timestamp: float) -> str:
+        return f"id: {self.boot_id}:{number}\nevent: {event_type}\ndata: {json.dumps({**data, 'timestamp': timestamp})}\n\n"
+
+    def stream(self, last_event_id: str = "", keepalive: float = 15):
+        """
+        yield the events in SSE format (a comment is sent every keepalive seconds to detect the closed connections)
+        last_event_id: id of the last event received by the client
+        """
+        boot_id, _, number = last_event_id.partition(":")
+        reset = ""
+        with self.condition:
+            if boot_id == self.boot_id and number.isdigit():
+                number = int(number)
+            else:
+                # new client or worker restarted
+                number = self.last_number
+                if last_event_id:
+                    reset = self.format(number, "reset", {}, time.time())
+
+        # the lock is not held while the client reads (a slow client would block the publications)
+        if reset:
+            yield reset
+
+        # reconnection delay of the client (ms)
+        yield "retry: 3000\n\n"
+
+        while True:
+            with self.condition:
+                events = self.events_after(number)
+                if events == []:
+                    self.condition.wait(timeout=keepalive)
+                    events = self.events_after(number)
+                if events is None:
+                    events = [(self.last_number, "reset", {}, time.time())]
+
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield self.format(*event)
+            number = events[-1][0]
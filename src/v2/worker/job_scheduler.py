@@ -0,0 +1,295 @@
+"""
+Raspberry Pi worker
+
+scheduled jobs (video recordings and time lapses)
+
+The jobs are scheduled by the worker (no crontab): every run is started by the same functions as the jobs
+started by the coordinator (checksums, time lapse sessions, remux, disk space admission, registry of the running jobs).
+
+    cron trigger: "minute hour day_of_month month day_of_week" (crontab syntax: *, lists, ranges, steps and names)
+    date trigger: one run at a date and time (ISO format, fractions of second allowed)
+
+The jobs are stored in a JSON file (complete file renamed) and survive a restart of the worker.
+A run missed while the worker was stopped (reboot) is started at the restart if it is late by less than
+the misfire grace time of the job (the missed runs of a cron job are coalesced in one run), otherwise it is skipped.
+"""
+
+import datetime
+import json
+import os
+import pathlib as pl
+import threading
+import uuid
+import logging
+
+KINDS = ("video", "time_lapse")
+
+# parameters of the scheduling requests that are not parameters of the job (stored as job fields)
+SCHEDULING_KEYS = ("key", "crontab", "at", "id", "comment", "misfire_grace_time")
+
+# the wall clock is read again at least every WAIT_MAX seconds (clock set by /sync_time or NTP)
+WAIT_MAX = 10
+
+CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day of month", 1, 31), ("month", 1, 12), ("day of week", 0, 7))
+CRON_NAMES = {
+    "month": ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"],
+    "day of week": ["sun", "mon", "tue", "wed", "thu", "fri", "sat"],
+}
+CRON_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+
+def job_parameters(parameters: dict) -> dict:
+    """
+    return the parameters of the job without the scheduling parameters
+    """
+    return {key: parameters[key] for key in parameters if key not in SCHEDULING_KEYS}
+
+
+def cron_value(text: str, name: str) -> int:
+    """
+    return the value of a cron field element (number or name)
+    """
+    if name in CRON_NAMES and text.lower() in CRON_NAMES[name]:
+        return CRON_NAMES[name].index(text.lower()) + (1 if name == "month" else 0)
+    return int(text)
+
+
+def parse_cron_field(text: str, name: str, low: int, high: int) -> set:
+    """
+    return the values of a cron field (*, 1,2,3, 1-5, */15, 0-30/10, MON-FRI)
+    """
+    values = set()
+    for element in text.split(","):
+        element, _, step = element.partition("/")
+        step = int(step) if step else 1
+        if element == "*":
+            start, end = low, high
+        else:
+            start, _, end = element.partition("-")
+            start = cron_value(start, name)
+            end = cron_value(end, name) if end else (high if step != 1 else start)
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"{name} not valid: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron_trigger:
+    """
+    runs of a crontab expression (local time)
+    """
+
+    def __init__(self, expression: str):
+        expression = CRON_ALIASES.get(expression.strip().lower(), expression)
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"5 fields expected: {expression}")
+        self.minutes, self.hours, self.days, self.months, self.days_of_week = (
+            parse_cron_field(text, *field) for text, field in zip(fields, CRON_FIELDS)
+        )
+        # 7 is also Sunday
+        if 7 in self.days_of_week:
+            self.days_of_week = (self.days_of_week - {7}) | {0}
+        # crontab: when the day of month and the day of week are both restricted, a day matching one of them is a run day
+        self.any_day = fields[2].startswith("*") or fields[4].startswith("*")
+
+    def day_matches(self, date: datetime.datetime) -> bool:
+        day_of_month, day_of_week = date.day in self.days, date.isoweekday() % 7 in self.days_of_week
+        return (day_of_month and day_of_week) if self.any_day else (day_of_month or day_of_week)
+
+    def next_run(self, after: datetime.datetime):
+        """
+        return the first run after the date (None if no run during the next 5 years: 31 February)
+        """
+        date = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = date + datetime.timedelta(days=5 * 366)
+        while date < limit:
+            if date.month not in self.months:
+                date = (date.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(date):
+                date = date.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif date.hour not in self.hours:
+                date = date.replace(minute=0) + datetime.timedelta(hours=1)
+            elif date.minute not in self.minutes:
+                date += datetime.timedelta(minutes=1)
+            else:
+                return date
+        return None
+
+
+class Job_scheduler(threading.Thread):
+    """
+    Class for starting the scheduled jobs using a thread
+    """
+
+    def __init__(self, jobs_path, start_job, misfire_grace_time: float):
+        """
+        jobs_path: JSON file of the scheduled jobs
+        start_job: function starting a job (kind, parameters) and returning the response of the start (dict with msg)
+        misfire_grace_time: default maximum delay of a run (seconds), a later run is skipped
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.jobs_path = pl.Path(jobs_path)
+        self.start_job = start_job
+        self.misfire_grace_time = misfire_grace_time
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.jobs = self.load()
+
+    def load(self) -> dict:
+        try:
+            jobs = {job["id"]: job for job in json.loads(self.jobs_path.read_text())}
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logging.exception(f"Scheduled jobs not loaded from {self.jobs_path}")
+            return {}
+        # jobs saved with their scheduling parameters
+        for job in jobs.values():
+            job["parameters"] = job_parameters(job["parameters"])
+        return jobs
+
+    def save(self):
+        """
+        write the jobs (complete file renamed), the lock must be held
+        """
+        tmp_path = self.jobs_path.with_name(self.jobs_path.name + ".part")
+        tmp_path.write_text(json.dumps(list(self.jobs.values()), indent=1))
+        os.replace(tmp_path, self.jobs_path)
+
+    def next_run(self, job: dict, after: datetime.datetime):
+        """
+        return the next run of the job after the date (ISO format, None if the job has no more run)
+        """
+        if job["trigger"] == "cron":
+            date = Cron_trigger(job["crontab"]).next_run(after)
+            return date.isoformat() if date is not None else None
+        return job["at"] if datetime.datetime.fromisoformat(job["at"]) > after else None
+
+    def add(self, kind: str, parameters: dict, crontab: str = "", at: str = "", comment: str = "", misfire_grace_time=None) -> dict:
+        """
+        add a job with a cron trigger (crontab) or a date trigger (at)
+        raise ValueError if the trigger is not valid or without run
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Job kind not valid: {kind}")
+        if crontab:
+            job = {"trigger": "cron", "crontab": " ".join(crontab.split())}
+            Cron_trigger(crontab)
+        elif at:
+            date = datetime.datetime.fromisoformat(at.strip().replace(" ", "T"))
+            if date.tzinfo is not None:
+                date = date.astimezone().replace(tzinfo=None)
+            job = {"trigger": "date", "at": date.isoformat()}
+        else:
+            raise ValueError("No trigger")
+
+        job.update(
+            {
+                "id": uuid.uuid4().hex[:12],
+                "kind": kind,
+                "comment": comment,
+                "parameters": job_parameters(parameters),
+                "misfire_grace_time": float(misfire_grace_time) if misfire_grace_time is not None else self.misfire_grace_time,
+                "created_at": datetime.datetime.now().replace(microsecond=0).isoformat(),
+                "last_run": None,
+                "runs": 0,
+                "missed": 0,
+            }
+        )
+        job["next_run"] = self.next_run(job, datetime.datetime.now())
+        if job["next_run"] is None:
+            raise ValueError("No run in the future")
+
+        with self.lock:
+            self.jobs[job["id"]] = job
+            self.save()
+        self.wakeup.set()
+        logging.info(f"{kind} job {job['id']} scheduled (next run: {job['next_run']})")
+        return job
+
+    def remove(self, kind: str = None, job_id: str = None) -> int:
+        """
+        remove the jobs of the kind (or the job with the id)
+        return the number of removed jobs
+        """
+        with self.lock:
+            removed = [x for x in self.jobs if (job_id is None or x == job_id) and (kind is None or self.jobs[x]["kind"] == kind)]
+            for x in removed:
+                del self.jobs[x]
+            self.save()
+        self.wakeup.set()
+        return len(removed)
+
+    def list(self, kind: str = None) -> list:
+        """
+        return the jobs of the kind ordered by next run
+        """
+        with self.lock:
+            jobs = [dict(x) for x in self.jobs.values() if kind is None or x["kind"] == kind]
+        return sorted(jobs, key=lambda x: x["next_run"] or "")
+
+    def run_due_jobs(self):
+        """
+        start the jobs whose run is due (skipped if later than the misfire grace time)
+        """
+        now = datetime.datetime.now()
+        with self.lock:
+            due = [x for x in self.jobs.values() if x["next_run"] and datetime.datetime.fromisoformat(x["next_run"]) <= now]
+
+        for job in sorted(due, key=lambda x: x["next_run"]):
+            scheduled = datetime.datetime.fromisoformat(job["next_run"])
+            started = datetime.datetime.now()
+            delay = (started - scheduled).total_seconds()
+            if delay > job["misfire_grace_time"]:
+                logging.warning(f"Run of the {job['kind']} job {job['id']} at {job['next_run']} missed (late by {delay:.0f} s)")
+                last_run = {"scheduled": job["next_run"], "started_at": None, "delay": round(delay, 3), "msg": "Missed"}
+            else:
+                try:
+                    response = self.start_job(job["kind"], dict(job["parameters"]))
+                except Exception:
+                    logging.exception(f"Error starting the {job['kind']} job {job['id']}")
+                    response = {"error": True, "msg": "Error starting the job"}
+                logging.info(f"{job['kind']} job {job['id']} started {delay:.3f} s after {job['next_run']}: {response.get('msg', '')}")
+                last_run = {
+                    "scheduled": job["next_run"],
+                    "started_at": started.isoformat(),
+                    "delay": round(delay, 3),
+                    "msg": response.get("msg", ""),
+                }
+
+            with self.lock:
+                if job["id"] not in self.jobs:
+                    continue
+                job["last_run"] = last_run
+                job["runs" if last_run["started_at"] else "missed"] += 1
+                # the missed runs are coalesced
+                job["next_run"] = self.next_run(job, max(now, scheduled))
+                if job["next_run"] is None:
+                    logging.info(f"{job['kind']} job {job['id']} finished")
+                    del self.jobs[job["id"]]
+                self.save()
+
+    def run(self):
+        logging.info(f"start scheduler thread ({len(self.jobs)} scheduled jobs)")
+        while True:
+            with self.lock:
+                next_runs = [datetime.datetime.fromisoformat(x["next_run"]) for x in self.jobs.values() if x["next_run"]]
+            delay = (min(next_runs) - datetime.datetime.now()).total_seconds() if next_runs else WAIT_MAX
+            if delay > 0:
+                self.wakeup.wait(min(delay, WAIT_MAX))
+                self.wakeup.clear()
+                continue
+            try:
+                self.run_due_jobs()
+            except Exception:
+                logging.exception("Error starting the scheduled jobs")
+                self.wakeup.wait(WAIT_MAX)
@@ -0,0 +1,515 @@
+"""
+Raspberry Pi worker
+
+persistent catalog of the media files (video, pictures) of the archive directories
+
+The catalog is a SQLite database updated incrementally with the inotify events
+of the archive directories (a full scan is done only at startup or if the events were lost).
+The list routes are served from the catalog without any access to the archive directories.
+The files acknowledged by the coordinator (downloaded with the same checksum) are marked as safe:
+only the safe files are deleted (deletion routes and eviction to free disk space).
+"""
+
+import threading
+import sqlite3
+import ctypes
+import ctypes.util
+import struct
+import select
+import os
+import re
+import time
+import datetime
+import pathlib as pl
+import logging
+import uuid
+
+import checksum
+
+# kind of the media files by extension
+MEDIA_KINDS = {".h264": "video", ".mp4": "video", ".jpg": "picture"}
+
+# inotify constants (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct("iIII")
+
+VIDEO_DATETIME_RE = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{6})")
+
+
+def hidden(name: str) -> bool:
+    """
+    check if the file is in a hidden directory or is hidden (files being written, not listed)
+    """
+    return any(part.startswith(".") for part in pl.PurePath(name).parts)
+
+
+def prefix_range(prefix: str) -> tuple:
+    """
+    return the range of the names beginning with prefix (the range uses the primary key index)
+    """
+    return prefix, prefix + "\U0010ffff"
+
+
+def capture_time(file_path: pl.Path, file_stat) -> float:
+    """
+    return the capture time (epoch) of the media file
+    the start of the video recording is in the file name, the pictures are written at capture time
+    """
+    match = VIDEO_DATETIME_RE.search(file_path.name)
+    if match:
+        try:
+            return datetime.datetime.strptime(match.group(1), "%Y-%m-%d_%H%M%S").timestamp()
+        except ValueError:
+            pass
+    return file_stat.st_mtime
+
+
+class Media_catalog:
+    """
+    Catalog of the media files of the archive directories
+    """
+
+    def __init__(self, db_path, root_dir, directories: list, notify=None):
+        """
+        db_path: path of the SQLite database
+        root_dir: path of the static directory
+        directories: names of the archive directories (relative to root_dir)
+        notify: function called with the event type (file_closed, file_deleted, checksum_written) and the event data
+        """
+        self.root_dir = pl.Path(root_dir)
+        self.notify = notify
+        self.directories = list(directories)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS media ("
+            "directory TEXT, name TEXT, size INTEGER, mtime REAL, kind TEXT, "
+            "checksum TEXT DEFAULT '', algorithm TEXT DEFAULT '', capture_time REAL, "
+            "seq INTEGER, deleted INTEGER DEFAULT 0, safe INTEGER DEFAULT 0, "
+            "PRIMARY KEY (directory, name))"
+        )
+        # catalog created by a previous version
+        if "safe" not in [row[1] for row in self.db.execute("PRAGMA table_info(media)")]:
+            self.db.execute("ALTER TABLE media ADD COLUMN safe INTEGER DEFAULT 0")
+        self.db.execute("CREATE INDEX IF NOT EXISTS media_seq ON media (directory, seq)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS media_safe ON media (safe, deleted, capture_time)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        # the catalog id changes if the database is recreated (the cursors of the clients are no longer valid)
+        self.db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('catalog_id', ?)", (uuid.uuid4().hex,))
+        self.db.commit()
+        self.catalog_id = self.db.execute("SELECT value FROM meta WHERE key = 'catalog_id'").fetchone()[0]
+        self.seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM media").fetchone()[0]
+
+    def split_path(self, file_path: pl.Path) -> tuple:
+        """
+        return the archive directory and the name (relative to the archive directory) of the file
+        """
+        relative_path = pl.Path(file_path).relative_to(self.root_dir)
+        return relative_path.parts[0], str(pl.Path(*relative_path.parts[1:]))
+
+    def next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def publish(self, event_type: str, data: dict):
+        if self.notify is not None:
+            self.notify(event_type, data)
+
+    def update(self, file_path):
+        """
+        add or update the file in the catalog
+        """
+        file_path = pl.Path(file_path)
+        try:
+            directory, name = self.split_path(file_path)
+        except ValueError:
+            return
+
+        if file_path.suffix in [f".{x}sum" for x in checksum.ALGORITHMS]:
+            self.update_checksum(file_path)
+            return
+
+        if file_path.suffix not in MEDIA_KINDS or hidden(name):
+            return
+
+        try:
+            file_stat = file_path.stat()
+        except FileNotFoundError:
+            self.remove(file_path)
+            return
+
+        algorithm, digest = checksum.read_sidecar(file_path)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO media (directory, name, size, mtime, kind, checksum, algorithm, capture_time, seq, deleted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (
+                    directory,
+                    name,
+                    file_stat.st_size,
+                    file_stat.st_mtime,
+                    MEDIA_KINDS[file_path.suffix],
+                    digest,
+                    algorithm,
+                    capture_time(file_path, file_stat),
+                    self.next_seq(),
+                ),
+            )
+            self.db.commit()
+        self.publish(
+            "file_closed", {"directory": directory, "name": name, "size": file_stat.st_size, "kind": MEDIA_KINDS[file_path.suffix]}
+        )
+
+    def update_checksum(self, sidecar_path: pl.Path):
+        """
+        update the checksum of the media file corresponding to the checksum file
+        """
+        directory, _ = self.split_path(sidecar_path)
+        for media_path in checksum.media_paths(sidecar_path, MEDIA_KINDS):
+            _, name = self.split_path(media_path)
+            algorithm, digest = checksum.read_sidecar(media_path)
+            with self.lock:
+                cursor = self.db.execute(
+                    "UPDATE media SET checksum = ?, algorithm = ?, seq = ? WHERE directory = ? AND name = ? AND deleted = 0",
+                    (digest, algorithm, self.seq + 1, directory, name),
+                )
+                if cursor.rowcount:
+                    self.next_seq()
+                self.db.commit()
+            if cursor.rowcount and digest:
+                self.publish(
+                    "checksum_written",
+                    {"directory": directory, "name": name, "checksum": digest, "algorithm": algorithm},
+                )
+
+    def remove(self, file_path):
+        """
+        mark the file as deleted (the row is kept for the incremental listings)
+        """
+        file_path = pl.Path(file_path)
+        try:
+            directory, name = self.split_path(file_path)
+        except ValueError:
+            return
+
+        if file_path.suffix in [f".{x}sum" for x in checksum.ALGORITHMS]:
+            self.update_checksum(file_path)
+            return
+
+        with self.lock:
+            cursor = self.db.execute(
+                "UPDATE media SET deleted = 1, seq = ? WHERE directory = ? AND name = ? AND deleted = 0",
+                (self.seq + 1, directory, name),
+            )
+            deleted = bool(cursor.rowcount)
+            if deleted:
+                self.next_seq()
+            # all files of a deleted directory
+            cursor = self.db.execute(
+                "SELECT name FROM media WHERE directory = ? AND substr(name, 1, ?) = ? AND deleted = 0",
+                (directory, len(name) + 1, f"{name}/"),
+            )
+            sub_names = [sub_name for (sub_name,) in cursor.fetchall()]
+            for sub_name in sub_names:
+                self.db.execute(
+                    "UPDATE media SET deleted = 1, seq = ? WHERE directory = ? AND name = ?", (self.next_seq(), directory, sub_name)
+                )
+            self.db.commit()
+
+        for deleted_name in ([name] if deleted else []) + sub_names:
+            self.publish("file_deleted", {"directory": directory, "name": deleted_name})
+
+    def reconcile(self, directory: str = None):
+        """
+        synchronize the catalog with the content of the archive directories (all directories if None)
+        """
+        t0 = time.monotonic()
+        for archive_dir in [directory] if directory else self.directories:
+            with self.lock:
+                known = {
+                    name: (size, mtime)
+                    for name, size, mtime in self.db.execute(
+                        "SELECT name, size, mtime FROM media WHERE directory = ? AND deleted = 0", (archive_dir,)
+                    )
+                }
+            found = set()
+            for file_path in (self.root_dir / archive_dir).rglob("*"):
+                if file_path.suffix not in MEDIA_KINDS or not file_path.is_file():
+                    continue
+                name = str(file_path.relative_to(self.root_dir / archive_dir))
+                if hidden(name):
+                    continue
+                found.add(name)
+                file_stat = file_path.stat()
+                if known.get(name) != (file_stat.st_size, file_stat.st_mtime):
+                    self.update(file_path)
+
+            for name in set(known) - found:
+                self.remove(self.root_dir / archive_dir / name)
+
+        logging.info(f"Media catalog synchronized in {time.monotonic() - t0:.2f} s")
+
+    def list(self, directory: str, kind: str = None) -> list:
+        """
+        return the list of (name, size) of the files of the archive directory
+        """
+        query = "SELECT name, size FROM media WHERE directory = ? AND deleted = 0"
+        arguments = [directory]
+        if kind:
+            query += " AND kind = ?"
+            arguments.append(kind)
+        with self.lock:
+            return [tuple(row) for row in self.db.execute(query + " ORDER BY name", arguments)]
+
+    def query(
+        self,
+        directory: str,
+        kind: str = None,
+        since: int = None,
+        limit: int = None,
+        prefix: str = "",
+        start: float = None,
+        end: float = None,
+    ) -> dict:
+        """
+        return the files of the archive directory matching the filters
+
+        since: sequence cursor. Only the files added, modified or deleted after the cursor are returned (ordered by sequence)
+        limit: maximum number of files (the next page is obtained with the returned cursor)
+        prefix: beginning of the file name
+        start, end: range of capture time (epoch)
+        """
+        conditions = ["directory = ?"]
+        arguments = [directory]
+        if kind:
+            conditions.append("kind = ?")
+            arguments.append(kind)
+        if prefix:
+            conditions.append("name >= ? AND name < ?")
+            arguments.extend(prefix_range(prefix))
+        if start is not None:
+            conditions.append("capture_time >= ?")
+            arguments.append(start)
+        if end is not None:
+            conditions.append("capture_time <= ?")
+            arguments.append(end)
+        if limit and since is None:
+            # the pages are ordered by sequence
+            since = 0
+        if since is not None:
+            conditions.append("seq > ?")
+            arguments.append(since)
+        if not since:
+            # the deleted files are only useful for the incremental listings
+            conditions.append("deleted = 0")
+
+        query = f"SELECT name, size, seq, deleted FROM media WHERE {' AND '.join(conditions)}"
+        query += " ORDER BY seq" if since is not None else " ORDER BY name"
+        if limit:
+            # one more row to know if there are more files
+            query += f" LIMIT {int(limit) + 1}"
+
+        with self.lock:
+            rows = self.db.execute(query, arguments).fetchall()
+            seq = self.seq
+
+        more = bool(limit) and len(rows) > int(limit)
+        if more:
+            rows = rows[: int(limit)]
+
+        return {
+            "files": [(name, size) for name, size, _, deleted in rows if not deleted],
+            "deleted": [name for name, _, _, deleted in rows if deleted],
+            # cursor for the next request
+            "cursor": rows[-1][2] if more else seq,
+            "more": more,
+            "catalog_id": self.catalog_id,
+        }
+
+    def get(self, directory: str, name: str):
+        """
+        return the catalog entry of the file (None if not found)
+        """
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM media WHERE directory = ? AND name = ? AND deleted = 0", (directory, name))
+            row = cursor.fetchone()
+            return dict(zip([x[0] for x in cursor.description], row)) if row else None
+
+    def summary(self, directory: str, prefix: str = "") -> tuple:
+        """
+        return the number and the total size of the files of the archive directory beginning with prefix
+        """
+        with self.lock:
+            return tuple(
+                self.db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media WHERE directory = ? AND name >= ? AND name < ? AND deleted = 0",
+                    (directory, *prefix_range(prefix)),
+                ).fetchone()
+            )
+
+    def mark_safe(self, directory: str, names: list):
+        """
+        mark the files as safe (checksum acknowledged by the coordinator)
+        """
+        with self.lock:
+            self.db.executemany("UPDATE media SET safe = 1 WHERE directory = ? AND name = ? AND deleted = 0", [(directory, x) for x in names])
+            self.db.commit()
+
+    def safe_files(self, directory: str, prefix: str = "") -> list:
+        """
+        return the names of the safe files of the archive directory beginning with prefix
+        """
+        with self.lock:
+            return [
+                name
+                for (name,) in self.db.execute(
+                    "SELECT name FROM media WHERE directory = ? AND name >= ? AND name < ? AND safe = 1 AND deleted = 0",
+                    (directory, *prefix_range(prefix)),
+                )
+            ]
+
+    def evictable(self, limit: int = 100) -> list:
+        """
+        return the oldest safe files (directory, name, size) of all archive directories
+        """
+        with self.lock:
+            return self.db.execute(
+                "SELECT directory, name, size FROM media WHERE safe = 1 AND deleted = 0 ORDER BY capture_time LIMIT ?", (limit,)
+            ).fetchall()
+
+    def safe_size(self) -> int:
+        """
+        return the total size of the safe files
+        """
+        with self.lock:
+            return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM media WHERE safe = 1 AND deleted = 0").fetchone()[0]
+
+    def average_size(self, directory: str, kind: str, count: int = 100):
+        """
+        return the average size of the last files of the kind in the archive directory (None if no file)
+        """
+        with self.lock:
+            return self.db.execute(
+                "SELECT AVG(size) FROM (SELECT size FROM media WHERE directory = ? AND kind = ? AND deleted = 0 ORDER BY seq DESC LIMIT ?)",
+                (directory, kind, count),
+            ).fetchone()[0]
+
+    def known(self, directory: str, name: str) -> bool:
+        """
+        check if the file is or was in the catalog (deleted files included)
+        """
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM media WHERE directory = ? AND name = ?", (directory, name)).fetchone() is not None
+
+    def entries(self, directory: str, names: list) -> list:
+        """
+        return the catalog entries (name, size, checksum, algorithm) of the files of the archive directory
+        """
+        output = []
+        with self.lock:
+            # SQLite limits the number of parameters of a query
+            for idx in range(0, len(names), 500):
+                batch = names[idx : idx + 500]
+                cursor = self.db.execute(
+                    "SELECT name, size, checksum, algorithm FROM media "
+                    f"WHERE directory = ? AND deleted = 0 AND name IN ({','.join('?' * len(batch))})",
+                    [directory, *batch],
+                )
+                output.extend(dict(zip(("name", "size", "checksum", "algorithm"), row)) for row in cursor)
+        return sorted(output, key=lambda x: x["name"])
+
+
+class Catalog_watcher(threading.Thread):
+    """
+    Class for updating the media catalog with the inotify events using a thread
+    """
+
+    def __init__(self, catalog: Media_catalog, rescan_interval: float):
+        threading.Thread.__init__(self, daemon=True)
+        self.catalog = catalog
+        self.rescan_interval = rescan_interval
+        self.watches = {}  # watch descriptor -> directory path
+
+    def add_watch(self, fd: int, directory: pl.Path):
+        """
+        watch the directory and its sub-directories
+        """
+        for path in [directory] + [x for x in directory.rglob("*") if x.is_dir()]:
+            wd = self.libc.inotify_add_watch(fd, str(path).encode("utf-8"), WATCH_MASK)
+            if wd < 0:
+                logging.warning(f"Media catalog: {path} cannot be watched")
+                continue
+            self.watches[wd] = path
+
+    def run(self):
+        logging.info("start media catalog thread")
+
+        self.catalog.reconcile()
+
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = self.libc.inotify_init1(IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1")
+        except Exception:
+            logging.warning("inotify not available: the media catalog is synchronized periodically")
+            while True:
+                time.sleep(self.rescan_interval)
+                self.catalog.reconcile()
+
+        for directory in self.catalog.directories:
+            self.add_watch(fd, self.catalog.root_dir / directory)
+
+        while True:
+            if not select.select([fd], [], [], self.rescan_interval)[0]:
+                continue
+            buffer = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0").decode("utf-8")
+                offset += EVENT_HEADER.size + length
+
+                try:
+                    if mask & IN_Q_OVERFLOW:
+                        logging.warning("Media catalog: inotify events lost")
+                        self.catalog.reconcile()
+                        continue
+
+                    if mask & IN_IGNORED:
+                        self.watches.pop(wd, None)
+                        continue
+
+                    if wd not in self.watches:
+                        continue
+                    path = self.watches[wd] / name
+
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            self.add_watch(fd, path)
+                            # files written before the watch was added
+                            for file_path in path.rglob("*"):
+                                self.catalog.update(file_path)
+                        elif mask & (IN_DELETE | IN_MOVED_FROM):
+                            self.catalog.remove(path)
+                        continue
+
+                    if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        self.catalog.update(path)
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        self.catalog.remove(path)
+                except Exception:
+                    logging.exception("Media catalog: error processing an inotify event")
@@ -0,0 +1,108 @@
+"""
+Raspberry Pi worker
+
+registry of the camera jobs (video recording, time lapse, video streaming)
+
+The worker keeps the Popen handle of every job it starts (also the scheduled jobs),
+so the activity checks never need to list the processes.
+"""
+
+import threading
+import datetime
+import os
+import signal
+import logging
+
+
+class Process_registry:
+    """
+    Registry of the running camera jobs (one job per kind)
+    """
+
+    def __init__(self, on_change=None):
+        """
+        on_change: function called when a job is registered, stopped or found finished
+        """
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        # kind -> {"process", "pid", "started_at", "parameters"}
+        self.jobs = {}
+
+    def register(self, kind: str, process, parameters: dict = None):
+        """
+        register a process started by the worker
+        """
+        with self.lock:
+            self.jobs[kind] = {
+                "process": process,
+                "pid": process.pid,
+                "started_at": datetime.datetime.now().replace(microsecond=0).isoformat(),
+                "parameters": {key: parameters[key] for key in parameters if key != "key"} if parameters else {},
+            }
+        logging.info(f"{kind} job registered (PID {process.pid})")
+        self.changed()
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def get(self, kind: str):
+        """
+        return the running job of the kind (or None)
+        """
+        finished = False
+        with self.lock:
+            job = self.jobs.get(kind)
+            if job is not None:
+                if job["process"].poll() is None:
+                    return job
+                logging.info(f"{kind} job finished (PID {job['pid']}, return code {job['process'].returncode})")
+                del self.jobs[kind]
+                finished = True
+
+        if finished:
+            self.changed()
+        return None
+
+    def is_active(self, kind: str) -> bool:
+        """
+        check if a job of the kind is running
+        """
+        return self.get(kind) is not None
+
+    def summary(self) -> dict:
+        """
+        return the PID, the start time and the parameters of all running jobs
+        """
+        output = {}
+        for kind in ("video", "time_lapse", "streaming"):
+            job = self.get(kind)
+            if job is not None:
+                output[kind] = {"pid": job["pid"], "started_at": job["started_at"], "parameters": job["parameters"]}
+        return output
+
+    def stop(self, kind: str, timeout: float = 5) -> bool:
+        """
+        stop the running job of the kind (all processes of the job session are signaled)
+        return True if the job was found
+        """
+        job = self.get(kind)
+        if job is None:
+            return False
+
+        try:
+            if os.getpgid(job["pid"]) == job["pid"]:
+                os.killpg(job["pid"], signal.SIGTERM)
+            else:
+                os.kill(job["pid"], signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            logging.warning(f"{kind} job (PID {job['pid']}) cannot be stopped")
+            return True
+
+        try:
+            job["process"].wait(timeout=timeout)
+        except Exception:
+            logging.warning(f"{kind} job (PID {job['pid']}) still running after {timeout} s")
+
+        self.changed()
+        return True
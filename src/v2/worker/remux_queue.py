@@ -0,0 +1,193 @@
+"""
+Raspberry Pi worker
+
+background remux of the recorded video (H.264 -> MP4)
+
+The raw H.264 files have no timestamps and no index: they cannot be seeked or previewed.
+The finished recordings are wrapped in MP4 (no re-encoding) at the framerate of the recording with the lowest priority:
+
+    nice -n 19 ionice -c 3 MP4Box -fps FRAMERATE -add VIDEO.h264 -new VIDEO.mp4
+
+The MP4 file is written in a temporary directory and moved in the video archive after its checksum file:
+the media catalog lists the H.264 and the MP4 versions of the video.
+
+The remux never runs during a video recording: a remux is not started during a recording
+and a running MP4Box is suspended (SIGSTOP) until the end of the recording (SIGCONT).
+"""
+
+import json
+import pathlib as pl
+import queue
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import logging
+
+import checksum
+import video_segments
+
+SOURCE_SUFFIX, REMUX_SUFFIX = ".h264", ".mp4"
+
+
+class Remux_queue(threading.Thread):
+    """
+    Class for remuxing the recorded video using a thread
+    """
+
+    def __init__(
+        self,
+        catalog,
+        directory: str,
+        tmp_dir,
+        program: str,
+        algorithm: str,
+        is_busy,
+        default_framerate: float,
+        scan_interval: float,
+        min_age: float,
+    ):
+        """
+        catalog: media catalog (the video are found in the catalog, a deleted MP4 file is not remuxed again)
+        directory: video archive directory (relative to the root directory of the catalog)
+        tmp_dir: directory of the MP4 files being written (on the same file system as the archive)
+        program: MP4Box
+        is_busy: function returning True during a video recording
+        default_framerate: framerate of the video not recorded by the worker (scheduled recordings)
+        scan_interval: interval of the search of the video without MP4 version (seconds)
+        min_age: the video modified during the last min_age seconds are not remuxed by the search
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.catalog = catalog
+        self.directory = directory
+        self.video_dir = catalog.root_dir / directory
+        self.tmp_dir = pl.Path(tmp_dir)
+        self.program = program
+        self.algorithm = algorithm
+        self.is_busy = is_busy
+        self.default_framerate = default_framerate
+        self.scan_interval = scan_interval
+        self.min_age = min_age
+        self.files = queue.Queue()
+        # files in the queue (a file found by the search is not added twice)
+        self.pending = set()
+        self.current = ""
+        self.suspended = False
+        self.remuxed = 0
+        self.failed = 0
+
+    def add(self, file_path, framerate: float = None):
+        """
+        add a finished recording to the queue
+        """
+        file_path = pl.Path(file_path)
+        if file_path in self.pending:
+            return
+        self.pending.add(file_path)
+        self.files.put((file_path, framerate))
+
+    def summary(self) -> dict:
+        """
+        return the state of the queue
+        """
+        return {
+            "pending": self.files.qsize(),
+            "current": self.current,
+            "suspended": self.suspended,
+            "remuxed": self.remuxed,
+            "failed": self.failed,
+        }
+
+    def framerate(self, file_path: pl.Path) -> float:
+        """
+        return the framerate of the segment from the manifest of its session (default framerate if not found)
+        """
+        manifest_path = file_path.with_name(file_path.stem.rpartition("_")[0] + video_segments.MANIFEST_SUFFIX)
+        try:
+            return float(json.loads(manifest_path.read_text())["parameters"]["framerate"])
+        except Exception:
+            return self.default_framerate
+
+    def scan(self):
+        """
+        add the video without MP4 version to the queue (recorded before the start of the worker)
+        """
+        for name, _ in self.catalog.list(self.directory, "video"):
+            file_path = self.video_dir / name
+            if file_path.suffix != SOURCE_SUFFIX or self.catalog.known(self.directory, str(pl.Path(name).with_suffix(REMUX_SUFFIX))):
+                continue
+            try:
+                if time.time() - file_path.stat().st_mtime < self.min_age:
+                    continue
+            except FileNotFoundError:
+                continue
+            self.add(file_path, self.framerate(file_path))
+
+    def wait_idle(self):
+        while self.is_busy():
+            time.sleep(1)
+
+    def remux(self, file_path: pl.Path, framerate: float):
+        mp4_path = file_path.with_suffix(REMUX_SUFFIX)
+        tmp_path = self.tmp_dir / mp4_path.name
+        tmp_path.unlink(missing_ok=True)
+
+        command_line = ["nice", "-n", "19"] + (["ionice", "-c", "3"] if shutil.which("ionice") else [])
+        command_line += [self.program, "-fps", f"{framerate:g}", "-add", str(file_path), "-new", str(tmp_path)]
+        logging.info(" ".join(command_line))
+
+        self.current = file_path.name
+        process = subprocess.Popen(command_line, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while process.poll() is None:
+                busy = self.is_busy()
+                if busy != self.suspended:
+                    process.send_signal(signal.SIGSTOP if busy else signal.SIGCONT)
+                    self.suspended = busy
+                    logging.info(f"Remux of {file_path.name} {'suspended' if busy else 'resumed'}")
+                time.sleep(1)
+        finally:
+            if self.suspended:
+                process.send_signal(signal.SIGCONT)
+                self.suspended = False
+            self.current = ""
+
+        if process.returncode or not tmp_path.is_file():
+            logging.warning(f"Remux of {file_path.name} failed (return code {process.returncode})")
+            tmp_path.unlink(missing_ok=True)
+            self.failed += 1
+            return
+
+        try:
+            checksum.write_sidecar(mp4_path, self.algorithm, checksum.file_checksum(tmp_path, self.algorithm))
+        except Exception:
+            logging.warning(f"{self.algorithm} checksum writing failed for {mp4_path}")
+        # the MP4 file appears complete in the archive
+        shutil.move(tmp_path, mp4_path)
+        self.remuxed += 1
+        logging.info(f"{mp4_path.name} written")
+
+    def run(self):
+        logging.info("start remux thread")
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        last_scan = None
+        while True:
+            if (last_scan is None or time.monotonic() - last_scan >= self.scan_interval) and not self.is_busy():
+                self.scan()
+                last_scan = time.monotonic()
+            try:
+                file_path, framerate = self.files.get(timeout=self.scan_interval)
+            except queue.Empty:
+                continue
+
+            self.wait_idle()
+            self.pending.discard(file_path)
+            if not file_path.is_file() or file_path.with_suffix(REMUX_SUFFIX).is_file():
+                continue
+            try:
+                self.remux(file_path, framerate or self.default_framerate)
+            except Exception:
+                logging.exception(f"Remux of {file_path.name} failed")
+                self.failed += 1
@@ -0,0 +1,118 @@
+"""
+Raspberry Pi worker
+
+retention of the archive files (disk space)
+
+When the free space falls below the low watermark, the oldest files acknowledged
+by the coordinator with their checksum (safe files of the media catalog) are deleted until the free space reaches the high watermark.
+The files not acknowledged are never deleted.
+
+The new jobs are admitted according to their projected size: the free space above the floor
+plus the size of the safe files (that can be evicted during the job).
+A job larger than the available space is shortened (or refused if too short).
+"""
+
+import shutil
+import threading
+import time
+import logging
+
+import checksum
+
+GB = 1024 * 1024 * 1024
+
+
+class Retention(threading.Thread):
+    """
+    Class for evicting the safe files of the archive using a thread
+    """
+
+    def __init__(self, catalog, low_watermark: float, high_watermark: float, floor: float, interval: float):
+        """
+        catalog: media catalog (the files of its archive directories are evicted)
+        low_watermark, high_watermark, floor: free space (bytes)
+        interval: interval between the checks of the free space (seconds)
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.catalog = catalog
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.floor = floor
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.evicted = 0
+        self.evicted_size = 0
+
+    def free_space(self) -> int:
+        return shutil.disk_usage(self.catalog.root_dir).free
+
+    def evict(self, target: float) -> int:
+        """
+        delete the oldest safe files until the free space reaches target
+        return the number of deleted files
+        """
+        count = 0
+        with self.lock:
+            while self.free_space() < target:
+                files = self.catalog.evictable()
+                if not files:
+                    logging.warning(f"Retention: no more safe file to delete ({self.free_space() / GB:.2f} Gb free)")
+                    break
+                for directory, name, size in files:
+                    if self.free_space() >= target:
+                        break
+                    file_path = self.catalog.root_dir / directory / name
+                    file_path.unlink(missing_ok=True)
+                    for sidecar_path in checksum.sidecar_paths(file_path):
+                        sidecar_path.unlink(missing_ok=True)
+                    # the catalog is updated immediately (the inotify event arrives later)
+                    self.catalog.remove(file_path)
+                    self.evicted += 1
+                    self.evicted_size += size
+                    count += 1
+                    logging.info(f"Retention: {directory}/{name} deleted ({size} bytes)")
+        return count
+
+    def check(self):
+        """
+        evict the safe files if the free space is below the low watermark
+        """
+        if self.low_watermark and self.free_space() < self.low_watermark:
+            self.evict(self.high_watermark)
+
+    def available(self) -> int:
+        """
+        return the space available for a new job (bytes)
+        """
+        # the safe files are evicted during the job (if the eviction is enabled)
+        return max(0, self.free_space() - int(self.floor) + (self.catalog.safe_size() if self.low_watermark else 0))
+
+    def admit(self, projected_size: float):
+        """
+        return None if the job fits in the available space else the available space (bytes)
+        projected_size: projected size of the job (bytes, 0 if unlimited)
+        """
+        available = self.available()
+        if projected_size and projected_size <= available:
+            return None
+        return available
+
+    def summary(self) -> dict:
+        return {
+            "free": self.free_space(),
+            "safe": self.catalog.safe_size(),
+            "low_watermark": self.low_watermark,
+            "high_watermark": self.high_watermark,
+            "floor": self.floor,
+            "evicted": self.evicted,
+            "evicted_size": self.evicted_size,
+        }
+
+    def run(self):
+        logging.info("start retention thread")
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logging.exception("Retention: error evicting the safe files")
+            time.sleep(self.interval)
@@ -0,0 +1,324 @@
+"""
+Raspberry Pi worker
+
+simulated camera (see the "simulated" backend in camera_backends.py)
+
+Command line compatible with libcamera-vid and libcamera-still (the unknown options are ignored)
+to run and load-test the worker on a computer without camera:
+
+    python3 simulated_camera.py vid --width 1920 --height 1080 --framerate 30 --bitrate 5000000 --timeout 10000 -o video.h264
+    python3 simulated_camera.py vid --timeout 0 --inline --listen -o tcp://0.0.0.0:6000
+    python3 simulated_camera.py vid --initial pause --signal --timeout 20000 -o video.h264
+    python3 simulated_camera.py still --width 1640 --height 1232 -o picture.jpg
+    python3 simulated_camera.py still --width 640 --height 480 -o - > picture.jpg
+    python3 simulated_camera.py still --timeout 60000 --timelapse 5000 -o picture_%04d.jpg
+    python3 simulated_camera.py list
+
+vid: H.264 Annex B stream written in real time at the requested frame rate and bit rate:
+     SPS/PPS with the requested size before every IDR frame (every --intra frames), random slice data
+     (the stream has the structure and the throughput of the encoder output but it cannot be decoded)
+     with --signal, SIGUSR1 switches between recording and pause (the frames are dropped during the pause,
+     the recording restarts with an IDR frame) and SIGUSR2 stops the recording, as libcamera-vid
+still: grey JPEG pictures of the requested size (valid baseline JPEG) padded to the size of a real picture
+list: list of cameras in the format of libcamera-hello --list-cameras
+"""
+
+import argparse
+import datetime
+import os
+import signal
+import socket
+import sys
+import time
+
+MODEL = "simulated"
+SENSOR_WIDTH, SENSOR_HEIGHT = 3280, 2464
+# width, height, max fps, crop (same modes as the imx219 sensor)
+SENSOR_MODES = (
+    (640, 480, 206.65, (1000, 752, 1280, 960)),
+    (1640, 1232, 41.85, (0, 0, 3280, 2464)),
+    (1920, 1080, 47.57, (680, 692, 1920, 1080)),
+    (3280, 2464, 21.19, (0, 0, 3280, 2464)),
+)
+
+DEFAULT_WIDTH, DEFAULT_HEIGHT = 640, 480
+DEFAULT_FRAMERATE = 30
+# duration of the video and of the time lapse when --timeout is not set (ms)
+DEFAULT_TIMEOUT = 5000
+# bit rate used when --bitrate is not set (bits by pixel and by frame)
+DEFAULT_BITS_PER_PIXEL = 0.1
+# size of the pictures (bytes by pixel, about the size of a libcamera-still picture with quality 90)
+JPEG_BYTES_PER_PIXEL = 0.2
+# delay of a single picture when --timeout is not set (seconds)
+STILL_DELAY = 0.2
+
+NAL_START_CODE = b"\x00\x00\x00\x01"
+NAL_SPS, NAL_PPS, NAL_IDR, NAL_SLICE = 0x67, 0x68, 0x65, 0x41
+# the random slice data does not contain null bytes (no start code emulation)
+NO_NULL_BYTE = bytes([1]) + bytes(range(1, 256))
+
+
+class Bit_writer:
+    def __init__(self):
+        self.bits = []
+
+    def u(self, value: int, length: int):
+        self.bits.append(format(value, f"0{length}b") if length else "")
+
+    def ue(self, value: int):
+        """
+        unsigned Exp-Golomb code
+        """
+        code = format(value + 1, "b")
+        self.bits.append("0" * (len(code) - 1) + code)
+
+    def se(self, value: int):
+        self.ue(2 * value - 1 if value > 0 else -2 * value)
+
+    def rbsp(self) -> bytes:
+        """
+        return the bytes with the stop bit and the emulation prevention bytes
+        """
+        bits = "".join(self.bits) + "1"
+        bits += "0" * (-len(bits) % 8)
+        data = int(bits, 2).to_bytes(len(bits) // 8, "big")
+        output, zeros = bytearray(), 0
+        for byte in data:
+            if zeros >= 2 and byte <= 3:
+                output.append(3)
+                zeros = 0
+            output.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        return bytes(output)
+
+
+def sps(width: int, height: int) -> bytes:
+    """
+    sequence parameter set (baseline profile) with the size of the frames
+    """
+    mb_width, mb_height = -(-width // 16), -(-height // 16)
+    writer = Bit_writer()
+    writer.u(66, 8)  # profile_idc (baseline)
+    writer.u(0xC0, 8)  # constraint_set0_flag, constraint_set1_flag
+    writer.u(40, 8)  # level_idc
+    writer.ue(0)  # seq_parameter_set_id
+    writer.ue(0)  # log2_max_frame_num_minus4
+    writer.ue(2)  # pic_order_cnt_type
+    writer.ue(1)  # max_num_ref_frames
+    writer.u(0, 1)  # gaps_in_frame_num_value_allowed_flag
+    writer.ue(mb_width - 1)
+    writer.ue(mb_height - 1)
+    writer.u(1, 1)  # frame_mbs_only_flag
+    writer.u(1, 1)  # direct_8x8_inference_flag
+    crop_right, crop_bottom = (mb_width * 16 - width) // 2, (mb_height * 16 - height) // 2
+    if crop_right or crop_bottom:
+        writer.u(1, 1)
+        for offset in (0, crop_right, 0, crop_bottom):
+            writer.ue(offset)
+    else:
+        writer.u(0, 1)
+    writer.u(0, 1)  # vui_parameters_present_flag
+    return NAL_START_CODE + bytes([NAL_SPS]) + writer.rbsp()
+
+
+def pps() -> bytes:
+    writer = Bit_writer()
+    writer.ue(0)  # pic_parameter_set_id
+    writer.ue(0)  # seq_parameter_set_id
+    writer.u(0, 1)  # entropy_coding_mode_flag
+    writer.u(0, 1)  # bottom_field_pic_order_in_frame_present_flag
+    writer.ue(0)  # num_slice_groups_minus1
+    writer.ue(0)  # num_ref_idx_l0_default_active_minus1
+    writer.ue(0)  # num_ref_idx_l1_default_active_minus1
+    writer.u(0, 1)  # weighted_pred_flag
+    writer.u(0, 2)  # weighted_bipred_idc
+    writer.se(0)  # pic_init_qp_minus26
+    writer.se(0)  # pic_init_qs_minus26
+    writer.se(0)  # chroma_qp_index_offset
+    writer.u(1, 1)  # deblocking_filter_control_present_flag
+    writer.u(0, 1)  # constrained_intra_pred_flag
+    writer.u(0, 1)  # redundant_pic_cnt_present_flag
+    return NAL_START_CODE + bytes([NAL_PPS]) + writer.rbsp()
+
+
+def open_output(output: str, listen: bool):
+    """
+    return a binary stream for the output: file, standard output ("-") or TCP connection (tcp://host:port)
+    """
+    if output == "-":
+        return os.fdopen(sys.stdout.fileno(), "wb", buffering=0, closefd=False)
+
+    if output.startswith("tcp://"):
+        host, port = output[len("tcp://") :].rsplit(":", 1)
+        if listen:
+            with socket.create_server((host, int(port))) as server:
+                connection, _ = server.accept()
+        else:
+            connection = socket.create_connection((host, int(port)))
+        return connection.makefile("wb")
+
+    return open(output, "wb")
+
+
+def record_video(args):
+    width, height = args.width or DEFAULT_WIDTH, args.height or DEFAULT_HEIGHT
+    framerate = args.framerate or DEFAULT_FRAMERATE
+    bitrate = args.bitrate or int(width * height * framerate * DEFAULT_BITS_PER_PIXEL)
+    intra = args.intra or round(framerate)
+
+    header = sps(width, height) + pps()
+    frame_size = max(int(bitrate / 8 / framerate), 16)
+    # random slice data (the frames are slices of the pool)
+    pool = os.urandom(max(2 * frame_size, 1024 * 1024)).translate(NO_NULL_BYTE)
+
+    # recording state changed by the signals (the timeout includes the pause as with libcamera-vid)
+    state = {"paused": args.initial == "pause", "running": True}
+    if args.signal:
+        signal.signal(signal.SIGUSR1, lambda *_: state.update(paused=not state["paused"]))
+        signal.signal(signal.SIGUSR2, lambda *_: state.update(running=False))
+
+    with open_output(args.output, args.listen) as stream:
+        start = time.monotonic()
+        timeout = DEFAULT_TIMEOUT if args.timeout is None else args.timeout
+        end = start + timeout / 1000 if timeout else None
+        frame = 0
+        # frame number of the last IDR frame
+        idr = None
+        while state["running"] and (end is None or start + frame / framerate < end):
+            delay = start + frame / framerate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            if state["paused"]:
+                idr = None
+                frame += 1
+                continue
+
+            offset = (frame * 7919) % (len(pool) - frame_size)
+            if idr is None or (frame - idr) % intra == 0:
+                idr = frame
+                stream.write(header + NAL_START_CODE + bytes([NAL_IDR]) + pool[offset : offset + frame_size])
+            else:
+                stream.write(NAL_START_CODE + bytes([NAL_SLICE]) + pool[offset : offset + frame_size])
+            frame += 1
+
+
+def jpeg(width: int, height: int, level: int) -> bytes:
+    """
+    baseline JPEG of a grey picture (luminance only): one DC coefficient and an end of block by block
+    """
+
+    def segment(marker: int, data: bytes) -> bytes:
+        return bytes([0xFF, marker]) + (len(data) + 2).to_bytes(2, "big") + data
+
+    # quantization table with the value 16 (DC coefficient = (level - 128) / 2)
+    dqt = segment(0xDB, bytes([0]) + bytes([16] * 64))
+    sof = segment(0xC0, bytes([8]) + height.to_bytes(2, "big") + width.to_bytes(2, "big") + bytes([1, 1, 0x11, 0]))
+    # standard DC luminance table, AC table with only the end of block (code "0")
+    dht_dc = segment(0xC4, bytes([0x00, 0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]) + bytes(range(12)))
+    dht_ac = segment(0xC4, bytes([0x10, 1] + [0] * 15) + bytes([0]))
+    sos = segment(0xDA, bytes([1, 1, 0x00, 0, 63, 0]))
+
+    dc_codes = ("00", "010", "011", "100", "101", "110", "1110", "11110", "111110")
+    value = (level - 128) // 2
+    category = abs(value).bit_length()
+    amplitude = format(value if value >= 0 else value + (1 << category) - 1, f"0{category}b") if category else ""
+    blocks = -(-width // 8) * -(-height // 8)
+    # first block: DC value and end of block, other blocks: DC difference 0 ("00") and end of block ("0")
+    bits = dc_codes[category] + amplitude + "0" + "000" * (blocks - 1)
+    bits += "1" * (-len(bits) % 8)
+    scan = int(bits, 2).to_bytes(len(bits) // 8, "big").replace(b"\xff", b"\xff\x00")
+
+    jfif = segment(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+    comment = segment(0xFE, f"{MODEL} {datetime.datetime.now().isoformat()}".encode("utf-8"))
+    picture = b"\xff\xd8" + jfif + comment + dqt + sof + dht_dc + dht_ac + sos + scan + b"\xff\xd9"
+
+    # padding with comments (size of a real picture)
+    padding = b""
+    missing = int(width * height * JPEG_BYTES_PER_PIXEL) - len(picture)
+    while missing > 4:
+        length = min(missing - 4, 65533)
+        padding += segment(0xFE, os.urandom(length))
+        missing -= length + 4
+    return picture[:2] + padding + picture[2:]
+
+
+def write_picture(path: str, width: int, height: int, number: int):
+    with open_output(path, False) as f_out:
+        f_out.write(jpeg(width, height, (64 + number * 37) % 192 + 32))
+
+
+def take_pictures(args):
+    width, height = args.width or DEFAULT_WIDTH, args.height or DEFAULT_HEIGHT
+
+    if not args.timelapse:
+        time.sleep(args.timeout / 1000 if args.timeout else STILL_DELAY)
+        write_picture(args.output, width, height, 0)
+        return
+
+    # time lapse: one picture every --timelapse ms during --timeout ms (%d in the output is the picture number)
+    timeout = DEFAULT_TIMEOUT if args.timeout is None else args.timeout
+    start = time.monotonic()
+    number = 0
+    while not timeout or number * args.timelapse < timeout:
+        delay = start + number * args.timelapse / 1000 - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        write_picture(args.output % number if "%" in args.output else args.output, width, height, number)
+        number += 1
+
+
+def camera_list() -> str:
+    """
+    return the list of cameras (output of libcamera-hello --list-cameras)
+    """
+    modes = [
+        f"{width}x{height} [{fps:.2f} fps - ({x}, {y})/{crop_width}x{crop_height} crop]"
+        for width, height, fps, (x, y, crop_width, crop_height) in SENSOR_MODES
+    ]
+    indent = " " * len("    Modes: 'SRGGB10_CSI2P' : ")
+    return "\n".join(
+        [
+            "Available cameras",
+            "-----------------",
+            f"0 : {MODEL} [{SENSOR_WIDTH}x{SENSOR_HEIGHT}] ({MODEL})",
+            f"    Modes: 'SRGGB10_CSI2P' : {modes[0]}",
+        ]
+        + [indent + x for x in modes[1:]]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated camera")
+    parser.add_argument("mode", choices=("vid", "still", "list"))
+    parser.add_argument("-o", "--output", default="-")
+    parser.add_argument("--width", type=int, default=0)
+    parser.add_argument("--height", type=int, default=0)
+    parser.add_argument("-t", "--timeout", type=int, default=None, help="duration (ms), 0 for no limit")
+    parser.add_argument("--framerate", type=float, default=0)
+    parser.add_argument("-b", "--bitrate", type=int, default=0, help="bits by second")
+    parser.add_argument("--intra", type=int, default=0, help="number of frames between two IDR frames")
+    parser.add_argument("--timelapse", type=int, default=0, help="interval between two pictures (ms)")
+    parser.add_argument("-l", "--listen", action="store_true")
+    parser.add_argument("--initial", choices=("record", "pause"), default="record")
+    parser.add_argument("-s", "--signal", action="store_true", help="SIGUSR1 switches between recording and pause")
+    # the other options of libcamera-vid and libcamera-still are ignored
+    args, _ = parser.parse_known_args()
+
+    if args.mode == "list":
+        print(camera_list())
+        return
+
+    try:
+        if args.mode == "vid":
+            record_video(args)
+        else:
+            take_pictures(args)
+    except (BrokenPipeError, ConnectionError):
+        pass
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
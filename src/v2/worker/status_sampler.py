@@ -0,0 +1,115 @@
+"""
+Raspberry Pi worker
+
+background sampler of the status metrics
+
+A single thread refreshes every metric on its own interval
+and stores the values in a shared snapshot, so the /status route does not
+have to fork any process.
+"""
+
+import threading
+import time
+import logging
+
+
+class Status_sampler(threading.Thread):
+    """
+    Class for sampling the status metrics using a thread
+    """
+
+    def __init__(self, on_change=None):
+        """
+        on_change: function called with the name, the previous value and the new value of a metric that changed
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.wake_up = threading.Event()
+        # metric name -> {"function", "interval", "value", "sampled_at", "next_sampling"}
+        self.metrics = {}
+
+    def register(self, name: str, function, interval: float, default="not determined"):
+        """
+        register a metric that will be refreshed every interval seconds
+        """
+        with self.lock:
+            self.metrics[name] = {
+                "function": function,
+                "interval": interval,
+                "value": default,
+                "sampled_at": None,
+                "next_sampling": 0,
+            }
+        self.wake_up.set()
+
+    def sample(self, name: str):
+        """
+        sample the metric immediately, update the snapshot and return the new value
+        """
+        function = self.metrics[name]["function"]
+        try:
+            value = function()
+        except Exception:
+            logging.warning(f"Status sampler: error sampling {name}")
+            # retry at the next interval
+            with self.lock:
+                self.metrics[name]["next_sampling"] = time.monotonic() + self.metrics[name]["interval"]
+            return self.get(name)
+
+        with self.lock:
+            previous = self.metrics[name]["value"]
+            self.metrics[name]["value"] = value
+            self.metrics[name]["sampled_at"] = time.monotonic()
+            self.metrics[name]["next_sampling"] = time.monotonic() + self.metrics[name]["interval"]
+
+        if self.on_change is not None and value != previous:
+            try:
+                self.on_change(name, previous, value)
+            except Exception:
+                logging.warning(f"Status sampler: error notifying the change of {name}")
+        return value
+
+    def refresh(self, *names):
+        """
+        ask the thread to sample the metrics as soon as possible (all metrics if no name)
+        """
+        with self.lock:
+            for name in names if names else self.metrics:
+                self.metrics[name]["next_sampling"] = 0
+        self.wake_up.set()
+
+    def get(self, name: str):
+        """
+        return the last sampled value of the metric
+        """
+        with self.lock:
+            return self.metrics[name]["value"]
+
+    def snapshot(self) -> tuple:
+        """
+        return the last sampled values and the age (in seconds) of each sample
+        """
+        now = time.monotonic()
+        with self.lock:
+            values = {name: metric["value"] for name, metric in self.metrics.items()}
+            ages = {
+                name: (round(now - metric["sampled_at"], 3) if metric["sampled_at"] is not None else None)
+                for name, metric in self.metrics.items()
+            }
+        return values, ages
+
+    def run(self):
+        logging.info("start status sampler thread")
+        while True:
+            self.wake_up.clear()
+
+            with self.lock:
+                due = [name for name, metric in self.metrics.items() if metric["next_sampling"] <= time.monotonic()]
+            for name in due:
+                self.sample(name)
+
+            with self.lock:
+                next_sampling = min((metric["next_sampling"] for metric in self.metrics.values()), default=None)
+
+            self.wake_up.wait(timeout=None if next_sampling is None else max(0, next_sampling - time.monotonic()))
@@ -0,0 +1,155 @@
+"""
+Raspberry Pi worker
+
+client of the warm camera daemon (still_daemon.py)
+
+The daemon keeps the camera open: it must be stopped before any other use of the camera
+(video recording, time lapse, video streaming). It is started again when the camera is free.
+"""
+
+import json
+import pathlib as pl
+import socket
+import subprocess
+import threading
+import time
+import logging
+
+# parameters of /take_picture supported by the daemon (the others require libcamera-still)
+DAEMON_PARAMETERS = ("width", "height", "rotation", "hflip", "vflip", "brightness", "contrast", "saturation", "sharpness", "gain")
+
+
+class Still_daemon_client:
+    """
+    Management of the warm camera daemon
+    """
+
+    def __init__(self, python: str, socket_path, idle_timeout: float, width: int, height: int, timeout: float = 10):
+        """
+        python: interpreter with the picamera2 module
+        socket_path: path of the unix socket of the daemon
+        idle_timeout: the daemon releases the camera after idle_timeout seconds without request
+        width, height: initial resolution
+        timeout: maximum time for the start of the daemon and for a capture (seconds)
+        """
+        self.python = python
+        self.socket_path = pl.Path(socket_path)
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.idle_timeout = idle_timeout
+        self.width, self.height = width, height
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.process = None
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def request(self, message: dict, timeout: float) -> dict:
+        """
+        send a request to the daemon and return the reply
+        the data sent after the reply (size bytes) are in the "data" field
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(str(self.socket_path))
+            with client.makefile("rwb") as stream:
+                stream.write(json.dumps(message).encode("utf-8") + b"\n")
+                stream.flush()
+                reply = json.loads(stream.readline())
+                if reply.get("size"):
+                    reply["data"] = stream.read(reply["size"])
+                    if len(reply["data"]) != reply["size"]:
+                        raise ConnectionError("Incomplete picture")
+                return reply
+
+    def _start(self) -> bool:
+        if self.is_running():
+            return True
+
+        self.socket_path.unlink(missing_ok=True)
+        try:
+            self.process = subprocess.Popen(
+                [
+                    self.python,
+                    str(pl.Path(__file__).resolve().parent / "still_daemon.py"),
+                    str(self.socket_path),
+                    str(self.idle_timeout),
+                    str(self.width),
+                    str(self.height),
+                ],
+                start_new_session=True,
+            )
+        except Exception:
+            logging.warning("The still daemon cannot be started")
+            return False
+
+        # the socket is created when the camera is started and converged
+        end = time.monotonic() + self.timeout
+        while time.monotonic() < end and self.process.poll() is None:
+            try:
+                if not self.request({"command": "ping"}, 1)["error"]:
+                    logging.info(f"Still daemon started (PID {self.process.pid})")
+                    return True
+            except Exception:
+                time.sleep(0.1)
+
+        logging.warning("The still daemon did not start")
+        self._stop()
+        return False
+
+    def _stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            logging.info("Still daemon stopped: camera released")
+        self.process = None
+
+    def start(self) -> bool:
+        """
+        start the daemon (if not running) and wait until it is ready
+        """
+        with self.lock:
+            return self._start()
+
+    def stop(self):
+        """
+        stop the daemon to release the camera
+        """
+        with self.lock:
+            self._stop()
+
+    def supported(self, parameters: dict) -> bool:
+        """
+        check if the daemon can take the picture with the parameters
+        """
+        return all(x in DAEMON_PARAMETERS for x in parameters)
+
+    def capture(self, path, parameters: dict):
+        """
+        take a picture with the daemon (in memory if path is None: the JPEG data are in the "data" field of the reply)
+        return the reply of the daemon (with the latency) or None if the picture was not taken
+        """
+        if path is None:
+            message = {"command": "snapshot", "parameters": parameters}
+        else:
+            message = {"command": "capture", "path": str(path), "parameters": parameters}
+        with self.lock:
+            if not self._start():
+                return None
+            try:
+                reply = self.request(message, self.timeout)
+            except Exception:
+                logging.warning("No reply from the still daemon")
+                self._stop()
+                return None
+
+        if reply.get("error", True):
+            logging.warning(f"Still daemon: {reply.get('msg', 'error')}")
+            return None
+        return reply
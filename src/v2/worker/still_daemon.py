@@ -0,0 +1,168 @@
+"""
+Raspberry Pi worker
+
+warm camera daemon for the single pictures (started by the worker, see still_capture.py)
+
+The camera is kept open and converged (AGC/AWB) with picamera2 (sudo apt install python3-picamera2):
+a picture is the next frame of the running stream instead of a new libcamera-still process.
+
+Requests on a unix socket (one JSON object by line, one request by connection):
+    {"command": "capture", "path": "/path/of/picture.jpg", "parameters": {"width": "1640", "height": "1232", "hflip": "True"}}
+    {"command": "snapshot", "parameters": {"width": "640", "height": "480"}}
+    {"command": "ping"}
+Reply:
+    {"error": false, "latency": 0.045}  (seconds between the request and the picture written)
+    {"error": false, "latency": 0.045, "size": 52114} followed by the JPEG data (snapshot)
+    {"error": true, "msg": "..."}
+
+The camera is released when the daemon exits (SIGTERM or idle_timeout seconds without request).
+
+usage: python3 still_daemon.py SOCKET_PATH IDLE_TIMEOUT WIDTH HEIGHT
+"""
+
+import io
+import json
+import os
+import pathlib as pl
+import signal
+import socket
+import sys
+import time
+import logging
+
+from picamera2 import Picamera2
+from libcamera import Transform
+
+# libcamera-still options -> libcamera controls
+CONTROLS = {
+    "brightness": "Brightness",
+    "contrast": "Contrast",
+    "saturation": "Saturation",
+    "sharpness": "Sharpness",
+    "gain": "AnalogueGain",
+}
+# parameters changing the camera configuration
+CONFIGURATION_PARAMETERS = ("width", "height", "rotation", "hflip", "vflip")
+
+JPEG_QUALITY = 90
+# frames dropped after a change of the controls (they are applied with a delay of a few frames)
+SETTLE_FRAMES = 3
+# convergence of AGC/AWB after a new configuration (seconds)
+CONVERGENCE_DELAY = 1
+
+
+class Still_daemon:
+    def __init__(self, width: int, height: int):
+        self.camera = Picamera2()
+        self.camera.options["quality"] = JPEG_QUALITY
+        self.configuration_key = None
+        self.controls = {}
+        self.configure({"width": width, "height": height})
+
+    def configure(self, parameters: dict):
+        """
+        reconfigure the camera if the size or the orientation changed and apply the controls
+        """
+        hflip = str(parameters.get("hflip", "False")) == "True"
+        vflip = str(parameters.get("vflip", "False")) == "True"
+        if str(parameters.get("rotation", "0")) == "180":
+            hflip, vflip = not hflip, not vflip
+        key = (int(parameters["width"]), int(parameters["height"]), hflip, vflip)
+
+        controls = {CONTROLS[x]: float(parameters[x]) for x in parameters if x in CONTROLS}
+        if set(self.controls) - set(controls):
+            # the removed controls are reset with a new configuration
+            self.configuration_key = None
+
+        if key != self.configuration_key:
+            self.camera.stop()
+            self.camera.configure(
+                self.camera.create_still_configuration(main={"size": key[:2]}, transform=Transform(hflip=hflip, vflip=vflip))
+            )
+            if controls:
+                self.camera.set_controls(controls)
+            self.camera.start()
+            time.sleep(CONVERGENCE_DELAY)
+            self.configuration_key = key
+            self.controls = controls
+            logging.info(f"Camera configured: {key} {controls}")
+
+        if controls != self.controls:
+            self.camera.set_controls(controls)
+            for _ in range(SETTLE_FRAMES):
+                self.camera.capture_metadata()
+            self.controls = controls
+
+    def capture(self, path, parameters: dict) -> tuple:
+        """
+        take a picture in the file (path) or in memory (path None)
+        return the reply and the JPEG data (in memory only)
+        """
+        start = time.monotonic()
+        unknown = [x for x in parameters if x not in CONFIGURATION_PARAMETERS and x not in CONTROLS]
+        if unknown:
+            return {"error": True, "msg": f"Parameters not supported: {', '.join(unknown)}"}, b""
+        self.configure({"width": self.configuration_key[0], "height": self.configuration_key[1], **parameters})
+
+        if path is None:
+            stream = io.BytesIO()
+            self.camera.capture_file(stream, format="jpeg")
+            data = stream.getvalue()
+            return {"error": False, "latency": round(time.monotonic() - start, 4), "size": len(data)}, data
+
+        # the picture is renamed when complete (the media catalog is notified by the rename)
+        part_path = f"{path}.part"
+        self.camera.capture_file(part_path, format="jpeg")
+        os.replace(part_path, path)
+        return {"error": False, "latency": round(time.monotonic() - start, 4)}, b""
+
+    def handle(self, request: dict) -> tuple:
+        """
+        return the reply and the data sent after the reply
+        """
+        if request.get("command") == "ping":
+            return {"error": False}, b""
+        if request.get("command") == "capture":
+            return self.capture(request["path"], request.get("parameters", {}))
+        if request.get("command") == "snapshot":
+            return self.capture(None, request.get("parameters", {}))
+        return {"error": True, "msg": f"Unknown command: {request.get('command')}"}, b""
+
+    def serve(self, socket_path: str, idle_timeout: float):
+        pl.Path(socket_path).unlink(missing_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(4)
+        server.settimeout(idle_timeout if idle_timeout > 0 else None)
+        logging.info(f"Still daemon listening on {socket_path}")
+        try:
+            while True:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    logging.info("Still daemon idle: camera released")
+                    break
+                with connection, connection.makefile("rwb") as stream:
+                    try:
+                        reply, data = self.handle(json.loads(stream.readline()))
+                    except Exception as exc:
+                        reply, data = {"error": True, "msg": str(exc)}, b""
+                    stream.write(json.dumps(reply).encode("utf-8") + b"\n" + data)
+                    stream.flush()
+        finally:
+            server.close()
+            pl.Path(socket_path).unlink(missing_ok=True)
+            self.camera.close()
+
+
+def main():
+    logging.basicConfig(format="%(asctime)s, still daemon: %(message)s", level=logging.INFO)
+    # the camera is released by the finally clauses
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    socket_path, idle_timeout, width, height = sys.argv[1], float(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+    Still_daemon(width, height).serve(socket_path, idle_timeout)
+
+
+if __name__ == "__main__":
+    main()
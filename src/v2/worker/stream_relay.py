@@ -0,0 +1,248 @@
+"""
+Raspberry Pi worker
+
+relay of the live video stream (/video_streaming/start)
+
+The encoder output (H.264 Annex B on a pipe, SPS/PPS repeated before every IDR frame with --inline)
+is read once and sent to all the viewers:
+    raw H.264 over TCP (port STREAMING_PORT, for example: ffplay tcp://IP:6000 or vlc tcp/h264://IP:6000)
+    raw H.264 over HTTP (/live_stream route, for example: ffplay "http://IP:5000/live_stream?key=...")
+
+Every viewer has a bounded queue of frames: when the queue of a slow viewer is full, its frames are dropped
+until the next IDR frame (the stream remains decodable). The encoder and the other viewers never wait.
+"""
+
+import queue
+import socket
+import threading
+import os
+import logging
+
+START_CODE = b"\x00\x00\x01"
+NAL_IDR, NAL_SLICE = 5, 1
+READ_SIZE = 65536
+# socket buffer of the TCP viewers: a large kernel buffer would hide the slow viewers (latency) from the frame queue
+SEND_BUFFER_SIZE = 256 * 1024
+
+
+def access_units(stream):
+    """
+    read the H.264 byte stream (file object) and yield the access units (NAL units up to a slice) and the IDR flag
+    (one slice by frame, as written by libcamera-vid and raspivid)
+    """
+    buffer = b""
+    unit = []
+    keyframe = False
+    while chunk := os.read(stream.fileno(), READ_SIZE):
+        buffer += chunk
+        start = buffer.find(START_CODE)
+        while start != -1:
+            end = buffer.find(START_CODE, start + len(START_CODE))
+            if end == -1:
+                break
+            # the leading null byte of a 4-byte start code belongs to the next NAL unit
+            nal_end = end - 1 if buffer[end - 1] == 0 else end
+            nal_type = buffer[start + len(START_CODE)] & 0x1F
+            unit.append(buffer[start:nal_end])
+            keyframe = keyframe or nal_type == NAL_IDR
+            if nal_type in (NAL_IDR, NAL_SLICE):
+                yield (b"\x00" + b"\x00".join(unit)), keyframe
+                unit, keyframe = [], False
+            buffer = buffer[nal_end:]
+            start = buffer.find(START_CODE)
+
+    if buffer.find(START_CODE) != -1:
+        unit.append(buffer[buffer.find(START_CODE) :])
+        yield (b"\x00" + b"\x00".join(unit)), keyframe
+
+
+class Relay_client:
+    """
+    Viewer of the stream
+    """
+
+    def __init__(self, name: str, queue_size: int):
+        self.name = name
+        self.frames = queue.Queue(queue_size)
+        # a viewer starts with an IDR frame (the frames before are not counted as dropped)
+        self.waiting_keyframe = True
+        self.started = False
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, frame: bytes, keyframe: bool):
+        """
+        add a frame to the queue (never blocks)
+        """
+        if keyframe and self.waiting_keyframe:
+            # the old frames cannot be decoded without the frames dropped before
+            while not self.frames.empty():
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+            self.waiting_keyframe = False
+            self.started = True
+
+        if self.waiting_keyframe:
+            self.dropped += self.started
+            return
+
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+            self.waiting_keyframe = True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.frames.put_nowait(b"")
+        except queue.Full:
+            pass
+
+    def get(self, timeout: float = None):
+        """
+        return the next frame, b"" at the end of the stream or None after timeout seconds without frame
+        """
+        if self.closed and self.frames.empty():
+            return b""
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Stream_relay:
+    """
+    Fan-out of the encoder output to the viewers
+    """
+
+    def __init__(self, port: int, queue_size: int, max_clients: int, send_timeout: float):
+        """
+        port: TCP port of the raw H.264 stream
+        queue_size: number of frames buffered by viewer
+        max_clients: maximum number of viewers (TCP and HTTP)
+        send_timeout: a viewer is disconnected if a frame cannot be sent during send_timeout seconds
+        """
+        self.port = port
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.send_timeout = send_timeout
+        self.lock = threading.Lock()
+        self.clients = []
+        self.running = False
+
+    def add_client(self, name: str):
+        """
+        return a new viewer (None if the stream is not running or if there are too many viewers)
+        """
+        with self.lock:
+            if not self.running or len(self.clients) >= self.max_clients:
+                return None
+            client = Relay_client(name, self.queue_size)
+            self.clients.append(client)
+        logging.info(f"Stream viewer connected: {name}")
+        return client
+
+    def remove_client(self, client: Relay_client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        logging.info(f"Stream viewer disconnected: {client.name} ({client.sent} frames sent, {client.dropped} dropped)")
+
+    def summary(self) -> list:
+        """
+        return the viewers with the number of frames sent and dropped
+        """
+        with self.lock:
+            return [{"name": x.name, "sent": x.sent, "dropped": x.dropped} for x in self.clients]
+
+    def publish(self, frame: bytes, keyframe: bool):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.offer(frame, keyframe)
+
+    def serve_tcp(self, server):
+        """
+        accept the TCP viewers
+        """
+        while self.running:
+            try:
+                connection, address = server.accept()
+            except OSError:
+                break
+            client = self.add_client(f"tcp {address[0]}:{address[1]}")
+            if client is None:
+                connection.close()
+                continue
+            threading.Thread(target=self.send_tcp, args=(connection, client), daemon=True).start()
+
+    def send_tcp(self, connection, client: Relay_client):
+        connection.settimeout(self.send_timeout)
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+        try:
+            while frame := client.get():
+                connection.sendall(frame)
+                client.sent += 1
+        except OSError:
+            pass
+        finally:
+            connection.close()
+            self.remove_client(client)
+
+    def http_stream(self, client: Relay_client):
+        """
+        yield the frames for an HTTP response
+        """
+        try:
+            while True:
+                frame = client.get(self.send_timeout)
+                if frame is None:
+                    continue
+                if not frame:
+                    break
+                yield frame
+                client.sent += 1
+        finally:
+            self.remove_client(client)
+
+    def run(self, process):
+        """
+        relay the output of the encoder process until its end
+        """
+        try:
+            server = socket.create_server(("0.0.0.0", self.port))
+        except OSError:
+            logging.warning(f"Port {self.port} not available: the stream is only relayed over HTTP")
+            server = None
+
+        self.running = True
+        if server is not None:
+            threading.Thread(target=self.serve_tcp, args=(server,), daemon=True).start()
+
+        logging.info("Stream relay started")
+        try:
+            for frame, keyframe in access_units(process.stdout):
+                self.publish(frame, keyframe)
+        except Exception:
+            logging.warning("Error reading the encoder output")
+        finally:
+            self.running = False
+            if server is not None:
+                # wake up the accept
+                try:
+                    server.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                server.close()
+            with self.lock:
+                clients = list(self.clients)
+            for client in clients:
+                client.close()
+            process.stdout.close()
+            process.wait()
+            logging.info("Stream relay stopped")
@@ -0,0 +1,125 @@
+"""
+Raspberry Pi worker
+
+streaming of archive files as an uncompressed tar (generated on the fly, no temporary file)
+
+The first member of the tar is a JSON manifest (MANIFEST_NAME) with the name, the size and the
+stored checksum of every file of the bundle.
+The sizes are taken when the bundle is prepared (the Content-Length is known in advance):
+a file that shrinks during the transfer is padded with zeros and fails the verification on the client side.
+"""
+
+import tarfile
+import json
+import time
+import pathlib as pl
+import logging
+
+MANIFEST_NAME = ".bundle_manifest.json"
+
+# size of the chunks sent to the client
+CHUNK_SIZE = 256 * 1024
+
+
+def tar_header(name: str, size: int, mtime: float) -> bytes:
+    """
+    return the tar header of a regular file (a PAX header is added for the long names)
+    """
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+
+
+def padding(size: int) -> int:
+    """
+    return the number of zero bytes to complete the last block of a member
+    """
+    return -size % tarfile.BLOCKSIZE
+
+
+class Tar_bundle:
+    """
+    tar stream of files of an archive directory
+    """
+
+    def __init__(self, directory, entries: list, extra: dict = None):
+        """
+        directory: path of the archive directory
+        entries: catalog entries of the files (name, checksum, algorithm)
+        extra: additional values of the manifest (cursor of the listing...)
+        """
+        self.directory = pl.Path(directory)
+        self.files = []
+        for entry in entries:
+            try:
+                file_stat = (self.directory / entry["name"]).stat()
+            except Exception:
+                # deleted since the listing
+                continue
+            self.files.append(
+                {
+                    "name": entry["name"],
+                    "size": file_stat.st_size,
+                    "mtime": file_stat.st_mtime,
+                    "checksum": entry.get("checksum", ""),
+                    "algorithm": entry.get("algorithm", ""),
+                }
+            )
+
+        self.manifest = json.dumps(
+            {
+                "files": [{key: x[key] for key in ("name", "size", "checksum", "algorithm")} for x in self.files],
+                **(extra or {}),
+            }
+        ).encode("utf-8")
+
+    def content_length(self) -> int:
+        """
+        return the size of the tar stream
+        """
+        length = len(tar_header(MANIFEST_NAME, len(self.manifest), 0)) + len(self.manifest) + padding(len(self.manifest))
+        for file in self.files:
+            length += len(tar_header(file["name"], file["size"], file["mtime"])) + file["size"] + padding(file["size"])
+        # end of archive
+        return length + 2 * tarfile.BLOCKSIZE
+
+    def file_content(self, file: dict):
+        """
+        yield exactly the declared size of the file content
+        """
+        remaining = file["size"]
+        try:
+            with open(self.directory / file["name"], "rb") as f_in:
+                while remaining and (chunk := f_in.read(min(CHUNK_SIZE, remaining))):
+                    remaining -= len(chunk)
+                    yield chunk
+        except Exception:
+            logging.warning(f"Error reading {file['name']} for the tar bundle")
+        if remaining:
+            logging.warning(f"{file['name']} changed during the tar bundle transfer")
+            yield bytes(remaining)
+
+    def generate(self):
+        """
+        yield the tar stream by chunks of about CHUNK_SIZE bytes
+        """
+        start = time.time()
+        buffer = bytearray(tar_header(MANIFEST_NAME, len(self.manifest), start))
+        buffer += self.manifest + bytes(padding(len(self.manifest)))
+
+        for file in self.files:
+            buffer += tar_header(file["name"], file["size"], file["mtime"])
+            for chunk in self.file_content(file):
+                # the small files (pictures) are grouped
+                if buffer and len(buffer) + len(chunk) > CHUNK_SIZE:
+                    yield bytes(buffer)
+                    buffer.clear()
+                buffer += chunk
+            buffer += bytes(padding(file["size"]))
+
+        buffer += bytes(2 * tarfile.BLOCKSIZE)
+        yield bytes(buffer)
+
+        logging.info(f"Tar bundle of {len(self.files)} files sent in {time.time() - start:.1f} s")
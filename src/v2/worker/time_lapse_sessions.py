@@ -0,0 +1,192 @@
+"""
+Raspberry Pi worker
+
+time lapse sessions
+
+Every time lapse writes its pictures in a new session directory of the time lapse archive:
+
+    pictures_archive/HOSTNAME_2023-11-14_101500/session.json       (session id, start time, parameters, clock offset)
+    pictures_archive/HOSTNAME_2023-11-14_101500/2023-11-14/10/HOSTNAME_0001.jpg   (hour sharding)
+    pictures_archive/HOSTNAME_2023-11-14_101500/2023-11-14/HOSTNAME_0001.jpg      (date sharding)
+    pictures_archive/HOSTNAME_2023-11-14_101500/HOSTNAME_0001.jpg                 (no sharding)
+
+With sharding, the camera writes the pictures in the hidden .incoming directory of the session (not listed)
+and the sharder moves every closed picture in the directory of its capture date or hour.
+"""
+
+import datetime
+import json
+import os
+import pathlib as pl
+import threading
+import time
+import logging
+
+SESSION_FILE = "session.json"
+INCOMING_DIR = ".incoming"
+SHARD_FORMATS = {"": "", "date": "%Y-%m-%d", "hour": "%Y-%m-%d/%H"}
+# an incomplete session is finished when the time lapse is no longer active
+# (a session without picture is kept SESSION_GRACE seconds: the scheduled time lapse creates its session before starting)
+SESSION_GRACE = 60
+
+
+def now_iso() -> str:
+    return datetime.datetime.now().replace(microsecond=0).isoformat()
+
+
+def write_session(session_dir: pl.Path, session: dict):
+    """
+    write the session file (complete file renamed)
+    """
+    tmp_path = session_dir / f"{SESSION_FILE}.part"
+    tmp_path.write_text(json.dumps(session, indent=1))
+    os.replace(tmp_path, session_dir / SESSION_FILE)
+
+
+def read_session(session_dir: pl.Path):
+    """
+    return the content of the session file (None if not found or not valid)
+    """
+    try:
+        return json.loads((pl.Path(session_dir) / SESSION_FILE).read_text())
+    except Exception:
+        return None
+
+
+def new_session(archive_dir, hostname: str, sharding: str, parameters: dict, clock_offset: dict = None) -> tuple:
+    """
+    create the directory and the session file of a new time lapse
+    clock_offset: last offset of the worker clock measured by the coordinator (see clock_sync.py)
+    return the session id and the output path of the camera program (with %04d for the picture number)
+    """
+    if sharding not in SHARD_FORMATS:
+        logging.warning(f"Time lapse sharding {sharding} not valid: no sharding")
+        sharding = ""
+    started_at = datetime.datetime.now().replace(microsecond=0)
+    session_id = f"{hostname}_{started_at.isoformat().replace('T', '_').replace(':', '')}"
+    session_dir = pl.Path(archive_dir) / session_id
+    # two sessions in the same second
+    idx = 1
+    while session_dir.exists():
+        idx += 1
+        session_id = f"{hostname}_{started_at.isoformat().replace('T', '_').replace(':', '')}_{idx}"
+        session_dir = pl.Path(archive_dir) / session_id
+
+    output_dir = session_dir / INCOMING_DIR if sharding else session_dir
+    output_dir.mkdir(parents=True)
+    write_session(
+        session_dir,
+        {
+            "session": session_id,
+            "started_at": started_at.isoformat(),
+            "ended_at": None,
+            "complete": False,
+            "sharding": sharding,
+            "parameters": {key: parameters[key] for key in parameters if key != "key"},
+            "clock_offset": clock_offset,
+        },
+    )
+    return session_id, str(output_dir / f"{hostname}_%04d.jpg")
+
+
+def session_dir(archive_dir, session_id: str):
+    """
+    return the directory of the session (None if the session id is not valid)
+    """
+    if not session_id or "/" in session_id or session_id.startswith("."):
+        return None
+    path = pl.Path(archive_dir) / session_id
+    return path if (path / SESSION_FILE).is_file() else None
+
+
+def list_sessions(archive_dir) -> list:
+    """
+    return the content of the session files of the archive (ordered by start time)
+    """
+    sessions = []
+    for path in pl.Path(archive_dir).glob(f"*/{SESSION_FILE}"):
+        session = read_session(path.parent)
+        if session is not None:
+            sessions.append(session)
+    return sorted(sessions, key=lambda x: x["started_at"])
+
+
+class Session_sharder(threading.Thread):
+    """
+    Class for moving the pictures of the time lapse sessions in their shard directories using a thread
+    """
+
+    def __init__(self, archive_dir, is_active, interval: float):
+        """
+        is_active: function returning True when a time lapse is running
+        interval: interval between the moves (seconds)
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.archive_dir = pl.Path(archive_dir)
+        self.is_active = is_active
+        self.interval = interval
+
+    def move_pictures(self, session_dir: pl.Path, sharding: str, closed_only: bool) -> int:
+        """
+        move the pictures of the .incoming directory in their shard directory
+        closed_only: the last picture (being written by the camera) is not moved
+        """
+        incoming_dir = session_dir / INCOMING_DIR
+        if not incoming_dir.is_dir():
+            return 0
+        pictures = sorted(((x.stat().st_mtime, x.name, x) for x in incoming_dir.glob("*.jpg")), key=lambda x: x[:2])
+        if closed_only:
+            pictures = pictures[:-1]
+        for mtime, _, picture_path in pictures:
+            shard_dir = session_dir / datetime.datetime.fromtimestamp(mtime).strftime(SHARD_FORMATS[sharding])
+            shard_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(picture_path, shard_dir / picture_path.name)
+        return len(pictures)
+
+    def finish(self, session_dir: pl.Path, session: dict):
+        """
+        mark the session as complete with its number of pictures
+        """
+        if session.get("sharding", ""):
+            self.move_pictures(session_dir, session["sharding"], closed_only=False)
+            try:
+                (session_dir / INCOMING_DIR).rmdir()
+            except OSError:
+                pass
+        session["ended_at"] = now_iso()
+        session["complete"] = True
+        session["pictures"] = sum(1 for _ in session_dir.rglob("*.jpg"))
+        write_session(session_dir, session)
+        logging.info(f"Time lapse session {session['session']} complete ({session['pictures']} pictures)")
+
+    def update(self):
+        """
+        move the closed pictures of the running session and finish the other sessions
+        """
+        incomplete = [x for x in list_sessions(self.archive_dir) if not x.get("complete", True)]
+        active = self.is_active()
+        for session in incomplete:
+            session_dir = self.archive_dir / session["session"]
+            # only the last session can be running
+            running = session is incomplete[-1] and (
+                active
+                or (
+                    time.time() - datetime.datetime.fromisoformat(session["started_at"]).timestamp() < SESSION_GRACE
+                    and not any(session_dir.rglob("*.jpg"))
+                )
+            )
+            if running:
+                if session.get("sharding", ""):
+                    self.move_pictures(session_dir, session["sharding"], closed_only=True)
+            else:
+                self.finish(session_dir, session)
+
+    def run(self):
+        logging.info("start time lapse sessions thread")
+        while True:
+            try:
+                self.update()
+            except Exception:
+                logging.exception("Error updating the time lapse sessions")
+            time.sleep(self.interval)
+
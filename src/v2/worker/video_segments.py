@@ -0,0 +1,211 @@
+"""
+Raspberry Pi worker
+
+segmented video recording
+
+The encoder output (pipe) is split in segments of segment_duration seconds or segment_size bytes.
+A segment starts with an IDR frame (SPS/PPS repeated with --inline): every segment can be played alone
+and the segments can be concatenated to rebuild the whole video.
+
+    HOSTNAME_PREFIX_2023-11-14_101500_0000.h264
+    HOSTNAME_PREFIX_2023-11-14_101500_0000.md5sum
+    HOSTNAME_PREFIX_2023-11-14_101500_0001.h264
+    ...
+    HOSTNAME_PREFIX_2023-11-14_101500.session.json  (manifest of the session: segments in order with their checksum)
+
+A segment is written with the .part suffix and renamed when complete (after its checksum file):
+the media catalog lists it immediately and it can be downloaded during the recording.
+"""
+
+import datetime
+import glob
+import json
+import os
+import pathlib as pl
+import time
+import logging
+
+import checksum
+import stream_relay
+
+PART_SUFFIX = ".part"
+MANIFEST_SUFFIX = ".session.json"
+
+
+def now_iso() -> str:
+    return datetime.datetime.now().replace(microsecond=0).isoformat()
+
+
+def write_manifest(path: pl.Path, manifest: dict):
+    """
+    write the manifest (complete file renamed)
+    """
+    tmp_path = path.with_name(path.name + PART_SUFFIX)
+    tmp_path.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp_path, path)
+
+
+class Segmented_recording:
+    """
+    Writing of the segments of a recording session
+    """
+
+    def __init__(
+        self,
+        directory,
+        session: str,
+        algorithm: str,
+        segment_duration: float,
+        segment_size: int,
+        parameters: dict = None,
+        clock_offset: dict = None,
+    ):
+        """
+        session: name of the session (prefix of the segments)
+        segment_duration: maximum duration of a segment (seconds, 0 for no limit)
+        segment_size: maximum size of a segment (bytes, 0 for no limit)
+        clock_offset: last offset of the worker clock measured by the coordinator (see clock_sync.py)
+        """
+        self.directory = pl.Path(directory)
+        self.session = session
+        self.algorithm = algorithm
+        self.segment_duration = segment_duration
+        self.segment_size = segment_size
+        self.manifest_path = self.directory / f"{session}{MANIFEST_SUFFIX}"
+        self.manifest = {
+            "session": session,
+            "started_at": now_iso(),
+            "ended_at": None,
+            "complete": False,
+            "parameters": {key: parameters[key] for key in parameters if key != "key"} if parameters else {},
+            "segment_duration": segment_duration,
+            "segment_size": segment_size,
+            "algorithm": algorithm,
+            # time of the first frame (seconds since the epoch)
+            "first_frame": None,
+            # offset of the worker clock (worker - coordinator, seconds): the times can be corrected after the recording
+            "clock_offset": clock_offset,
+            "segments": [],
+        }
+        self.f_out = None
+        # function called at the first frame
+        self.on_first_frame = None
+
+    def segment_path(self, index: int) -> pl.Path:
+        return self.directory / f"{self.session}_{index:04d}.h264"
+
+    def open_segment(self):
+        self.index = len(self.manifest["segments"])
+        self.path = self.segment_path(self.index)
+        self.f_out = open(self.path.with_name(self.path.name + PART_SUFFIX), "wb")
+        self.hash = checksum.new_hash(self.algorithm)
+        self.size = 0
+        self.frames = 0
+        self.started_at = now_iso()
+        self.start = time.monotonic()
+
+    def close_segment(self):
+        """
+        close the segment, write its checksum file and rename it
+        """
+        if self.f_out is None:
+            return
+        self.f_out.close()
+        self.f_out = None
+        digest = self.hash.hexdigest()
+        try:
+            checksum.write_sidecar(self.path, self.algorithm, digest)
+        except Exception:
+            logging.warning(f"{self.algorithm} checksum writing failed for {self.path}")
+        os.replace(self.path.with_name(self.path.name + PART_SUFFIX), self.path)
+
+        self.manifest["segments"].append(
+            {
+                "index": self.index,
+                "name": self.path.name,
+                "size": self.size,
+                "frames": self.frames,
+                "checksum": digest,
+                "started_at": self.started_at,
+                "duration": round(time.monotonic() - self.start, 3),
+            }
+        )
+        write_manifest(self.manifest_path, self.manifest)
+        logging.info(f"Segment {self.path.name} closed ({self.size} bytes, {self.frames} frames)")
+
+    def segment_full(self) -> bool:
+        return (self.segment_duration and time.monotonic() - self.start >= self.segment_duration) or (
+            self.segment_size and self.size >= self.segment_size
+        )
+
+    def write(self, frame: bytes, keyframe: bool):
+        """
+        write a frame (a new segment is started on an IDR frame when the current one is full)
+        """
+        if self.f_out is not None and keyframe and self.segment_full():
+            self.close_segment()
+        if self.manifest["first_frame"] is None:
+            self.manifest["first_frame"] = time.time()
+            if self.on_first_frame is not None:
+                self.on_first_frame(self.manifest["first_frame"])
+        if self.f_out is None:
+            self.open_segment()
+        self.f_out.write(frame)
+        self.hash.update(frame)
+        self.size += len(frame)
+        self.frames += 1
+
+    def record(self, stream):
+        """
+        write the encoder output (file object) until its end
+        """
+        write_manifest(self.manifest_path, self.manifest)
+        try:
+            for frame, keyframe in stream_relay.access_units(stream):
+                self.write(frame, keyframe)
+        finally:
+            self.close_segment()
+            self.manifest["ended_at"] = now_iso()
+            self.manifest["complete"] = True
+            write_manifest(self.manifest_path, self.manifest)
+
+
+def recover(directory):
+    """
+    close the sessions of the recordings interrupted by a stop of the worker (last segment and manifest)
+    """
+    for manifest_path in sorted(pl.Path(directory).glob(f"*{MANIFEST_SUFFIX}")):
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except Exception:
+            continue
+        if manifest.get("complete", True):
+            continue
+
+        session, algorithm = manifest["session"], manifest["algorithm"]
+        for part_path in sorted(pl.Path(directory).glob(f"{glob.escape(session)}_*.h264{PART_SUFFIX}")):
+            path = part_path.with_name(part_path.name[: -len(PART_SUFFIX)])
+            digest = checksum.file_checksum(part_path, algorithm)
+            checksum.write_sidecar(path, algorithm, digest)
+            os.replace(part_path, path)
+            manifest["segments"].append(
+                {"index": int(path.stem.rpartition("_")[2]), "name": path.name, "size": path.stat().st_size, "checksum": digest}
+            )
+            logging.info(f"Segment {path.name} of the interrupted recording recovered")
+
+        manifest["complete"] = True
+        manifest["interrupted"] = True
+        write_manifest(manifest_path, manifest)
+
+
+def remove_manifests(directory):
+    """
+    delete the manifests of the complete sessions without segment
+    """
+    for manifest_path in pl.Path(directory).glob(f"*{MANIFEST_SUFFIX}"):
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except Exception:
+            continue
+        if manifest.get("complete", False) and not any((manifest_path.parent / x["name"]).is_file() for x in manifest["segments"]):
+            manifest_path.unlink(missing_ok=True)
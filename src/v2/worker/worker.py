@@ -8,15 +8,22 @@ sudo systemctl enable worker
 
 
 from flask import Flask, request, send_from_directory, Response
-from crontab import CronTab  # from python-crontab (not crontab)
+
+try:
+    # only for the deletion of the jobs scheduled in the crontab by the previous versions of the worker
+    from crontab import CronTab  # from python-crontab (not crontab)
+except ImportError:
+    CronTab = None
 
 import threading
+import os
 import datetime
 import time
 import subprocess
 import socket
 import logging
 import base64
+import sys
 
 # required by get_hw_addr function
 import fcntl
@@ -30,6 +37,24 @@ import json
 from functools import wraps
 
 import config as cfg
+import status_sampler
+import process_registry
+import checksum
+import media_catalog
+import camera_detection
+import tar_stream
+import events
+import wsgi_server
+import still_capture
+import camera_backends
+import stream_relay
+import video_segments
+import remux_queue
+import time_lapse_sessions
+import retention
+import job_scheduler
+import clock_sync
+import beacon
 
 __version__ = "35"
 __version_date__ = "2023-11-14"
@@ -37,28 +62,13 @@ __version_date__ = "2023-11-14"
 
 VCGENCMD_PATH = "/usr/bin/vcgencmd"
 
+# busy wait at the end of wait_until (seconds)
+SPIN_WAIT = 0.002
 
-def is_camera_detected():
-    """
-        check if camera is plugged
-
-
-        Available cameras
-    -----------------
-    0 : imx219 [3280x2464] (/base/soc/i2c0mux/i2c@1/imx219@10)
-        Modes: 'SRGGB10_CSI2P' : 640x480 [206.65 fps - (1000, 752)/1280x960 crop]
-                                 1640x1232 [41.85 fps - (0, 0)/3280x2464 crop]
-                                 1920x1080 [47.57 fps - (680, 692)/1920x1080 crop]
-                                 3280x2464 [21.19 fps - (0, 0)/3280x2464 crop]
-               'SRGGB8' : 640x480 [206.65 fps - (1000, 752)/1280x960 crop]
-                          1640x1232 [41.85 fps - (0, 0)/3280x2464 crop]
-                          1920x1080 [47.57 fps - (680, 692)/1920x1080 crop]
-                          3280x2464 [21.19 fps - (0, 0)/3280x2464 crop]
-
-    """
-    process = subprocess.run(["libcamera-hello", "--list-cameras"], stdout=subprocess.PIPE)
-    output = process.stdout.decode("utf-8").strip()
-    return output
+# last offset of the clock measured by the coordinator (/clock_offset), recorded in the session manifests
+clock_offset = None
+# NTP disabled by a step of the clock (/clock_offset), enabled again by /enable_ntp
+ntp_disabled = False
 
 
 def get_hw_addr(ifname):
@@ -118,30 +128,23 @@ def get_wifi_ssid():
 
 def video_streaming_active():
     """
-    check if uv4l process is present
+    check if the video streaming job is running
     """
-
-    process = subprocess.run(["ps", "auxwg"], stdout=subprocess.PIPE)
-    processes_list = process.stdout.decode("utf-8").split("\n")
-    return len([x for x in processes_list if "/usr/bin/vlc -I dummy stream:///dev/stdin" in x]) > 0
+    return registry.is_active("streaming")
 
 
 def recording_video_active():
     """
-    check if libcamera-vid process is present
+    check if a video recording job is running
     """
-    process = subprocess.run(["ps", "auxwg"], stdout=subprocess.PIPE)
-    processes_list = process.stdout.decode("utf-8").split("\n")
-    return len([x for x in processes_list if "libcamera-vid" in x and "libcamera-vid -t 0" not in x]) > 0
+    return registry.is_active("video")
 
 
 def time_lapse_active():
     """
-    check if libcamera-still process is present
+    check if a time lapse job is running
     """
-    process = subprocess.run(["ps", "auxwg"], stdout=subprocess.PIPE)
-    processes_list = process.stdout.decode("utf-8").split("\n")
-    return len([x for x in processes_list if "libcamera-still" in x and " -q " in x]) > 0
+    return registry.is_active("time_lapse")
 
 
 def get_cpu_temperature() -> str:
@@ -179,7 +182,17 @@ def datetime_now_iso():
     return datetime.datetime.now().replace(microsecond=0).isoformat().replace("T", " ")
 
 
-class Libcamera_vid_thread(threading.Thread):
+def wait_until(timestamp: float):
+    """
+    wait until the wall-clock time (seconds since the epoch): sleep then busy wait during the last SPIN_WAIT seconds
+    """
+    while (remaining := timestamp - time.time()) > SPIN_WAIT:
+        time.sleep(remaining - SPIN_WAIT)
+    while time.time() < timestamp:
+        pass
+
+
+class Video_recording_thread(threading.Thread):
     """
     Class for recording video using a thread
     """
@@ -187,23 +200,47 @@ class Libcamera_vid_thread(threading.Thread):
     def __init__(self, parameters: dict):
         threading.Thread.__init__(self)
         self.parameters = parameters
+        # synchronized start (/start_video_at): start time, time of the start signal and time of the first frame
+        self.start_at = float(parameters["start_at"]) if parameters.get("start_at", "") else None
+        self.signaled_at = None
+        self.first_frame = None
+        self.first_frame_event = threading.Event()
+
+    def video_command(self, parameters: dict, output: str) -> list:
+        """
+        command line of the recording (started paused for a synchronized start)
+        """
+        if self.start_at is None:
+            return camera_backend.video_command(parameters, output)
+        # the timeout of the camera program includes the pause until the start time
+        if parameters.get("timeout", "0") != "0":
+            parameters = dict(parameters, timeout=str(int(parameters["timeout"]) + max(0, int((self.start_at - time.time()) * 1000))))
+        return camera_backend.armed_video_command(parameters, output)
+
+    def start_recording(self, process):
+        """
+        synchronized start: the paused camera starts the recording at the start time
+        """
+        if self.start_at is None:
+            return
+        wait_until(self.start_at)
+        process.send_signal(camera_backends.START_SIGNAL)
+        self.signaled_at = time.time()
+
+    def frame_received(self, timestamp: float):
+        """
+        first frame of the recording
+        """
+        self.first_frame = timestamp
+        self.first_frame_event.set()
+        if self.start_at is not None:
+            logging.info(f"First frame {(timestamp - self.start_at) * 1000:.1f} ms after the start time")
 
     def run(self):
-        logging.info("start libcamera-vid thread")
-
-        command_line = [
-            "libcamera-vid",
-        ]
+        logging.info(f"start video recording thread ({camera_backend.name})")
 
-        for key in self.parameters:
-            if key in ["prefix", "annotate", "key"]:
-                continue
-            if self.parameters[key] == "True":
-                command_line.extend([f"--{key}"])
-            elif self.parameters[key] != "False":
-                command_line.extend([f"--{key}", f"{self.parameters[key]}"])
-
-        file_name = datetime.datetime.now().replace(microsecond=0).isoformat().replace("T", "_").replace(":", "")
+        start = datetime.datetime.fromtimestamp(self.start_at) if self.start_at is not None else datetime.datetime.now()
+        file_name = start.replace(microsecond=0).isoformat().replace("T", "_").replace(":", "")
         prefix = (self.parameters["prefix"] + "_") if self.parameters.get("prefix", "") else ""
 
         file_path = str(
@@ -213,28 +250,95 @@ class Libcamera_vid_thread(threading.Thread):
             / pl.Path(f"{socket.gethostname()}_{prefix}{file_name}.h264")
         )
 
-        command_line.extend(["-o", file_path])
+        algorithm = checksum.available_algorithm(cfg.CHECKSUM_ALGORITHM)
+
+        try:
+            segment_duration = float(self.parameters.get("segment_duration", cfg.VIDEO_SEGMENT_DURATION))
+            segment_size = int(float(self.parameters.get("segment_size", cfg.VIDEO_SEGMENT_SIZE)) * 1024 * 1024)
+        except ValueError:
+            segment_duration, segment_size = 0, 0
+
+        if segment_duration or segment_size:
+            self.record_segments(file_path, algorithm, segment_duration, segment_size)
+            return
+
+        # the synchronized recordings are always written by the worker (time of the first frame)
+        tee = cfg.RECORDING_CHECKSUM_MODE == "tee" or self.start_at is not None
+        if tee:
+            # the encoder writes on a pipe: the worker writes the file and computes the checksum at the same time
+            command_line = self.video_command(self.parameters, "-")
+        else:
+            command_line = self.video_command(self.parameters, file_path)
 
         logging.info(" ".join(command_line))
 
         self.started_at = datetime.datetime.now().replace(microsecond=0).isoformat()
 
-        subprocess.run(command_line)
+        if tee:
+            process = subprocess.Popen(command_line, stdout=subprocess.PIPE, start_new_session=True)
+            registry.register("video", process, dict(self.parameters, file_path=file_path))
+            self.start_recording(process)
+
+            file_hash = checksum.new_hash(algorithm)
+            with open(file_path, "wb") as f_out:
+                while chunk := os.read(process.stdout.fileno(), checksum.CHUNK_SIZE):
+                    if self.first_frame is None:
+                        self.frame_received(time.time())
+                    f_out.write(chunk)
+                    file_hash.update(chunk)
+            process.wait()
+            self.first_frame_event.set()
+            digest = file_hash.hexdigest()
 
-        # md5sum
-        process = subprocess.run(["md5sum", file_path], stdout=subprocess.PIPE)
+        else:
+            process = subprocess.Popen(command_line, start_new_session=True)
+            registry.register("video", process, dict(self.parameters, file_path=file_path))
+            process.wait()
+            # second pass on the whole file
+            digest = checksum.file_checksum(file_path, algorithm)
 
         try:
-            with open(
-                pl.Path(__file__).resolve().parent
-                / pl.Path(cfg.STATIC_DIR)
-                / pl.Path(cfg.VIDEO_ARCHIVE_DIR)
-                / pl.Path(f"{socket.gethostname()}_{prefix}{file_name}.md5sum"),
-                "w",
-            ) as f_out:
-                f_out.write(process.stdout.decode("utf-8"))
+            checksum.write_sidecar(file_path, algorithm, digest)
         except Exception:
-            logging.warning(f"MD5SUM writing failed for {file_path}")
+            logging.warning(f"{algorithm} checksum writing failed for {file_path}")
+
+        self.queue_remux([file_path])
+
+    def queue_remux(self, file_paths: list):
+        """
+        add the recorded files to the remux queue (MP4 version)
+        """
+        if remux is None:
+            return
+        try:
+            framerate = float(self.parameters["framerate"])
+        except (KeyError, ValueError):
+            framerate = None
+        for file_path in file_paths:
+            remux.add(file_path, framerate)
+
+    def record_segments(self, file_path: str, algorithm: str, segment_duration: float, segment_size: int):
+        """
+        the encoder writes on a pipe: the worker splits the video in segments on the IDR frames
+        """
+        # SPS/PPS before every IDR frame: every segment can be decoded alone
+        command_line = self.video_command(dict(self.parameters, inline="True"), "-")
+        logging.info(" ".join(command_line))
+
+        session = pl.Path(file_path).stem
+        recording = video_segments.Segmented_recording(
+            pl.Path(file_path).parent, session, algorithm, segment_duration, segment_size, self.parameters, clock_offset
+        )
+        recording.on_first_frame = self.frame_received
+        process = subprocess.Popen(command_line, stdout=subprocess.PIPE, start_new_session=True)
+        registry.register("video", process, dict(self.parameters, session=session))
+        self.start_recording(process)
+        try:
+            recording.record(process.stdout)
+        finally:
+            process.wait()
+            self.first_frame_event.set()
+        self.queue_remux([recording.directory / x["name"] for x in recording.manifest["segments"]])
 
 
 class Blink_thread(threading.Thread):
@@ -247,12 +351,16 @@ class Blink_thread(threading.Thread):
 
 
 class Video_streaming_thread(threading.Thread):
-    def __init__(self):
+    def __init__(self, parameters: dict):
         threading.Thread.__init__(self)
+        self.parameters = parameters
 
     def run(self):
         logging.info("start video streaming")
-        subprocess.run(["bash", "stream_video.bash"])
+        process = subprocess.Popen(camera_backend.streaming_command(self.parameters), stdout=subprocess.PIPE, start_new_session=True)
+        registry.register("streaming", process, self.parameters)
+        # the encoder output is sent to the viewers until the end of the process
+        relay.run(process)
 
 
 while True:
@@ -287,17 +395,357 @@ else:
 # create VIDEO_ARCHIVE_DIR
 (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR)).mkdir(parents=True, exist_ok=True)
 
+# close the segmented recordings interrupted by a stop of the worker
+video_segments.recover(pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR))
+
 # create TIME_LAPSE_ARCHIVE_DIR
 (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR)).mkdir(parents=True, exist_ok=True)
 
 # create LIVE_PICTURES_ARCHIVE_DIR
 (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.LIVE_PICTURES_ARCHIVE_DIR)).mkdir(parents=True, exist_ok=True)
 
+# events pushed to the clients (/events route)
+event_bus = events.Event_bus()
+
+# catalog of the media files of the archive directories
+catalog = media_catalog.Media_catalog(
+    pl.Path(__file__).resolve().parent / pl.Path(cfg.CATALOG_PATH),
+    pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR),
+    [cfg.VIDEO_ARCHIVE_DIR, cfg.TIME_LAPSE_ARCHIVE_DIR, cfg.LIVE_PICTURES_ARCHIVE_DIR],
+    notify=event_bus.publish,
+)
+catalog_watcher = media_catalog.Catalog_watcher(catalog, cfg.CATALOG_RESCAN_INTERVAL)
+
+# registry of the running camera jobs (the changes are published by the status sampler)
+registry = process_registry.Process_registry(on_change=lambda: sampler.refresh("active jobs"))
+
+
+# command lines of the camera programs (libcamera, raspi or simulated)
+camera_backend = camera_backends.get_backend(cfg.CAMERA_BACKEND)
+
+# relay of the live video stream to the viewers (TCP and /live_stream)
+relay = stream_relay.Stream_relay(cfg.STREAMING_PORT, cfg.STREAMING_CLIENT_QUEUE, cfg.STREAMING_MAX_CLIENTS, cfg.STREAMING_SEND_TIMEOUT)
 
-app = Flask(__name__, static_url_path=f"/{cfg.STATIC_DIR}")
+# threads of the server available for the long responses (/events and /live_stream)
+long_response_slots = threading.BoundedSemaphore(max(1, cfg.SERVER_THREADS - cfg.SERVER_RESERVED_THREADS))
+
+# the static directory is served by the archive_file route (byte ranges and strong ETags)
+app = Flask(__name__, static_folder=None)
 
 thread = threading.Thread()
 
+# warm camera daemon for the single pictures (optional, see still_daemon.py)
+still_daemon = (
+    still_capture.Still_daemon_client(
+        cfg.STILL_DAEMON_PYTHON,
+        pl.Path(__file__).resolve().parent / pl.Path(cfg.RUN_DIR) / "still_daemon.sock",
+        cfg.STILL_DAEMON_IDLE_TIMEOUT,
+        cfg.DEFAULT_PICTURE_WIDTH,
+        cfg.DEFAULT_PICTURE_HEIGHT,
+    )
+    if cfg.STILL_DAEMON
+    else None
+)
+
+
+def release_camera():
+    """
+    stop the still daemon before another use of the camera
+    """
+    if still_daemon is not None:
+        still_daemon.stop()
+
+
+def warm_up_camera():
+    """
+    start the still daemon in background if the camera is free
+    """
+    if still_daemon is not None and not registry.summary():
+        threading.Thread(target=still_daemon.start, daemon=True).start()
+
+
+# cache of the detected cameras (the camera cannot be probed while a job is using it)
+camera_detector = camera_detection.Camera_detector(
+    camera_backend.list_cameras,
+    camera_busy=lambda: recording_video_active()
+    or time_lapse_active()
+    or video_streaming_active()
+    or (still_daemon is not None and still_daemon.is_running()),
+)
+
+
+def metric_value(value):
+    """
+    return the number at the beginning of a sampled value ("45.2°C", "3.5 Gb") or None
+    """
+    try:
+        return float(str(value).split("°")[0].split(" ")[0])
+    except ValueError:
+        return None
+
+
+def status_changed(name: str, previous, value):
+    """
+    publish the changes of the sampled metrics (job started or finished, new value, threshold crossed)
+    """
+    if name == "active jobs":
+        for kind in previous:
+            if kind not in value or value[kind]["pid"] != previous[kind]["pid"]:
+                event_bus.publish("job_finished", {"kind": kind, **previous[kind]})
+        for kind in value:
+            if kind not in previous or value[kind]["pid"] != previous[kind]["pid"]:
+                event_bus.publish("job_started", {"kind": kind, **value[kind]})
+        if beacon_sender is not None:
+            beacon_sender.wake_up.set()
+        if not value:
+            warm_up_camera()
+        return
+
+    if name == "camera detected":
+        event_bus.publish("status", {name: value, "cameras": camera_detector.get()})
+        return
+
+    event_bus.publish("status", {name: value})
+
+    if name in cfg.STATUS_ALERTS:
+        threshold, direction = cfg.STATUS_ALERTS[name]
+        previous_value, new_value = metric_value(previous), metric_value(value)
+        if new_value is None:
+            return
+        active = new_value > threshold if direction == "above" else new_value < threshold
+        was_active = previous_value is not None and (
+            previous_value > threshold if direction == "above" else previous_value < threshold
+        )
+        if active != was_active:
+            event_bus.publish("alert", {"metric": name, "value": value, "threshold": threshold, "active": active})
+
+
+# deletion of the oldest safe files when the free space is low and admission of the new jobs
+retention_engine = retention.Retention(
+    catalog,
+    cfg.RETENTION_LOW_WATERMARK * retention.GB,
+    cfg.RETENTION_HIGH_WATERMARK * retention.GB,
+    cfg.RETENTION_FLOOR * retention.GB,
+    cfg.RETENTION_INTERVAL,
+)
+
+# time lapse sessions (pictures moved in the shard directories, sessions finished)
+sharder = time_lapse_sessions.Session_sharder(
+    pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR),
+    time_lapse_active,
+    cfg.TIME_LAPSE_SHARD_INTERVAL,
+)
+
+# background remux of the recorded video in MP4 (not during the recordings)
+remux = None
+if cfg.REMUX:
+    if shutil.which(cfg.REMUX_PROGRAM):
+        remux = remux_queue.Remux_queue(
+            catalog,
+            cfg.VIDEO_ARCHIVE_DIR,
+            pl.Path(__file__).resolve().parent / pl.Path(cfg.REMUX_TMP_DIR),
+            cfg.REMUX_PROGRAM,
+            checksum.available_algorithm(cfg.CHECKSUM_ALGORITHM),
+            recording_video_active,
+            cfg.DEFAULT_FPS,
+            cfg.REMUX_SCAN_INTERVAL,
+            cfg.REMUX_MIN_AGE,
+        )
+    else:
+        logging.warning(f"{cfg.REMUX_PROGRAM} not found: the video are not remuxed in MP4")
+
+# background sampling of the status metrics
+sampler = status_sampler.Status_sampler(on_change=status_changed)
+sampler.register("camera detected", camera_detector.check, cfg.STATUS_SAMPLING_INTERVALS["camera detected"], "")
+sampler.register("wifi_essid", get_wifi_ssid, cfg.STATUS_SAMPLING_INTERVALS["wifi_essid"])
+sampler.register("CPU temperature", get_cpu_temperature, cfg.STATUS_SAMPLING_INTERVALS["CPU temperature"])
+sampler.register("free disk space", get_free_space, cfg.STATUS_SAMPLING_INTERVALS["free disk space"])
+sampler.register("uptime", get_uptime, cfg.STATUS_SAMPLING_INTERVALS["uptime"], "")
+sampler.register("active jobs", registry.summary, cfg.STATUS_SAMPLING_INTERVALS["active jobs"], {})
+
+
+def beacon_payload() -> dict:
+    """
+    content of the discovery beacon (sampled values)
+    """
+    sampled_values, _ = sampler.snapshot()
+    return {
+        "host": socket.gethostname(),
+        "ip": get_ip(),
+        "port": cfg.PORT,
+        "version": __version__,
+        "jobs": sorted(sampled_values["active jobs"]),
+        "temp": sampled_values["CPU temperature"],
+        "free": sampled_values["free disk space"],
+    }
+
+
+# discovery beacon (UDP multicast or broadcast)
+beacon_sender = None
+if cfg.BEACON_ADDRESS:
+    beacon_sender = beacon.Beacon(
+        cfg.BEACON_ADDRESS, cfg.BEACON_PORT, cfg.BEACON_INTERVAL, cfg.BEACON_TTL, beacon_payload, security_key_sha256
+    )
+
+
+def start_background_tasks():
+    """
+    start the background threads in the serving process (threads are not inherited by the forked processes)
+    """
+    for background_thread in (
+        (catalog_watcher, sampler, sharder, retention_engine, scheduler)
+        + ((remux,) if remux is not None else ())
+        + ((beacon_sender,) if beacon_sender is not None else ())
+    ):
+        if background_thread.ident is None:
+            background_thread.start()
+    warm_up_camera()
+
+
+def admit_video(parameters: dict):
+    """
+    check the projected size of the video recording (bitrate x duration) with the available disk space
+    return the parameters with the duration reduced to the available space or None if the recording is refused
+    """
+    try:
+        bitrate = float(parameters.get("bitrate", cfg.DEFAULT_VIDEO_QUALITY * 1_000_000))
+        duration = int(parameters.get("timeout", 0)) / 1000
+    except ValueError:
+        return parameters
+    # the MP4 version doubles the size of the video
+    byte_rate = bitrate / 8 * (2 if remux is not None else 1)
+    available = retention_engine.admit(byte_rate * duration)
+    if available is None:
+        return parameters
+    if available / byte_rate < cfg.RETENTION_MIN_VIDEO_DURATION:
+        logging.warning(f"Video recording refused: not enough disk space ({available} bytes available)")
+        return None
+    logging.warning(f"Video recording duration reduced to {int(available / byte_rate)} s: not enough disk space")
+    return dict(parameters, timeout=str(int(available / byte_rate * 1000)))
+
+
+def admit_time_lapse(parameters: dict):
+    """
+    check the projected size of the time lapse (number of pictures x average picture size) with the available disk space
+    return the parameters with the duration reduced to the available space or None if the time lapse is refused
+    """
+    try:
+        duration, interval = int(parameters["timeout"]), int(parameters["timelapse"])
+        width = int(parameters.get("width", cfg.DEFAULT_PICTURE_WIDTH))
+        height = int(parameters.get("height", cfg.DEFAULT_PICTURE_HEIGHT))
+    except (KeyError, ValueError):
+        return parameters
+    picture_size = catalog.average_size(cfg.TIME_LAPSE_ARCHIVE_DIR, "picture") or width * height * cfg.JPEG_BYTES_PER_PIXEL
+    available = retention_engine.admit((duration // interval + 1) * picture_size)
+    if available is None:
+        return parameters
+    pictures = int(available // picture_size)
+    if pictures < 2:
+        logging.warning(f"Time lapse refused: not enough disk space ({available} bytes available)")
+        return None
+    logging.warning(f"Time lapse duration reduced to {(pictures - 1) * interval} s: not enough disk space")
+    return dict(parameters, timeout=str((pictures - 1) * interval))
+
+
+def launch_video_recording(parameters: dict) -> tuple:
+    """
+    start the video recording and return the response and the recording thread (None if not started)
+    """
+
+    global thread
+
+    if recording_video_active():
+        return {"error": True, "msg": "Video already recording"}, None
+
+    if time_lapse_active():
+        return {"error": True, "msg": "The video cannot be recorded because the time lapse is active"}, None
+
+    if video_streaming_active():
+        return {"error": True, "msg": "The video cannot be recorded because the video streaming is active"}, None
+
+    logging.info(f"Starting video recording for {int(parameters['timeout']) / 1000} s ({parameters['width']}x{parameters['height']})")
+    admitted = admit_video(parameters)
+    if admitted is None:
+        return {"error": True, "msg": "Video not recording: not enough disk space"}, None
+
+    release_camera()
+    try:
+        recording = Video_recording_thread(admitted)
+        recording.start()
+        thread = recording
+
+        logging.info("Video recording started")
+        if admitted["timeout"] != parameters["timeout"]:
+            return {
+                "error": False,
+                "msg": f"Video recording for {int(admitted['timeout']) // 1000} s (not enough disk space)",
+                "timeout": admitted["timeout"],
+            }, recording
+        return {"error": False, "msg": "Video recording"}, recording
+    except Exception:
+        logging.info("Video recording not started")
+        return {"error": True, "msg": "Video not recording"}, None
+
+
+def start_video_recording(parameters: dict) -> dict:
+    """
+    start the video recording (coordinator and scheduled jobs)
+    """
+    return launch_video_recording(parameters)[0]
+
+
+def start_time_lapse(parameters: dict) -> dict:
+    """
+    start the time lapse in a new session (coordinator and scheduled jobs)
+    the caller checks that the camera is not used by another job
+    """
+    admitted = admit_time_lapse(parameters)
+    if admitted is None:
+        return {"error": True, "msg": "Time lapse not started: not enough disk space"}
+
+    session_id, output_path = time_lapse_sessions.new_session(
+        pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR),
+        socket.gethostname(),
+        cfg.TIME_LAPSE_SHARDING,
+        admitted,
+        clock_offset,
+    )
+    command_line = camera_backend.time_lapse_command(admitted, output_path)
+    logging.info(f"command: {' '.join(command_line)}")
+    release_camera()
+    try:
+        process = subprocess.Popen(command_line, start_new_session=True)
+        registry.register("time_lapse", process, dict(admitted, session=session_id))
+    except Exception:
+        logging.warning("Error running time lapse (wrong command line option)")
+        return {"error": 1, "msg": "Error running time lapse (wrong command line option)"}
+    if admitted["timeout"] != parameters["timeout"]:
+        return {
+            "error": False,
+            "msg": f"Time lapse running for {admitted['timeout']} s (not enough disk space)",
+            "session": session_id,
+            "timeout": admitted["timeout"],
+        }
+    return {"error": False, "msg": "Time lapse running", "session": session_id}
+
+
+def start_scheduled_job(kind: str, parameters: dict) -> dict:
+    """
+    start a run of a scheduled job (see job_scheduler.py)
+    """
+    if kind == "video":
+        return start_video_recording(parameters)
+
+    if video_streaming_active() or recording_video_active() or time_lapse_active():
+        return {"error": True, "msg": "Time lapse not started: the camera is used by another job"}
+    return start_time_lapse(parameters)
+
+
+# scheduled video recordings and time lapses
+scheduler = job_scheduler.Job_scheduler(
+    pl.Path(__file__).resolve().parent / pl.Path(cfg.SCHEDULER_JOBS_PATH), start_scheduled_job, cfg.SCHEDULER_MISFIRE_GRACE_TIME
+)
+
 
 def security_key_required(f):
     @wraps(f)
@@ -318,6 +766,30 @@ def security_key_required(f):
     return decorated_function
 
 
+def send_archive_file(directory: pl.Path, file_name: str, as_attachment: bool = False):
+    """
+    send a file of the archive
+    byte ranges (206 Partial Content), If-Range, If-None-Match and HEAD are supported.
+    The strong ETag is based on the size, the modification time and the stored checksum of the file
+    """
+    try:
+        file_stat = (directory / file_name).stat()
+    except Exception:
+        return Response(status=404)
+
+    etag = f"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}-{checksum.read_sidecar(directory / file_name)[1]}".rstrip("-")
+
+    return send_from_directory(str(directory), file_name, as_attachment=as_attachment, etag=etag, conditional=True)
+
+
+@app.route(f"/{cfg.STATIC_DIR}/<path:file_name>", methods=("GET",))
+def archive_file(file_name):
+    """
+    send a file from the static directory (video and pictures archives)
+    """
+    return send_archive_file(pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR), file_name)
+
+
 @app.route("/")
 def home():
     return f"""<html>
@@ -338,8 +810,8 @@ Worker version: <b>{__version__}</b> ({__version_date__})<br>
 IP address: {get_ip()}<br>
 MAC Addr: {get_hw_addr(cfg.WIFI_INTERFACE)}<br>
 date/time: {datetime_now_iso()} timezone:{get_timezone()} <br>
-CPU temperature: <b>{get_cpu_temperature()}</b><br>
-Uptime: <b>{get_uptime()}</b><br>
+CPU temperature: <b>{sampler.get("CPU temperature")}</b><br>
+Uptime: <b>{sampler.get("uptime")}</b><br>
 <!--
 <br>
 <a href="/status">server status</a><br>
@@ -352,6 +824,35 @@ Uptime: <b>{get_uptime()}</b><br>
 """
 
 
+@app.route(
+    "/events",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def event_stream():
+    """
+    stream the events of the worker (Server-Sent Events, see events.py)
+    The events missed since the Last-Event-ID header (or last_event_id value) are sent first
+    keepalive: interval of the keepalive comments requested by the client (seconds, at most EVENTS_KEEPALIVE)
+    """
+    try:
+        keepalive = min(max(float(request.values.get("keepalive", cfg.EVENTS_KEEPALIVE)), 1), cfg.EVENTS_KEEPALIVE)
+    except ValueError:
+        return {"error": True, "msg": "Keepalive interval not valid"}
+    if not long_response_slots.acquire(blocking=False):
+        return {"error": True, "msg": "Too many viewers and event clients"}, 503
+    response = Response(
+        event_bus.stream(request.headers.get("Last-Event-ID", request.values.get("last_event_id", "")), keepalive),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+    response.call_on_close(long_response_slots.release)
+    return response
+
+
 @app.route(
     "/status",
     methods=(
@@ -365,6 +866,9 @@ def status():
     try:
         # logging.info(f"thread is alive: {thread.is_alive()}")
 
+        sampled_values, sample_ages = sampler.snapshot()
+        active_jobs = registry.summary()
+
         server_info = {
             "status": "OK",
             "server_datetime": datetime.datetime.now().replace(microsecond=0).isoformat().replace("T", " "),
@@ -372,14 +876,27 @@ def status():
             "MAC_addr": get_hw_addr(cfg.WIFI_INTERFACE),
             "hostname": socket.gethostname(),
             "IP_address": get_ip(),
-            "video_streaming_active": video_streaming_active(),
-            "wifi_essid": get_wifi_ssid(),
-            "CPU temperature": get_cpu_temperature(),
-            "free disk space": get_free_space(),
-            "camera detected": is_camera_detected(),
-            "uptime": get_uptime(),
-            "time_lapse_active": time_lapse_active(),
-            "video_recording": recording_video_active(),
+            "video_streaming_active": "streaming" in active_jobs,
+            "stream_viewers": relay.summary(),
+            "wifi_essid": sampled_values["wifi_essid"],
+            "CPU temperature": sampled_values["CPU temperature"],
+            "free disk space": sampled_values["free disk space"],
+            "camera detected": sampled_values["camera detected"],
+            # sensor model and modes of the detected cameras
+            "cameras": camera_detector.get(),
+            "uptime": sampled_values["uptime"],
+            "time_lapse_active": "time_lapse" in active_jobs,
+            "video_recording": "video" in active_jobs,
+            # background remux of the video in MP4
+            "remux": remux.summary() if remux is not None else {},
+            # free space, size of the safe files and evicted files (bytes)
+            "retention": retention_engine.summary(),
+            # PID, start time and parameters of the running jobs
+            "active_jobs": active_jobs,
+            # last clock offset measured by the coordinator
+            "clock_offset": clock_offset,
+            # age (in seconds) of the sampled values
+            "sample_age": sample_ages,
         }
 
         return server_info
@@ -388,6 +905,39 @@ def status():
         return {"status": "Not available"}
 
 
+@app.route(
+    "/cameras",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def cameras():
+    """
+    return the cached list of cameras with their modes (resolution, max fps and crop)
+    """
+    return {"error": False, "cameras": camera_detector.get()}
+
+
+@app.route(
+    "/rescan_cameras",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def rescan_cameras():
+    """
+    probe the cameras again and return the updated list
+    """
+    if recording_video_active() or time_lapse_active() or video_streaming_active():
+        return {"error": True, "msg": "The cameras cannot be scanned while the camera is in use", "cameras": camera_detector.get()}
+
+    return {"error": False, "cameras": camera_detector.refresh()}
+
+
 @app.route(
     "/video_streaming/<action>",
     methods=(
@@ -406,11 +956,15 @@ def video_streaming(action):
 
     libcamera-vid -t 0 --inline --listen -o - | cvlc stream:///dev/stdin --sout '#rtp{sdp=rtsp://:8554/stream}' :demux=h264
 
+    The encoder output (libcamera-vid -t 0 --inline -o -) is relayed to several viewers (see stream_relay.py):
+    raw H.264 over TCP on port STREAMING_PORT and over HTTP (/live_stream)
+    optional parameters: width, height, framerate, bitrate
     """
     # kill current streaming
     try:
-        subprocess.run(["sudo", "pkill", "vlc"])
-        time.sleep(2)
+        if not registry.stop("streaming"):
+            camera_backend.kill("streaming")
+            time.sleep(2)
     except Exception:
         return {"msg": "Problem trying to stop the video streaming"}
 
@@ -418,14 +972,33 @@ def video_streaming(action):
         return {"msg": "video streaming stopped"}
 
     if action == "start":
+        release_camera()
         try:
-            thread = Video_streaming_thread()
+            thread = Video_streaming_thread({key: request.values[key] for key in request.values if key != "key"})
             thread.start()
             return {"msg": "video streaming started"}
         except Exception:
             return {"msg": "video streaming not started"}
 
 
+@app.route("/live_stream", methods=("GET",))
+@security_key_required
+def live_stream():
+    """
+    send the live video stream (raw H.264) until the end of the video streaming
+    """
+    if not long_response_slots.acquire(blocking=False):
+        return {"error": True, "msg": "Too many viewers and event clients"}, 503
+    client = relay.add_client(f"http {request.remote_addr}")
+    if client is None:
+        long_response_slots.release()
+        return {"error": True, "msg": "The video streaming is not active or there are too many viewers"}
+
+    response = Response(relay.http_stream(client), mimetype="video/h264", headers={"Cache-Control": "no-store"})
+    response.call_on_close(long_response_slots.release)
+    return response
+
+
 @app.route(
     "/schedule_time_lapse",
     methods=(
@@ -436,73 +1009,13 @@ def video_streaming(action):
 @security_key_required
 def schedule_time_lapse():
     """
-    schedule the time lapse using crontab of user pi
-    see https://pypi.org/project/crontab/
-    """
-
-    crontab_event = request.values.get("crontab", "")
-    if not crontab_event:
-        return {"error": True, "msg": "Time lapse NOT configured. Crontab event not found"}
+    schedule the time lapse with the scheduler of the worker (see job_scheduler.py)
 
-    logging.info(f"crontab event: {crontab_event}")
-
-    command_line = [
-        "libcamera-still",
-        "-q",
-        "90",
-    ]
-
-    for key in request.values:
-        if key in ["timelapse", "timeout", "prefix", "annotate", "key", "crontab"]:
-            continue
-        if request.values[key] == "True":
-            command_line.extend([f"--{key}"])
-        elif request.values[key] != "False":
-            command_line.extend([f"--{key}", f"{request.values[key]}"])
-
-    # use Epoch time for file name
-    # command_line.extend(["--timestamp"])
-
-    if (
-        "timeout" in request.values
-        and request.values["timeout"] != "0"
-        and "timelapse" in request.values
-        and request.values["timelapse"] != "0"
-    ):
-        command_line.extend(["--timeout", str(int(request.values["timeout"]) * 1000)])
-        command_line.extend(["--timelapse", str(int(request.values["timelapse"]) * 1000)])
-        comment = f'time-lapse for {request.values["timeout"]} s (every {request.values["timelapse"]} s)'
-
-    command_line.extend(
-        [
-            "-o",
-            str(
-                pl.Path(__file__).resolve().parent
-                / pl.Path(cfg.STATIC_DIR)
-                / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR)
-                / pl.Path(f"{socket.gethostname()}_%04d").with_suffix(".jpg")
-            ),
-        ]
-    )
-
-    """
-    prefix = (request.values["prefix"] + "_" ) if request.values.get("prefix", "") else ""
-    file_path = f"{cfg.VIDEO_ARCHIVE}/{socket.gethostname()}_{prefix}" + "$(/usr/bin/date_crontab_helper).h264"
-    command_line.extend(["-o", file_path])
+    crontab: crontab expression of the runs (minute hour day_of_month month day_of_week)
+    or at: date and time of a single run (ISO format)
+    misfire_grace_time: maximum delay of a run missed during a stop of the worker (seconds, optional)
     """
-
-    logging.info(" ".join(command_line))
-
-    cron = CronTab(user="pi")
-    job = cron.new(command=" ".join(command_line), comment=comment)
-    try:
-        job.setall(crontab_event)
-    except Exception:
-        return {"error": True, "msg": f"Time lapse NOT scheduled. '{crontab_event}' is not valid."}
-
-    cron.write()
-
-    return {"error": False, "msg": "Time lapse scheduled"}
+    return schedule_job("time_lapse")
 
 
 @app.route(
@@ -515,19 +1028,9 @@ def schedule_time_lapse():
 @security_key_required
 def view_time_lapse_schedule():
     """
-    send all time lapse crontab schedule
+    send all time lapse schedule
     """
-    cron = CronTab(user="pi")
-    output = []
-    try:
-        for job in cron:
-            if "libcamera-still" in job.command:
-                output.append([str(job.minutes), str(job.hours), str(job.dom), str(job.month), str(job.dow), job.comment])
-
-    except Exception:
-        return {"error": True, "msg": "Error during time lapse schedule view."}
-
-    return {"error": False, "msg": output}
+    return view_schedule("time_lapse")
 
 
 @app.route(
@@ -540,18 +1043,9 @@ def view_time_lapse_schedule():
 @security_key_required
 def delete_time_lapse_schedule():
     """
-    delete all time lapse schedule
+    delete all time lapse schedule (or the job with id)
     """
-    cron = CronTab(user="pi")
-    try:
-        for job in cron:
-            if "libcamera-still" in job.command:
-                cron.remove(job)
-        cron.write()
-    except Exception:
-        return {"error": True, "msg": "Time lapse schedule NOT deleted."}
-
-    return {"error": False, "msg": "Time lapse schedule deleted."}
+    return delete_schedule("time_lapse")
 
 
 @app.route(
@@ -567,29 +1061,61 @@ def start_video():
     Start video recording
     """
 
-    global thread
+    return start_video_recording(dict(request.values))
 
-    if recording_video_active():
-        return {"msg": "Video already recording"}
-
-    if time_lapse_active():
-        return {"msg": "The video cannot be recorded because the time lapse is active"}
 
-    if video_streaming_active():
-        return {"msg": "The video cannot be recorded because the video streaming is active"}
+@app.route(
+    "/start_video_at",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def start_video_at():
+    """
+    Start the video recording at a wall-clock time (synchronized recordings of several Raspberry Pi)
 
-    logging.info(
-        f"Starting video recording for {int(request.values['timeout']) / 1000} s ({request.values['width']}x{request.values['height']})"
-    )
+    start_at: start time (seconds since the epoch) and the parameters of /start_video
+    The camera is started paused (pipeline ready) and the recording is started by a signal at the start time.
+    The response is sent after the first frame with its time (first_frame) and its delay after the start time
+    """
     try:
-        thread = Libcamera_vid_thread(request.values)
-        thread.start()
+        start_at = float(request.values["start_at"])
+    except (KeyError, ValueError):
+        return {"error": True, "msg": "Start time not found"}
 
-        logging.info("Video recording started")
-        return {"msg": "Video recording"}
-    except Exception:
-        logging.info("Video recording not started")
-        return {"msg": "Video not recording"}
+    lead = start_at - time.time()
+    if not (cfg.SYNCHRONIZED_START_MIN_DELAY <= lead <= cfg.SYNCHRONIZED_START_MAX_DELAY):
+        return {
+            "error": True,
+            "msg": f"The start time must be between {cfg.SYNCHRONIZED_START_MIN_DELAY} and {cfg.SYNCHRONIZED_START_MAX_DELAY} s"
+            f" after the current time of the Raspberry Pi ({lead:.3f} s)",
+        }
+
+    # the recording thread started by this request (the global thread can be replaced by another request)
+    response, recording = launch_video_recording(dict(request.values))
+    if recording is None:
+        return response
+
+    recording.first_frame_event.wait(start_at - time.time() + cfg.SYNCHRONIZED_START_FIRST_FRAME_TIMEOUT)
+    if recording.first_frame is None:
+        return {
+            "error": True,
+            "msg": "Video recording started but no frame received",
+            "start_at": start_at,
+            "signaled_at": recording.signaled_at,
+        }
+
+    delay = recording.first_frame - start_at
+    return dict(
+        response,
+        msg=f"Video recording started (first frame {delay * 1000:.1f} ms after the start time)",
+        start_at=start_at,
+        signaled_at=recording.signaled_at,
+        first_frame=recording.first_frame,
+        delay=round(delay, 6),
+    )
 
 
 @app.route(
@@ -605,8 +1131,9 @@ def stop_video():
     Stop the video recording
     """
 
-    subprocess.run(["sudo", "killall", "libcamera-vid"])
-    time.sleep(2)
+    if not registry.stop("video"):
+        camera_backend.kill("video")
+        time.sleep(2)
 
     if not recording_video_active():
         return {"msg": "video recording stopped"}
@@ -624,55 +1151,13 @@ def stop_video():
 @security_key_required
 def schedule_video_recording():
     """
-    schedule the video recording using crontab of user pi
-    see https://pypi.org/project/crontab/
-    """
-
-    crontab_event = request.values.get("crontab", "")
-    if not crontab_event:
-        return {"error": True, "msg": "Video recording NOT configured. Crontab event not found"}
+    schedule the video recording with the scheduler of the worker (see job_scheduler.py)
 
-    command_line = [
-        "killall libcamera-vid;libcamera-vid",
-    ]
-
-    for key in request.values:
-        if key in ["prefix", "annotate", "key", "crontab"]:
-            continue
-        if request.values[key] == "True":
-            command_line.extend([f"--{key}"])
-        elif request.values[key] != "False":
-            command_line.extend([f"--{key}", f"{request.values[key]}"])
-
-    prefix = (request.values["prefix"] + "_") if request.values.get("prefix", "") else ""
-
-    """
-    file_path = (
-        str(pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR) / pl.Path(f"{socket.gethostname()}_{prefix}"))
-        + "$(/usr/bin/date_crontab_helper).h264"
-    )
+    crontab: crontab expression of the runs (minute hour day_of_month month day_of_week)
+    or at: date and time of a single run (ISO format)
+    misfire_grace_time: maximum delay of a run missed during a stop of the worker (seconds, optional)
     """
-    file_path = (
-        f"{pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR) / pl.Path(f'{socket.gethostname()}_{prefix}')}"
-        f"$(bash {pl.Path(__file__).resolve().parent / 'date_crontab_helper'}).h264"
-    )
-
-    command_line.extend(["-o", file_path])
-
-    logging.info(" ".join(command_line))
-
-    comment = f'recording for {round(int(request.values["timeout"]) / 1000)} s'
-
-    cron = CronTab(user="pi")
-    job = cron.new(command=" ".join(command_line), comment=comment)
-    try:
-        job.setall(crontab_event)
-    except Exception:
-        return {"error": True, "msg": f"Video recording NOT scheduled. '{crontab_event}' is not valid."}
-
-    cron.write()
-
-    return {"error": False, "msg": "Video recording scheduled"}
+    return schedule_job("video")
 
 
 @app.route(
@@ -687,17 +1172,7 @@ def view_video_recording_schedule():
     """
     send all video recording schedule
     """
-    cron = CronTab(user="pi")
-    output = []
-    try:
-        for job in cron:
-            if "libcamera-vid" in job.command:
-                output.append([str(job.minutes), str(job.hours), str(job.dom), str(job.month), str(job.dow), job.comment])
-
-    except Exception:
-        return {"error": True, "msg": "Error during video recording view."}
-
-    return {"error": False, "msg": output}
+    return view_schedule("video")
 
 
 @app.route(
@@ -710,18 +1185,146 @@ def view_video_recording_schedule():
 @security_key_required
 def delete_video_recording_schedule():
     """
-    delete all video recording schedule
+    delete all video recording schedule (or the job with id)
+    """
+    return delete_schedule("video")
+
+
+JOB_NAMES = {"video": "Video recording", "time_lapse": "Time lapse"}
+
+
+def schedule_job(kind: str) -> dict:
+    """
+    add a job of the kind to the scheduler with the parameters of the request
+    """
+    crontab_event, at = request.values.get("crontab", ""), request.values.get("at", "")
+    if not crontab_event and not at:
+        return {"error": True, "msg": f"{JOB_NAMES[kind]} NOT configured. Crontab event not found"}
+
+    logging.info(f"{kind} scheduled: {crontab_event or at}")
+
+    if kind == "video":
+        comment = f'recording for {round(int(request.values["timeout"]) / 1000)} s'
+    elif request.values.get("timeout", "0") != "0" and request.values.get("timelapse", "0") != "0":
+        comment = f'time-lapse for {request.values["timeout"]} s (every {request.values["timelapse"]} s)'
+    else:
+        return {"error": True, "msg": "Time lapse NOT scheduled. The duration and the interval are required"}
+
+    try:
+        job = scheduler.add(
+            kind,
+            dict(request.values),
+            crontab=crontab_event,
+            at=at,
+            comment=comment,
+            misfire_grace_time=request.values.get("misfire_grace_time"),
+        )
+    except ValueError:
+        return {"error": True, "msg": f"{JOB_NAMES[kind]} NOT scheduled. '{crontab_event or at}' is not valid."}
+
+    return {
+        "error": False,
+        "msg": f"{JOB_NAMES[kind]} scheduled (next run: {job['next_run'].replace('T', ' ')})",
+        "id": job["id"],
+        "next_run": job["next_run"],
+    }
+
+
+def crontab_jobs(kind: str) -> list:
+    """
+    return the jobs of the kind scheduled in the crontab by the previous versions of the worker
+    """
+    if CronTab is None:
+        return []
+    try:
+        cron = CronTab(user="pi")
+        return [(cron, job) for job in cron if camera_backend.job_pattern(kind) in job.command]
+    except Exception:
+        return []
+
+
+def view_schedule(kind: str) -> dict:
+    """
+    send the jobs of the kind: rows (minutes, hours, days of month, months, days of week, comment) and details of the jobs
     """
-    cron = CronTab(user="pi")
+    output = []
+    for job in scheduler.list(kind):
+        if job["trigger"] == "cron":
+            row = job_scheduler.CRON_ALIASES.get(job["crontab"].lower(), job["crontab"]).split()
+        else:
+            date = datetime.datetime.fromisoformat(job["at"])
+            row = [str(date.minute), str(date.hour), str(date.day), str(date.month), "*"]
+        output.append(row + [f"{job['comment']} (next run: {job['next_run'].replace('T', ' ')})"])
+
+    for _, job in crontab_jobs(kind):
+        output.append([str(job.minutes), str(job.hours), str(job.dom), str(job.month), str(job.dow), f"{job.comment} (crontab)"])
+
+    return {"error": False, "msg": output, "jobs": scheduler.list(kind)}
+
+
+def delete_schedule(kind: str) -> dict:
+    """
+    delete the jobs of the kind (or the job with the id of the request)
+    """
+    if request.values.get("id", ""):
+        if not scheduler.remove(kind, request.values["id"]):
+            return {"error": True, "msg": f"Scheduled job not found: {request.values['id']}"}
+        return {"error": False, "msg": f"{JOB_NAMES[kind]} schedule {request.values['id']} deleted."}
+
+    scheduler.remove(kind)
     try:
-        for job in cron:
-            if "libcamera-vid" in job.command:
-                cron.remove(job)
-        cron.write()
+        jobs = crontab_jobs(kind)
+        for cron, job in jobs:
+            cron.remove(job)
+        if jobs:
+            jobs[0][0].write()
     except Exception:
-        return {"error": True, "msg": "Video recording schedule NOT deleted."}
+        return {"error": True, "msg": f"{JOB_NAMES[kind]} schedule NOT deleted."}
+
+    return {"error": False, "msg": f"{JOB_NAMES[kind]} schedule deleted."}
+
+
+def listing_filters(kind: str) -> dict:
+    """
+    return the filters of an archive listing from the request values
+
+    optional filters:
+        since: sequence cursor returned by a previous listing (only the changes are sent, deleted files in "deleted")
+        limit: maximum number of files (use the returned cursor to get the next page)
+        prefix: beginning of the file name
+        session: time lapse session (see /timelapse_sessions)
+        start, end: range of capture time (epoch)
+        kind: kind of file (video, picture)
 
-    return {"error": False, "msg": "Video recording schedule deleted."}
+    raise ValueError if a filter is not valid
+    """
+    return {
+        "kind": request.values.get("kind", kind),
+        "since": int(request.values["since"]) if request.values.get("since", "") else None,
+        "limit": int(request.values["limit"]) if request.values.get("limit", "") else None,
+        "prefix": (f"{request.values['session']}/" if request.values.get("session", "") else "") + request.values.get("prefix", ""),
+        "start": float(request.values["start"]) if request.values.get("start", "") else None,
+        "end": float(request.values["end"]) if request.values.get("end", "") else None,
+    }
+
+
+def archive_listing(directory: str, kind: str, list_key: str) -> dict:
+    """
+    return the list of (name, size) of the files of the archive directory from the media catalog
+    (see listing_filters for the optional filters)
+    """
+    try:
+        result = catalog.query(directory, **listing_filters(kind))
+    except ValueError:
+        return {"error": True, "msg": "Invalid listing filter"}
+
+    return {
+        list_key: result["files"],
+        "deleted": result["deleted"],
+        "cursor": result["cursor"],
+        "more": result["more"],
+        "catalog_id": result["catalog_id"],
+    }
 
 
 @app.route(
@@ -737,12 +1340,7 @@ def video_list():
     Return the list of recorded video
     """
 
-    return {
-        "video_list": [
-            (x.name, x.stat().st_size)
-            for x in (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR)).glob("*.h264")
-        ]
-    }
+    return archive_listing(cfg.VIDEO_ARCHIVE_DIR, "video", "video_list")
 
 
 @app.route(
@@ -758,12 +1356,28 @@ def timelapse_pictures_list():
     Return the list of recorded pictures
     """
 
-    return {
-        "pictures_list": [
-            (x.name, x.stat().st_size)
-            for x in (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR)).glob("*.jpg")
-        ]
-    }
+    return archive_listing(cfg.TIME_LAPSE_ARCHIVE_DIR, "picture", "pictures_list")
+
+
+@app.route(
+    "/timelapse_sessions",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def timelapse_sessions():
+    """
+    Return the time lapse sessions with their number of pictures and size
+    (the pictures of a session are listed, downloaded and deleted with the session parameter)
+    """
+    sessions = time_lapse_sessions.list_sessions(
+        pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR)
+    )
+    for session in sessions:
+        session["pictures"], session["size"] = catalog.summary(cfg.TIME_LAPSE_ARCHIVE_DIR, f"{session['session']}/")
+    return {"error": False, "sessions": sessions}
 
 
 @app.route(
@@ -778,12 +1392,99 @@ def live_pictures_list():
     """
     Return the list of live pictures
     """
-    return {
-        "pictures_list": [
-            (x.name, x.stat().st_size)
-            for x in (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.LIVE_PICTURES_ARCHIVE_DIR)).glob("*.jpg")
-        ]
-    }
+    return archive_listing(cfg.LIVE_PICTURES_ARCHIVE_DIR, "picture", "pictures_list")
+
+
+@app.route(
+    "/archive_bundle",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def archive_bundle():
+    """
+    stream an uncompressed tar of files of an archive directory (the first member is a manifest, see tar_stream)
+
+    directory: name of the archive directory
+    files: JSON list of the file names
+    or the filters of the listings (see listing_filters). The cursor of the listing is added to the manifest
+    """
+    directory = request.values.get("directory", "")
+    if directory not in catalog.directories:
+        return {"error": True, "msg": f"Archive directory not found: {directory}"}
+
+    extra = {}
+    try:
+        if request.values.get("files", ""):
+            names = json.loads(request.values["files"])
+            if not isinstance(names, list):
+                raise ValueError
+        else:
+            result = catalog.query(directory, **listing_filters(""))
+            names = [name for name, _ in result["files"]]
+            extra = {key: result[key] for key in ("cursor", "more", "catalog_id")}
+    except ValueError:
+        return {"error": True, "msg": "Invalid bundle selection"}
+
+    bundle = tar_stream.Tar_bundle(
+        pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(directory),
+        catalog.entries(directory, [str(x) for x in names]),
+        extra,
+    )
+    return Response(
+        bundle.generate(),
+        mimetype="application/x-tar",
+        headers={"Content-Length": str(bundle.content_length()), "Content-Disposition": f"attachment; filename={directory}.tar"},
+    )
+
+
+@app.route(
+    "/acknowledge",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def acknowledge():
+    """
+    mark the files downloaded by the coordinator as safe if the checksums computed by the coordinator are the same.
+    Only the safe files are deleted (deletion routes and retention)
+
+    directory: name of the archive directory
+    files: JSON list of (name, checksum, algorithm) of the downloaded files
+    """
+    directory = request.values.get("directory", "")
+    if directory not in catalog.directories:
+        return {"error": True, "msg": f"Archive directory not found: {directory}"}
+    try:
+        files = [(str(name), str(digest), str(algorithm)) for name, digest, algorithm in json.loads(request.values.get("files", "[]"))]
+    except (ValueError, TypeError):
+        return {"error": True, "msg": "Invalid list of files"}
+
+    safe, mismatch = [], []
+    for name, digest, algorithm in files:
+        entry = catalog.get(directory, name)
+        if entry is None or algorithm not in checksum.ALGORITHMS:
+            mismatch.append(name)
+            continue
+        if entry["algorithm"] != algorithm or not entry["checksum"]:
+            # no stored checksum for this algorithm (pictures, scheduled recordings): the file is read
+            try:
+                entry["checksum"] = checksum.file_checksum(
+                    pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(directory) / pl.Path(name), algorithm
+                )
+            except (OSError, ValueError):
+                mismatch.append(name)
+                continue
+        (safe if entry["checksum"] == digest else mismatch).append(name)
+
+    catalog.mark_safe(directory, safe)
+    if mismatch:
+        logging.warning(f"Acknowledgement: {len(mismatch)} file(s) of {directory} with a different checksum")
+    return {"error": False, "msg": f"{len(safe)} file(s) marked as safe", "safe": safe, "mismatch": mismatch}
 
 
 @app.route(
@@ -795,8 +1496,8 @@ def live_pictures_list():
 )
 @security_key_required
 def get_video(file_name):
-    return send_from_directory(
-        str(pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR)), file_name, as_attachment=True
+    return send_archive_file(
+        pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR), file_name, as_attachment=True
     )
 
 
@@ -813,8 +1514,9 @@ def stop_time_lapse():
     Stop the time lapse
     """
 
-    subprocess.run(["sudo", "killall", "libcamera-still"])
-    time.sleep(5)
+    if not registry.stop("time_lapse"):
+        camera_backend.kill("time_lapse")
+        time.sleep(5)
 
     if not time_lapse_active():
         return {"msg": "Time lapse stopped"}
@@ -865,6 +1567,103 @@ def sync_time(date, hour):
         return {"error": False, "msg": "Time successfully synchronized"}
 
 
+@app.route(
+    "/time_exchange",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def time_exchange():
+    """
+    return the reception time (t2) and the sending time (t3) of the request (see clock_sync.py)
+    """
+    t2 = time.time()
+    response = {"error": False, "t1": request.values.get("t1", None, type=float), "t2": t2}
+    response["t3"] = time.time()
+    return response
+
+
+@app.route(
+    "/clock_offset",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def set_clock_offset():
+    """
+    record the clock offset measured by the coordinator (offset, rtt and jitter in seconds)
+    and correct the clock if correct is True (slew or step, see clock_sync.py)
+    NTP is disabled after a step (see /enable_ntp)
+    """
+    global clock_offset, ntp_disabled
+
+    try:
+        offset, rtt = float(request.values["offset"]), float(request.values["rtt"])
+        samples = int(request.values.get("samples", 1))
+        jitter = float(request.values.get("jitter", 0))
+    except (KeyError, ValueError):
+        return {"error": True, "msg": "Clock offset not valid"}
+
+    measurement = {
+        "offset": offset,
+        "rtt": rtt,
+        "samples": samples,
+        "jitter": jitter,
+        "measured_at": datetime.datetime.now().isoformat(),
+        "correction": None,
+    }
+    msg = f"Clock offset: {offset * 1000:+.3f} ms (RTT {rtt * 1000:.3f} ms)"
+
+    if request.values.get("correct", "False") == "True":
+        method = "slew" if abs(offset) <= cfg.CLOCK_MAX_SLEW else "step"
+        # a step during a job would break the timing of the recording
+        if method == "step" and registry.summary():
+            clock_offset = dict(measurement, ntp_disabled=ntp_disabled)
+            return {"error": True, "msg": f"{msg}. Clock not stepped: a job is active", "clock_offset": clock_offset}
+        completed = subprocess.run(clock_sync.correction_command(sys.executable, offset, cfg.CLOCK_MAX_SLEW))
+        if completed.returncode:
+            clock_offset = dict(measurement, ntp_disabled=ntp_disabled)
+            return {"error": True, "msg": f"{msg}. Clock not corrected", "clock_offset": clock_offset}
+        measurement["correction"] = {"method": method, "delta": -offset}
+        msg += f". Clock {'slewed' if method == 'slew' else 'stepped'} by {-offset * 1000:+.3f} ms"
+        # NTP would step the clock back after a step (a slew is kept with NTP). See /enable_ntp
+        if method == "step" and not ntp_disabled:
+            ntp_disabled = subprocess.run(["sudo", "timedatectl", "set-ntp", "false"]).returncode == 0
+            if ntp_disabled:
+                msg += " (NTP disabled)"
+
+    clock_offset = dict(measurement, ntp_disabled=ntp_disabled)
+    logging.info(msg)
+    return {"error": False, "msg": msg, "clock_offset": clock_offset}
+
+
+@app.route(
+    "/enable_ntp",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def enable_ntp():
+    """
+    enable NTP again (disabled after a step of the clock by /clock_offset)
+    """
+    global clock_offset, ntp_disabled
+
+    if subprocess.run(["sudo", "timedatectl", "set-ntp", "true"]).returncode:
+        return {"error": True, "msg": "NTP not enabled"}
+    ntp_disabled = False
+    if clock_offset is not None:
+        clock_offset = dict(clock_offset, ntp_disabled=False)
+    logging.info("NTP enabled")
+    return {"error": False, "msg": "NTP enabled"}
+
+
 @app.route(
     "/take_picture",
     methods=(
@@ -891,29 +1690,16 @@ def take_picture():
 
     # delete previous picture
     try:
-        completed = subprocess.run(["sudo", "rm", "-f", pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path("live.jpg")])
+        completed = subprocess.run(
+            (["sudo"] if camera_backend.sudo else [])
+            + ["rm", "-f", pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path("live.jpg")]
+        )
     except Exception:
         pass
 
-    command_line = [
-        "libcamera-still",
-        # "--timeout", "5",
-        "--nopreview",
-        "-q",
-        "90",
-    ]
-
     for key in request.values:
         logging.info(f"{key}: {request.values[key]}")
 
-    for key in request.values:
-        if key in ("timelapse", "timeout", "annotate", "key", "file_name"):
-            continue
-        if request.values[key] == "True":
-            command_line.extend([f"--{key}"])
-        elif request.values[key] != "False":
-            command_line.extend([f"--{key}", f"{request.values[key]}"])
-
     """
     if "annotate" in request.values and request.values["annotate"] == "True":
         command_line.extend(["-a", "4", "-a", f'"{socket.gethostname()} %Y-%m-%d %X"'])
@@ -926,60 +1712,135 @@ def take_picture():
         and "timelapse" in request.values
         and request.values["timelapse"] != "0"
     ):
-        command_line.extend(["--timeout", str(int(request.values["timeout"]) * 1000)])
-        command_line.extend(["--timelapse", str(int(request.values["timelapse"]) * 1000)])
         # command_line.extend(["--timestamp"])
-
-        command_line.extend(
-            [
-                "-o",
-                str(
-                    pl.Path(__file__).resolve().parent
-                    / pl.Path(cfg.STATIC_DIR)
-                    / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR)
-                    / pl.Path(f"{socket.gethostname()}_%04d").with_suffix(".jpg")
-                ),
-            ]
-        )
-        logging.info(f"command: {' '.join(command_line)}")
-        try:
-            subprocess.Popen(command_line)
-        except Exception:
-            logging.warning("Error running time lapse (wrong command line option)")
-            return {"error": 1, "msg": "Error running time lapse (wrong command line option)"}
-        return {"error": False, "msg": "Time lapse running"}
+        return start_time_lapse(dict(request.values))
 
     else:
         # take one picture
         if "file_name" in request.values:
-            command_line.extend(
-                [
-                    "-o",
-                    str(
-                        pl.Path(__file__).resolve().parent
-                        / pl.Path(cfg.STATIC_DIR)
-                        / pl.Path("live_pictures")
-                        / pl.Path(request.values["file_name"])
-                    ),
-                ]
+            output_path = (
+                pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path("live_pictures") / pl.Path(request.values["file_name"])
             )
         else:
-            command_line.extend(["-o", str(pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path("live.jpg"))])
+            output_path = pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path("live.jpg")
+
+        # the warm camera daemon takes the picture on the next frame
+        parameters = {
+            key: request.values[key] for key in request.values if key not in ("timelapse", "timeout", "annotate", "key", "file_name")
+        }
+        if still_daemon is not None and still_daemon.supported(parameters):
+            reply = still_daemon.capture(output_path, parameters)
+            if reply is not None:
+                logging.info(f"Picture taken by the still daemon in {reply['latency']} s")
+                return {"error": False, "msg": "Picture taken successfully", "capture": "daemon", "latency": reply["latency"]}
+            logging.info(f"Still daemon not available: {camera_backend.name} is used")
+
+        command_line = camera_backend.still_command(request.values, str(output_path))
 
         logging.info("command:" + (" ".join(command_line)))
 
+        release_camera()
+        start = time.monotonic()
         try:
             completed = subprocess.run(command_line)
         except Exception:
             logging.warning("Error taking picture (wrong command line option)")
             return {"error": 1, "msg": "Error taking picture (wrong command line option)"}
+        finally:
+            warm_up_camera()
 
         if not completed.returncode:
-            return {"error": False, "msg": "Picture taken successfully"}
+            latency = round(time.monotonic() - start, 4)
+            logging.info(f"Picture taken by {camera_backend.name} in {latency} s")
+            return {"error": False, "msg": "Picture taken successfully", "capture": camera_backend.name, "latency": latency}
         else:
             return {"error": completed.returncode, "msg": "Picture not taken"}
 
 
+def snapshot_size(parameters: dict) -> tuple:
+    """
+    return the size of the snapshot: the requested size reduced to max_width x max_height (aspect ratio preserved)
+    """
+    width = int(parameters.get("width", cfg.DEFAULT_PICTURE_WIDTH))
+    height = int(parameters.get("height", cfg.DEFAULT_PICTURE_HEIGHT))
+    ratio = min(int(parameters.get("max_width", width)) / width, int(parameters.get("max_height", height)) / height, 1)
+    # even size for the encoder
+    return max(int(width * ratio) // 2 * 2, 2), max(int(height * ratio) // 2 * 2, 2)
+
+
+@app.route(
+    "/snapshot",
+    methods=(
+        "GET",
+        "POST",
+    ),
+)
+@security_key_required
+def snapshot():
+    """
+    take a picture and send it in the response (image/jpeg): nothing is written on the SD card
+
+    max_width, max_height: maximum size of the picture (the camera scales the picture)
+    archive: "True" to keep a copy of the picture in the live pictures archive (file_name)
+    """
+
+    if video_streaming_active() or recording_video_active() or time_lapse_active():
+        return {"error": True, "msg": "The picture cannot be taken because the camera is in use"}
+
+    parameters = {
+        key: request.values[key]
+        for key in request.values
+        if key not in ("timelapse", "timeout", "annotate", "key", "file_name", "archive", "max_width", "max_height")
+    }
+    try:
+        width, height = snapshot_size(request.values)
+    except (ValueError, ZeroDivisionError):
+        return {"error": True, "msg": "Invalid picture size"}
+    parameters.update({"width": str(width), "height": str(height)})
+
+    data, capture, latency = b"", camera_backend.name, 0
+    # the warm camera daemon takes the picture on the next frame
+    if still_daemon is not None and still_daemon.supported(parameters):
+        reply = still_daemon.capture(None, parameters)
+        if reply is not None:
+            data, capture, latency = reply["data"], "daemon", reply["latency"]
+
+    if not data:
+        command_line = camera_backend.still_command(parameters, "-")
+        logging.info("command:" + (" ".join(command_line)))
+        release_camera()
+        start = time.monotonic()
+        try:
+            completed = subprocess.run(command_line, stdout=subprocess.PIPE)
+        except Exception:
+            logging.warning("Error taking picture (wrong command line option)")
+            return {"error": True, "msg": "Error taking picture (wrong command line option)"}
+        finally:
+            warm_up_camera()
+        if completed.returncode or not completed.stdout.startswith(b"\xff\xd8"):
+            return {"error": completed.returncode or True, "msg": "Picture not taken"}
+        data, latency = completed.stdout, round(time.monotonic() - start, 4)
+
+    logging.info(f"Snapshot {width}x{height} ({len(data)} bytes) taken by {capture} in {latency} s")
+
+    if request.values.get("archive", "False") == "True":
+        file_name = pl.Path(request.values.get("file_name", f"{int(time.time())}.jpg")).name
+        file_path = pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.LIVE_PICTURES_ARCHIVE_DIR) / file_name
+        # the picture is renamed when complete (the media catalog is notified by the rename)
+        part_path = file_path.with_name(f"{file_name}.part")
+        try:
+            part_path.write_bytes(data)
+            os.replace(part_path, file_path)
+        except Exception:
+            logging.warning(f"Snapshot not archived in {file_path}")
+
+    return Response(
+        data,
+        mimetype="image/jpeg",
+        headers={"Cache-Control": "no-store", "X-Capture": capture, "X-Capture-Latency": str(latency)},
+    )
+
+
 @app.route("/command/<command_to_run>")
 def command(command_to_run):
     """
@@ -1055,6 +1916,16 @@ def live_pictures_archive_dir():
         return {"error": True}
 
 
+def delete_archive_file(file_path: pl.Path):
+    """
+    delete the file of the archive with its checksum files (the catalog is updated immediately)
+    """
+    file_path.unlink(missing_ok=True)
+    for sidecar_path in checksum.sidecar_paths(file_path):
+        sidecar_path.unlink(missing_ok=True)
+    catalog.remove(file_path)
+
+
 @app.route(
     "/delete_video",
     methods=(
@@ -1066,21 +1937,28 @@ def live_pictures_archive_dir():
 def delete_video():
     """
     Delete the recorded video from the list in the video archive
+    only the safe video (download acknowledged, see /acknowledge) are deleted
     """
 
     if not request.values.get("video list", []):
         return {"error": True, "msg": "No video to delete"}
 
+    safe_video = set(catalog.safe_files(cfg.VIDEO_ARCHIVE_DIR))
+    not_deleted = []
     for video_file_name, _ in json.loads(request.values.get("video list", "[]")):
-        (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR) / pl.Path(video_file_name)).unlink(
-            missing_ok=True
+        if video_file_name not in safe_video:
+            not_deleted.append(video_file_name)
+            continue
+        delete_archive_file(
+            pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR) / pl.Path(video_file_name)
         )
-        (
-            pl.Path(__file__).resolve().parent
-            / pl.Path(cfg.STATIC_DIR)
-            / pl.Path(cfg.VIDEO_ARCHIVE_DIR)
-            / pl.Path(video_file_name).with_suffix(".md5sum")
-        ).unlink(missing_ok=True)
+    video_segments.remove_manifests(pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.VIDEO_ARCHIVE_DIR))
+    if not_deleted:
+        return {
+            "error": False,
+            "msg": f"{len(not_deleted)} video not deleted (download not acknowledged)",
+            "not_deleted": not_deleted,
+        }
     return {"error": False, "msg": "All video deleted"}
 
 
@@ -1094,13 +1972,16 @@ def delete_video():
 @security_key_required
 def delete_live_pictures():
     """
-    Delete the live pictures
+    Delete the live pictures (only the safe pictures: download acknowledged, see /acknowledge)
     """
 
     logging.debug("Delete all the live pictures")
 
-    for file_path in (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.LIVE_PICTURES_ARCHIVE_DIR)).glob("*"):
-        file_path.unlink(missing_ok=True)
+    for name in catalog.safe_files(cfg.LIVE_PICTURES_ARCHIVE_DIR):
+        delete_archive_file(pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.LIVE_PICTURES_ARCHIVE_DIR) / name)
+    remaining, _ = catalog.summary(cfg.LIVE_PICTURES_ARCHIVE_DIR)
+    if remaining:
+        return {"error": False, "msg": f"{remaining} live picture(s) not deleted (download not acknowledged)"}
     return {"error": False, "msg": "All live pictures deleted"}
 
 
@@ -1114,13 +1995,42 @@ def delete_live_pictures():
 @security_key_required
 def delete_timelapse_pictures():
     """
-    Delete the time lapse pictures
+    Delete the time lapse pictures (all sessions or the session of the session parameter)
+    the session of the running time lapse is not deleted
     """
 
-    logging.debug("Delete all the time lapse pictures")
-
-    for file_path in (pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR)).glob("*"):
-        file_path.unlink(missing_ok=True)
+    archive_dir = pl.Path(__file__).resolve().parent / pl.Path(cfg.STATIC_DIR) / pl.Path(cfg.TIME_LAPSE_ARCHIVE_DIR)
+    running_session = None
+    if time_lapse_active():
+        sessions = time_lapse_sessions.list_sessions(archive_dir)
+        running_session = sessions[-1]["session"] if sessions and not sessions[-1].get("complete", True) else None
+
+    if request.values.get("session", ""):
+        session_dir = time_lapse_sessions.session_dir(archive_dir, request.values["session"])
+        if session_dir is None:
+            return {"error": True, "msg": f"Time lapse session not found: {request.values['session']}"}
+        if session_dir.name == running_session:
+            return {"error": True, "msg": "The session of the running time lapse cannot be deleted"}
+        logging.debug(f"Delete the time lapse session {session_dir.name}")
+        prefix = f"{session_dir.name}/"
+    else:
+        logging.debug("Delete all the time lapse pictures")
+        prefix = ""
+
+    # only the safe pictures (download acknowledged, see /acknowledge) are deleted
+    for name in catalog.safe_files(cfg.TIME_LAPSE_ARCHIVE_DIR, prefix):
+        if running_session is None or not name.startswith(f"{running_session}/"):
+            delete_archive_file(archive_dir / name)
+
+    # directories of the sessions without remaining picture
+    for session in time_lapse_sessions.list_sessions(archive_dir):
+        if session["session"] != running_session and (not prefix or prefix == f"{session['session']}/"):
+            if not catalog.summary(cfg.TIME_LAPSE_ARCHIVE_DIR, f"{session['session']}/")[0]:
+                shutil.rmtree(archive_dir / session["session"], ignore_errors=True)
+
+    remaining, _ = catalog.summary(cfg.TIME_LAPSE_ARCHIVE_DIR, prefix)
+    if remaining:
+        return {"error": False, "msg": f"{remaining} time lapse picture(s) not deleted (download not acknowledged or running time lapse)"}
     return {"error": False, "msg": "All time lapse pictures deleted"}
 
 
@@ -1187,12 +2097,25 @@ def shutdown():
         return {"error": completed.returncode, "msg": "shutdown error"}
 
 
+def serve(server: str = cfg.SERVER, port: int = cfg.PORT):
+    """
+    serve the worker (see wsgi_server.py)
+    """
+    wsgi_server.run(
+        app,
+        "0.0.0.0",
+        port,
+        server=server,
+        threads=cfg.SERVER_THREADS,
+        keepalive=cfg.SERVER_KEEPALIVE,
+        debug=cfg.DEBUG,
+        ssl=bool(security_key_sha256),
+        on_start=start_background_tasks,
+    )
+
+
 if __name__ == "__main__":
     logging.info("worker started")
-    app.debug = True
-    if security_key_sha256:
-        app.run(host="0.0.0.0", port=cfg.PORT, ssl_context="adhoc")
-    else:
-        app.run(host="0.0.0.0", port=cfg.PORT)
+    serve()
 
     # see https://blog.miguelgrinberg.com/post/running-your-flask-application-over-https for HTTPS
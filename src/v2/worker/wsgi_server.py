@@ -0,0 +1,108 @@
+"""
+Raspberry Pi worker
+
+serving of the Flask application
+
+"gunicorn": production server (pip install gunicorn). Threaded workers (gthread) in a single process,
+            HTTP keep-alive and sendfile for the archive files (wsgi.file_wrapper, not available with HTTPS)
+"werkzeug": threaded Werkzeug server (used if gunicorn is not installed)
+
+With DEBUG = True (config.py) the Werkzeug development server is used with the debugger and the reloader.
+
+A single process is used because the camera jobs and the caches are kept in memory:
+the number of concurrent requests is set by SERVER_THREADS.
+"""
+
+import os
+import pathlib as pl
+import logging
+
+from werkzeug.serving import make_ssl_devcert
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+SERVERS = ("gunicorn", "werkzeug")
+
+
+def ssl_certificate(directory) -> tuple:
+    """
+    return the paths of the self-signed certificate and key (created at the first use)
+    """
+    base_path = pl.Path(directory) / "worker_ssl"
+    if not base_path.with_suffix(".crt").is_file() or not base_path.with_suffix(".key").is_file():
+        make_ssl_devcert(str(base_path), host="*")
+    return str(base_path.with_suffix(".crt")), str(base_path.with_suffix(".key"))
+
+
+def run_gunicorn(app, host: str, port: int, threads: int, keepalive: int, certificate: tuple = None, on_start=None):
+    """
+    serve the application with gunicorn (gthread worker)
+    on_start: function called in the serving process before the first request (the threads are not inherited by fork)
+    """
+
+    class Gunicorn_application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", threads)
+            self.cfg.set("keepalive", keepalive)
+            # sendfile is used by default (the "sendfile" setting only disables it)
+            # the recordings and the tar streams can be long
+            self.cfg.set("timeout", 0)
+            self.cfg.set("graceful_timeout", 10)
+            if certificate:
+                self.cfg.set("certfile", certificate[0])
+                self.cfg.set("keyfile", certificate[1])
+            if on_start is not None:
+                self.cfg.set("post_worker_init", lambda worker: on_start())
+
+        def load(self):
+            return app
+
+    Gunicorn_application().run()
+
+
+def run(
+    app,
+    host: str,
+    port: int,
+    server: str = "gunicorn",
+    threads: int = 8,
+    keepalive: int = 5,
+    debug: bool = False,
+    ssl: bool = False,
+    on_start=None,
+):
+    """
+    serve the application
+    """
+    if server not in SERVERS:
+        logging.warning(f"Unknown server {server}: werkzeug is used")
+        server = "werkzeug"
+
+    if server == "gunicorn" and BaseApplication is None and not debug:
+        logging.warning("gunicorn not installed: werkzeug is used")
+        server = "werkzeug"
+
+    logging.info(f"Serving with {'werkzeug (debug)' if debug else server} on port {port}")
+
+    if server == "gunicorn" and not debug:
+        run_gunicorn(
+            app,
+            host,
+            port,
+            threads,
+            keepalive,
+            certificate=ssl_certificate(pl.Path(app.root_path)) if ssl else None,
+            on_start=on_start,
+        )
+        return
+
+    # with the reloader (debug), only the child process serves the requests (the parent restarts it on changes)
+    if on_start is not None and (not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        on_start()
+    app.run(host=host, port=port, debug=debug, threaded=True, ssl_context="adhoc" if ssl else None)